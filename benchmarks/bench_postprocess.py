@@ -0,0 +1,158 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+# times the postprocessing stages on synthetic captures. from the repo root:
+#   PYTHONPATH=src python benchmarks/bench_postprocess.py --output bench.json
+#   PYTHONPATH=src python benchmarks/bench_postprocess.py --baseline bench.json
+# exits with 1 if a stage got slower than the baseline by more than the
+# threshold
+
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import click
+from postprocessor import plot, postprocess, synthetic, tda
+from postprocessor.stats import get_stats
+from postprocessor.store import read_run
+
+events_dir = os.path.join(os.path.dirname(__file__), "..", "src", "events")
+# events file and report of each case: the plot needs the AmpereOne metrics,
+# the TDA charts the TDA ones
+cases = {
+    "ampereone": ("events_ampereone_ac04.txt", "plot"),
+    "tda": ("events_tda_ac04.txt", "tda"),
+}
+interval_counts = {"1k": 1000, "100k": 100_000, "10M": 10_000_000}
+cores = 80
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def _streams(inputs):
+    return [postprocess.process_stats(f, False) for f in inputs]
+
+
+def _consume(rows):
+    for _ in rows:
+        pass
+
+
+# seconds of each stage for one case and size. the stages stream into each
+# other, so they are timed cumulatively (parse, parse + join, ...) without
+# holding the samples in memory, and each stage is the difference
+def run_case(workdir, event_file, report, intervals):
+    timings = {}
+    event_file = os.path.join(events_dir, event_file)
+    timings["generate"], inputs = _timed(
+        synthetic.generate, event_file, workdir, cores, 1.0, intervals
+    )
+    postprocess.metricfile = event_file
+    postprocess.constdict["const_cpus"] = cores
+    postprocess.constdict["const_wall_clock_time"] = float(intervals)
+
+    parse, _ = _timed(lambda: [_consume(s) for s in _streams(inputs)])
+    join, _ = _timed(lambda: _consume(postprocess.join_files(_streams(inputs))))
+    output = os.path.join(workdir, "metrics.csv")
+    metrics, (averages, stats) = _timed(
+        lambda: postprocess.loadmetrics(
+            postprocess.join_files(_streams(inputs)), output, cores, False
+        )
+    )
+    timings["process_stats"] = parse
+    timings["join_files"] = max(join - parse, 0.0)
+    timings["loadmetrics"] = max(metrics - join, 0.0)
+    timings["get_averages"], _ = _timed(postprocess.get_averages, averages, workdir)
+    timings["get_stats"], _ = _timed(get_stats, stats, workdir)
+
+    if report == "plot":
+        timings["plot"], _ = _timed(
+            lambda: plot.generate_graph(
+                workdir, workdir, output, read_run(workdir, plot.plot_columns), "bench"
+            )
+        )
+    else:
+        for chart in ("sunburst", "icicle"):
+            timings[f"tda_{chart}"], _ = _timed(
+                tda.write_html, workdir, "metrics.csv", f"{chart}.html", chart
+            )
+    return timings
+
+
+# stages slower than the baseline by more than threshold, as (name, baseline,
+# now). stages under min_seconds in both are too noisy to compare
+def regressions(results, baseline, threshold, min_seconds=0.05):
+    slower = []
+    for name, seconds in results.items():
+        before = baseline.get(name)
+        if before is None or max(before, seconds) < min_seconds:
+            continue
+        if seconds > before * (1 + threshold):
+            slower.append((name, before, seconds))
+    return slower
+
+
+@click.command()
+@click.option(
+    "--sizes",
+    default="1k,100k",
+    show_default=True,
+    help="intervals per capture: " + ", ".join(interval_counts),
+)
+@click.option(
+    "--case",
+    "names",
+    multiple=True,
+    type=click.Choice(list(cases)),
+    help="cases to run, default: all",
+)
+@click.option("--output", type=click.Path(), help="write the results as json")
+@click.option("--baseline", type=click.Path(exists=True), help="results to compare")
+@click.option(
+    "--threshold",
+    type=float,
+    default=0.2,
+    show_default=True,
+    help="slowdown over the baseline reported as regression",
+)
+@click.option("--keep", type=click.Path(), help="keep the captures in this directory")
+def main(sizes, names, output, baseline, threshold, keep):
+    # divide by zero errors on <not counted> samples would flood the timings
+    logging.getLogger("app").setLevel(logging.CRITICAL)
+    results = {}
+    for size in sizes.split(","):
+        if size not in interval_counts:
+            raise click.BadParameter(f"unknown size {size}", param_hint="--sizes")
+        for name in names or cases:
+            event_file, report = cases[name]
+            with tempfile.TemporaryDirectory() as tmp:
+                workdir = os.path.join(keep or tmp, f"{name}-{size}")
+                timings = run_case(workdir, event_file, report, interval_counts[size])
+            for stage, seconds in timings.items():
+                results[f"{name}/{size}/{stage}"] = seconds
+                print(f"{name:>10} {size:>5} {stage:<14} {seconds:10.3f}s", flush=True)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(
+                {"python": platform.python_version(), "results": results}, f, indent=2
+            )
+    if baseline:
+        with open(baseline) as f:
+            slower = regressions(results, json.load(f)["results"], threshold)
+        for stage, before, now in slower:
+            print(f"regression: {stage} {before:.3f}s -> {now:.3f}s", flush=True)
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@
 # SPDX-License-Identifier: BSD-3-Clause
 
 import click
+from collector import timing
 from collector.profiler import Profiler
 from collector.logger_setup import setup_logger
 
@@ -10,29 +11,68 @@ from collector.logger_setup import setup_logger
 @click.command()
 @click.option("-n", "--duration", type=int, default=100, help="Sample duration (>10s)")
 @click.option(
-    "-i", "--interval", type=int, default=1, help="sampling interval/frequency (s)"
+    "-i",
+    "--interval",
+    type=float,
+    default=1,
+    help="sampling interval/frequency (s), down to 0.01 (10ms)",
 )
 @click.option("-j", "--job", default="", help="workload command to run")
 @click.option("-c", "--cores", default="", help="CPU core list")
 @click.option("-s", "--persocket", is_flag=True, help="Enable per-socket mode")
+@click.option(
+    "-A", "--percore", is_flag=True, help="Collect the core counters of each core"
+)
+@click.option(
+    "-b",
+    "--backend",
+    type=click.Choice(["perf", "direct"]),
+    default="perf",
+    show_default=True,
+    help="Collect the core counters with perf stat, or with perf_event_open directly",
+)
+@click.option(
+    "-z",
+    "--compress",
+    type=click.Choice(["gzip", "zstd"]),
+    help="Write perf's output compressed, in chunks (zstd needs zstandard)",
+)
 @click.option("-p", "--plot", is_flag=True, help="Enable plotting")
 @click.option("-o", "--output", default="data", help="Output directory")
 @click.option("-e", "--eventfile", default="", help="Eventlist")
 @click.option("-t", "--tda", is_flag=True, help="Enable TopDown Accounting")
 @click.option("-d", "--debug", is_flag=True, help="Debug mode")
 @click.option("-l", "--delay", type=int, default=0, help="Delay PMU collection (s)")
+@click.option(
+    "-L", "--live", is_flag=True, help="Print metrics of each interval while collecting"
+)
+@click.option(
+    "--profile", is_flag=True, help="Write the time of each stage to timings.json"
+)
+@click.option(
+    "--profile-dump",
+    multiple=True,
+    type=click.Choice(timing.dump_kinds),
+    help="Also dump snapshots of the heavy stages, implies --profile",
+)
 def main(
     duration,
     interval,
     job,
     cores,
     persocket,
+    percore,
+    backend,
+    compress,
     plot,
     output,
     eventfile,
     tda,
     debug,
     delay,
+    live,
+    profile,
+    profile_dump,
 ):
     if debug:
         log_level = "DEBUG"
@@ -45,12 +85,18 @@ def main(
         job=job,
         cores=cores,
         persocket=persocket,
+        percore=percore,
+        backend=backend,
+        compress=compress,
         plot=plot,
         output=output,
         event_file=eventfile,
         tda=tda,
         delay=delay,
         debug=debug,
+        live=live,
+        profile=profile,
+        profile_dump=profile_dump,
     )
     profiler.run()
 
@@ -6,6 +6,33 @@ import subprocess
 import logging
 
 logger = logging.getLogger("app")
+topology_file = "/sys/devices/system/cpu/cpu{}/topology/physical_package_id"
+
+
+# the cpu numbers of a cpu list like 0-3,8
+def cpu_list(cores):
+    cpus = []
+    for part in cores.split(","):
+        if "-" in part:
+            start, end = map(int, part.split("-"))
+            cpus.extend(range(start, end + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+# the socket of each of the cpus, from this machine's topology. None if it
+# can't be read
+def cpu_sockets(cpus):
+    try:
+        sockets = []
+        for cpu in cpus:
+            with open(topology_file.format(cpu)) as f:
+                sockets.append(int(f.read()))
+        return sockets
+    except (OSError, ValueError) as e:
+        logger.debug("cpu topology: %s", e)
+        return None
 
 
 class CPUDetector:
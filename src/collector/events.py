@@ -7,6 +7,8 @@ from pathlib import Path
 import subprocess
 import re
 import sys
+from collector import timing
+from postprocessor.eventfile import event_groups, load_event_file
 
 logger = logging.getLogger("app")
 src_path = Path(__file__).resolve().parents[1]
@@ -16,71 +18,46 @@ class EventParser:
     @staticmethod
     def get_events(event_file, cpu_info):
         try:
-            perf_list = subprocess.check_output(["perf", "list"], text=True)
+            with timing.stage("perf_list"):
+                perf_list = subprocess.check_output(["perf", "list"], text=True)
         except subprocess.CalledProcessError as e:
             raise RuntimeError(f"Failed to execute perf list: {e}")
         support_cmn = 1 if "arm_cmn" in perf_list else 0
         if support_cmn:
             arm_cmn_0, arm_cmn_1 = EventParser.__get_arm_cmn_names(perf_list)
-        events_core = ""
-        events_cmn = ""
-        events_type = 99
-        group_s = 0
-
-        with open(event_file, "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith("#"):
-                    continue
-                if line == "events_core":
-                    events_type = 0
-                    continue
-                if line == "events_cmn":
-                    events_type = 1
-                    continue
-                if line == ";":
-                    break
-
-                if line == "{":
-                    group_s = 1
-                    continue
-                if line == "}":
-                    if events_type == 0:
-                        events_core = events_core.rstrip(",") + "}',"
-                    elif events_type == 1:
-                        events_cmn = events_cmn.rstrip(",") + "}',"
-                    continue
-                if line.startswith("ARM_CMN"):
+        core_groups = []
+        cmn_groups = []
+        for group in event_groups(load_event_file(event_file).events):
+            names = []
+            for event in group:
+                if event.pmu == "cmn":
                     if not support_cmn:
                         raise RuntimeError(
                             f"Error: arm_cmn PMU driver isn't available. {event_file} contains CMN events. Please Update the kernel or use events.txt instead"
                         )
-                    if group_s:
-                        line = "'{" + line
-                        group_s = 0
-                    events_cmn += line + ","
-                else:
-                    event = line.split("|")
-                    pname = event[0].strip()
-                    hex_val = event[1].strip() if len(event) > 1 else ""
-                    name = pname.split(":")[0]
-                    support_core = 1 if re.search(rf"\b{name}\b", perf_list) else 0
-                    if support_core == 0 and hex_val:
-                        pname = hex_val
-                    if group_s:
-                        pname = "'{" + pname
-                        group_s = 0
-                    events_core += pname + ","
+                    names.append(event.name)
+                    continue
+                name = event.name.split(":")[0]
+                support_core = re.search(rf"\b{name}\b", perf_list)
+                names.append(
+                    event.name if support_core or not event.code else event.code
+                )
+            events = ",".join(names)
+            if group[0].grouped:
+                events = "'{" + events + "}'"
+            if group[0].pmu == "cmn":
+                cmn_groups.append(events)
+            else:
+                core_groups.append(events)
+        events_core = ",".join(core_groups)
+        events_cmn = ",".join(cmn_groups)
 
         if events_core:
-            events_core = events_core.rstrip(",")
             logger.debug(f"core events from eventlist: {events_core}")
 
         if events_cmn:
-            events_cmn = (
-                events_cmn.rstrip(",")
-                .replace("ARM_CMN_0", arm_cmn_0)
-                .replace("ARM_CMN_1", arm_cmn_1)
+            events_cmn = events_cmn.replace("ARM_CMN_0", arm_cmn_0).replace(
+                "ARM_CMN_1", arm_cmn_1
             )
             logger.debug(f"cmn events from eventlist: {events_cmn}")
 
@@ -0,0 +1,91 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import logging
+import math
+import time
+import numpy as np
+from postprocessor.live import is_summary
+
+logger = logging.getLogger("app")
+summary_rows = 20  # intervals between repeated headers and window averages
+
+
+# prints the summary metrics of each interval as a table, with the average
+# of the last summary_rows intervals before the header is repeated. times
+# have the decimals of the interval, 0.25s intervals are labeled 0.25, 0.50
+class SummaryTable:
+    def __init__(self, names, duration, interval_ms=1000):
+        self.columns = [i for i, name in enumerate(names) if is_summary(name)]
+        self.names = [names[i] for i in self.columns]
+        self.widths = [max(len(name), 8) for name in self.names]
+        self.duration = duration
+        self.decimals = next(d for d in range(4) if interval_ms % 10 ** (3 - d) == 0)
+        self.window: list[np.ndarray] = []
+
+    def _print(self, label, values):
+        cells = (
+            "-".rjust(w) if math.isnan(v) else f"{v:{w}.3f}"
+            for v, w in zip(values, self.widths)
+        )
+        print(f"{label:>14} " + " ".join(cells), flush=True)
+
+    def add(self, timestamp, values):
+        if not self.window:
+            header = (name.rjust(w) for name, w in zip(self.names, self.widths))
+            print(f"{'time':>14} " + " ".join(header), flush=True)
+        values = values[self.columns]
+        self.window.append(values)
+        self._print(f"{timestamp:.{self.decimals}f}/{self.duration}s", values)
+        if len(self.window) == summary_rows:
+            with np.errstate(invalid="ignore"):
+                average = np.nanmean(self.window, axis=0)
+            self._print("avg", average)
+            self.window = []
+
+
+# saves the lines of perf stat output read from a pipe to path, so the raw
+# data looks like a perf stat -o capture, or to compressed chunks of it with
+# compression. with live metrics, every complete interval is evaluated as it
+# arrives and its summary printed. the plain file is flushed once per
+# interval, when the next one starts
+class StatsWriter:
+    def __init__(self, path, live=None, duration=0, compression=None, interval_ms=1000):
+        self.path = path
+        self.live = live
+        self.duration = duration
+        self.compression = compression
+        self.interval_ms = interval_ms
+        self.table = None
+        self.stamp = None  # of the last line
+        if compression:
+            from postprocessor.capture import ChunkWriter
+
+            self.out = ChunkWriter(path, compression)
+        else:
+            self.out = open(path, "wb")
+        self.out.write(f"# started on {time.ctime()}\n\n".encode())
+
+    def write(self, line):
+        stamp = line.split(b",", 1)[0].strip()
+        if stamp and not stamp.startswith(b"#"):
+            if not self.compression and stamp != self.stamp:
+                self.out.flush()
+            self.stamp = stamp
+        self.out.write(line)
+        if self.live is None:
+            return
+        try:
+            for timestamp, values in self.live.feed(line):
+                if self.table is None:
+                    self.table = SummaryTable(
+                        self.live.names, self.duration, self.interval_ms
+                    )
+                self.table.add(timestamp, values)
+        except Exception:
+            logger.exception("live metrics failed, only saving %s", self.path)
+            self.live = None
+
+    def close(self):
+        self.out.close()
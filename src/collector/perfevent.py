@@ -0,0 +1,318 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import ctypes
+import fcntl
+import glob
+import logging
+import math
+import os
+import platform
+import re
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger("app")
+
+# counting the core events with perf_event_open directly instead of perf
+# stat: every group of the events file is opened on every cpu and read with
+# one read() per group and cpu each interval. the counts go into arrays,
+# saved as core_pmu.npz for the postprocessor, which reads them like a
+# perf stat -A capture without parsing any text
+syscall_numbers = {"x86_64": 298, "aarch64": 241, "ppc64le": 319, "s390x": 331}
+pmu_dir = "/sys/bus/event_source/devices"
+
+type_hardware, type_software, type_raw = 0, 1, 4
+format_enabled, format_running, format_group = 1, 2, 8
+flag_disabled, flag_exclude_user, flag_exclude_kernel, flag_exclude_hv = (
+    1 << 0,
+    1 << 4,
+    1 << 5,
+    1 << 6,
+)
+ioc_enable, ioc_disable, ioc_reset, ioc_flag_group = 0x2400, 0x2401, 0x2403, 1
+
+# perf's names of the generic events
+hardware_events = {
+    "cycles": 0,
+    "cpu-cycles": 0,
+    "instructions": 1,
+    "cache-references": 2,
+    "cache-misses": 3,
+    "branches": 4,
+    "branch-instructions": 4,
+    "branch-misses": 5,
+    "bus-cycles": 6,
+    "stalled-cycles-frontend": 7,
+    "stalled-cycles-backend": 8,
+    "ref-cycles": 9,
+}
+software_events = {
+    "cpu-clock": 0,
+    "task-clock": 1,
+    "page-faults": 2,
+    "faults": 2,
+    "context-switches": 3,
+    "cs": 3,
+    "cpu-migrations": 4,
+    "migrations": 4,
+    "minor-faults": 5,
+    "major-faults": 6,
+    "alignment-faults": 7,
+    "emulation-faults": 8,
+}
+modifier_flags = {
+    "u": flag_exclude_kernel | flag_exclude_hv,
+    "k": flag_exclude_user | flag_exclude_hv,
+}
+
+
+# struct perf_event_attr up to config2 (PERF_ATTR_SIZE_VER1), the bit
+# fields are in flags
+class PerfEventAttr(ctypes.Structure):
+    _fields_ = [
+        ("type", ctypes.c_uint32),
+        ("size", ctypes.c_uint32),
+        ("config", ctypes.c_uint64),
+        ("sample_period", ctypes.c_uint64),
+        ("sample_type", ctypes.c_uint64),
+        ("read_format", ctypes.c_uint64),
+        ("flags", ctypes.c_uint64),
+        ("wakeup_events", ctypes.c_uint32),
+        ("bp_type", ctypes.c_uint32),
+        ("config1", ctypes.c_uint64),
+        ("config2", ctypes.c_uint64),
+    ]
+
+
+_libc = None
+
+
+def _syscall():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _libc.syscall.restype = ctypes.c_long
+    return _libc.syscall
+
+
+# open a counter, pid -1 counts everything on cpu, cpu -1 follows pid
+def perf_event_open(attr, pid, cpu, group_fd):
+    number = syscall_numbers.get(platform.machine())
+    if number is None:
+        raise OSError(f"perf_event_open: unknown syscall on {platform.machine()}")
+    fd = _syscall()(
+        ctypes.c_long(number),
+        ctypes.byref(attr),
+        ctypes.c_int(pid),
+        ctypes.c_int(cpu),
+        ctypes.c_int(group_fd),
+        ctypes.c_ulong(0),
+    )
+    if fd < 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+    return fd
+
+
+# event=0x11 in the events file of a pmu in sysfs. only the event term is
+# used, which is all the core pmus need
+def _sysfs_event(name):
+    for path in sorted(glob.glob(os.path.join(pmu_dir, "*", "events", name))):
+        pmu = path.split(os.sep)[-3]
+        try:
+            with open(path) as f:
+                terms = dict(
+                    t.split("=", 1) for t in f.read().strip().split(",") if "=" in t
+                )
+            with open(os.path.join(pmu_dir, pmu, "type")) as f:
+                pmu_type = int(f.read())
+            return pmu_type, int(terms["event"], 16)
+        except (OSError, ValueError, KeyError) as e:
+            logger.debug("%s: %s", path, e)
+    return None
+
+
+# type, config and flags of an event as perf stat -e takes it: a generic
+# event, an event of a pmu in sysfs, a raw rNNN code, each with :u or :k.
+# the code from the events file is used for names that aren't known here
+def resolve_event(name, code=None):
+    base, _, modifiers = name.partition(":")
+    flags = 0
+    for m in modifiers:
+        if m not in modifier_flags:
+            raise ValueError(f"{name}: modifier {m} not supported")
+        flags |= modifier_flags[m]
+    if base in hardware_events:
+        return type_hardware, hardware_events[base], flags
+    if base in software_events:
+        return type_software, software_events[base], flags
+    if re.fullmatch(r"r[0-9a-fA-F]+", base):
+        return type_raw, int(base[1:], 16), flags
+    found = _sysfs_event(base)
+    if found is not None:
+        return found + (flags,)
+    if code:
+        return resolve_event(code)
+    raise ValueError(f"unknown event {name}")
+
+
+# the groups of events opened on each of the cpus (-1 for any cpu of pid).
+# groups that can't be opened are logged and read as 0, like perf stat
+# shows them as not supported
+class CounterGroups:
+    def __init__(self, groups, cpus, pid=-1):
+        self.groups = groups
+        self.cpus = cpus
+        self.header = [event.name for group in groups for event in group]
+        self.columns = []
+        start = 0
+        for group in groups:
+            self.columns.append(slice(start, start + len(group)))
+            start += len(group)
+        self.fds: list[int] = []
+        self.leaders = np.full((len(cpus), len(groups)), -1)
+        for g, group in enumerate(groups):
+            try:
+                attrs = [self._attr(event, i == 0) for i, event in enumerate(group)]
+            except ValueError as e:
+                logger.warning("group %d not counted: %s", g, e)
+                continue
+            for c, cpu in enumerate(cpus):
+                self.leaders[c, g] = self._open(attrs, pid, cpu, group)
+
+    @staticmethod
+    def _attr(event, leader):
+        event_type, config, flags = resolve_event(event.name, event.code)
+        attr = PerfEventAttr()
+        attr.size = ctypes.sizeof(PerfEventAttr)
+        attr.type = event_type
+        attr.config = config
+        attr.read_format = format_group | format_enabled | format_running
+        attr.flags = flags | (flag_disabled if leader else 0)
+        return attr
+
+    # open a group on a cpu, its leader's fd. -1 if any event fails
+    def _open(self, attrs, pid, cpu, group):
+        fds: list[int] = []
+        try:
+            for attr in attrs:
+                fds.append(perf_event_open(attr, pid, cpu, fds[0] if fds else -1))
+        except OSError as e:
+            names = ",".join(event.name for event in group)
+            logger.warning("{%s} not counted on cpu %d: %s", names, cpu, e)
+            for fd in fds:
+                os.close(fd)
+            return -1
+        self.fds.extend(fds)
+        return fds[0]
+
+    def _ioctl(self, request):
+        for fd in self.leaders[self.leaders >= 0]:
+            fcntl.ioctl(int(fd), request, ioc_flag_group)
+
+    def enable(self):
+        self._ioctl(ioc_reset)
+        self._ioctl(ioc_enable)
+
+    def disable(self):
+        self._ioctl(ioc_disable)
+
+    # the counts since enable() as (cpus, counters) and the time enabled and
+    # running of each group as (cpus, groups), in ns. one read() per group
+    def read(self):
+        counts = np.zeros((len(self.cpus), len(self.header)), dtype=np.uint64)
+        enabled = np.zeros(self.leaders.shape, dtype=np.uint64)
+        running = np.zeros(self.leaders.shape, dtype=np.uint64)
+        for (c, g), fd in np.ndenumerate(self.leaders):
+            if fd < 0:
+                continue
+            # nr, time_enabled, time_running, then a value per event
+            size = 8 * (3 + len(self.groups[g]))
+            data = np.frombuffer(os.read(int(fd), size), dtype=np.uint64)
+            enabled[c, g], running[c, g] = data[1], data[2]
+            counts[c, self.columns[g]] = data[3:]
+        return counts, enabled, running
+
+    def close(self):
+        for fd in self.fds:
+            os.close(fd)
+        self.fds = []
+        self.leaders[:] = -1
+
+
+# the counts of each interval, scaled like perf stat scales multiplexed
+# counters: by time enabled / time running of their group. counters of
+# groups that didn't run in the interval are 0
+def interval_counts(groups, before, after):
+    counts = after[0].astype(np.float64) - before[0].astype(np.float64)
+    enabled = after[1].astype(np.float64) - before[1].astype(np.float64)
+    running = after[2].astype(np.float64) - before[2].astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scale = np.where(running > 0, enabled / running, 0.0)
+    for g, columns in enumerate(groups.columns):
+        counts[:, columns] *= scale[:, g, None]
+    return counts, enabled, running
+
+
+# samples counter groups every interval in a thread, into arrays sized for
+# duration. stop() ends the sampling, save() writes what was sampled
+class CounterSampler:
+    def __init__(self, groups, interval_ms, duration):
+        self.groups = groups
+        self.interval = interval_ms / 1000
+        intervals = math.ceil(duration / self.interval) + 1
+        cpus, counters = len(groups.cpus), len(groups.header)
+        self.time = np.zeros(intervals)
+        self.values = np.zeros((intervals, cpus, counters))
+        self.enabled = np.zeros((intervals, cpus, len(groups.groups)))
+        self.running = np.zeros_like(self.enabled)
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.groups.enable()
+        self._start = time.monotonic()
+        self._thread.start()
+
+    def _run(self):
+        before = self.groups.read()
+        while self.samples < len(self.time):
+            # intervals are timed from the start, so they don't drift
+            deadline = self._start + (self.samples + 1) * self.interval
+            if self._stop.wait(max(0.0, deadline - time.monotonic())):
+                break
+            after = self.groups.read()
+            k = self.samples
+            self.time[k] = time.monotonic() - self._start
+            self.values[k], self.enabled[k], self.running[k] = interval_counts(
+                self.groups, before, after
+            )
+            before = after
+            self.samples += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.groups.disable()
+        self.groups.close()
+
+    # the intervals sampled, with the cpu of each column and the counter
+    # names. time_enabled and time_running are kept per group, in ns
+    def save(self, path, compressed=False):
+        k = self.samples
+        (np.savez_compressed if compressed else np.savez)(
+            path,
+            time=self.time[:k],
+            cores=np.array(self.groups.cpus),
+            header=np.array(self.groups.header),
+            values=self.values[:k],
+            enabled=self.enabled[:k],
+            running=self.running[:k],
+        )
+        logger.info(
+            "%d intervals of %d cpus saved to %s", k, len(self.groups.cpus), path
+        )
@@ -2,19 +2,20 @@
 #
 # SPDX-License-Identifier: BSD-3-Clause
 
+import json
 import os
 import subprocess
 import time
-import signal
-from collector.cpu import CPUDetector
+from collector import timing
+from collector.cpu import CPUDetector, cpu_list, cpu_sockets
 from collector.events import EventParser
+from postprocessor.eventfile import event_groups, load_event_file
 from collector.utils import (
     check_root,
     check_perf_availibility,
     mkdir_clean,
     set_perf_mux,
     reset_perf_mux,
-    progress_bar,
     run_postprocess,
     change_ownership_recursive,
 )
@@ -25,6 +26,8 @@ import click
 logger = logging.getLogger("app")
 src_path = Path(__file__).resolve().parents[1]
 events_path = src_path / "events"
+counter_file = "core_pmu.npz"  # written by the perf_event_open backend
+min_interval_ms = 10
 
 
 class Profiler:
@@ -41,34 +44,55 @@ class Profiler:
         tda,
         debug,
         delay,
+        live=False,
+        profile=False,
+        profile_dump=(),
+        percore=False,
+        backend="perf",
+        compress=None,
     ):
         self.duration = duration
-        self.interval_ms = interval * 1000
+        self.interval_ms = round(interval * 1000)
         self.workload = job
         self.cores = cores
         self.persocket = persocket
+        self.percore = percore
         self.plot = plot
         self.output = output
         self.event_file = event_file
         self.tda = tda
         self.debug = debug
-        self.process_queue = []
         self.core_count = 0
         self.delay = delay
         self.cpu_info = None
+        self.live = live
+        self.profile = profile or bool(profile_dump)
+        self.profile_dump = profile_dump
+        self.backend = backend
+        self.compress = compress
+        self.sampler = None
+        self.supervisor = None
 
     def run(self):
-        check_root()
-        check_perf_availibility()
-        mkdir_clean(self.output)
+        if self.profile:
+            timing.start("app", self.output, self.profile_dump)
+        with timing.stage("checks"):
+            check_root()
+            if self.backend == "perf":
+                check_perf_availibility()
+            mkdir_clean(self.output)
 
         if self.duration < 10:
             raise ValueError("Sample duration must be >= 10 seconds")
+        # perf stat -I takes whole milliseconds, from 10
+        if self.interval_ms < min_interval_ms:
+            raise click.UsageError(f"--interval must be >= {min_interval_ms / 1000}s")
 
         if not self.event_file:
             logger.debug("no event file provided")
             logger.info("Detecting CPU")
-            cpu_info = CPUDetector.detect(self.event_file, self.tda)
+            with timing.stage("detect_cpu"):
+                cpu_info = CPUDetector.detect(self.event_file, self.tda)
             self.event_file = events_path / cpu_info["event_file"]
             self.cpu_info = cpu_info["arch"]
         else:
@@ -78,28 +102,43 @@ class Profiler:
         if self.tda:
             if self.cpu_info == "Altra Family" or self.event_file == "events_altra.txt":
                 raise click.UsageError("TDA isn't supported on Altra Family")
+        if self.live and self.percore:
+            raise click.UsageError("--live isn't supported with --percore")
+        if self.live and self.backend == "direct":
+            raise click.UsageError("--live isn't supported with --backend direct")
 
-        events = EventParser.get_events(self.event_file, self.cpu_info)
+        with timing.stage("parse_events"):
+            if self.backend == "direct":
+                events = self._direct_events()
+            else:
+                events = EventParser.get_events(self.event_file, self.cpu_info)
 
-        set_perf_mux()
+        with timing.stage("set_perf_mux"):
+            set_perf_mux()
 
-        self.core_count = self._get_core_count()
+        with timing.stage("core_count"):
+            self.core_count = self._get_core_count()
+        self._write_run_info()
         if self.delay:
             logger.info(f"delaying collection by {self.delay}s...")
             time.sleep(self.delay)
 
+        from collector.supervisor import Supervisor
+
+        # the live summary replaces the progress
+        self.supervisor = Supervisor(self.duration, progress=not self.live)
         if self.workload:
-            try:
-                _ = subprocess.Popen(self.workload, shell=True)
-            except Exception as e:
-                logger.error(e)
+            self.supervisor.add_workload(self.workload)
 
-        self._collect_pmu(events)
-        progress_bar(self.duration)
-        logger.info("Waiting for collectors to complete collection...")
-        for pid in self.process_queue:
-            logger.debug(f"waiting for process: {pid}")
-            os.killpg(os.getpgid(pid), signal.SIGINT)
+        with timing.stage("collect"):
+            self._collect_pmu(events)
+            try:
+                self.supervisor.run()
+            finally:
+                if self.sampler is not None:
+                    self.sampler.stop()
+                    path = os.path.join(self.output, counter_file)
+                    self.sampler.save(path, compressed=bool(self.compress))
 
         run_postprocess(
             self.core_count,
@@ -111,39 +150,112 @@ class Profiler:
             self.event_file,
             self.persocket,
             src_path,
+            percore=self.percore,
         )
-        reset_perf_mux()
-        change_ownership_recursive(self.output)
+        with timing.stage("reset_perf_mux"):
+            reset_perf_mux()
+        with timing.stage("change_ownership"):
+            change_ownership_recursive(self.output)
+        timing.write()
         logger.info("Ampere PMU Profiler collection and postprocessing completed")
 
+    # how the run was collected, so postprocess batch can process it again
+    def _write_run_info(self):
+        info = {
+            "event_file": os.path.abspath(self.event_file),
+            "cpu": self.cpu_info,
+            "cores": self.cores,
+            "core_count": self.core_count,
+            "duration": self.duration,
+            "interval_ms": self.interval_ms,
+            "persocket": self.persocket,
+            "percore": self.percore,
+            "backend": self.backend,
+            "compress": self.compress,
+            "plot": self.plot,
+            "tda": self.tda,
+            "workload": self.workload,
+        }
+        if self.percore or self.backend == "direct":
+            # the socket views of a per-core run are sums over these cpus
+            cpus = cpu_list(self.cores)
+            sockets = cpu_sockets(cpus)
+            if sockets is not None:
+                info["core_sockets"] = dict(zip(map(str, cpus), sockets))
+        with open(os.path.join(self.output, "run.json"), "w") as f:
+            json.dump(info, f, indent=2)
+
     def _get_core_count(self):
         if not self.cores:
             result = subprocess.run(
                 "lscpu | grep On-line", shell=True, capture_output=True, text=True
             )
             self.cores = result.stdout.split(":")[1].strip()
-        count = 0
-        for part in self.cores.split(","):
-            if "-" in part:
-                start, end = map(int, part.split("-"))
-                count += end - start + 1
-            else:
-                count += 1
+        count = len(cpu_list(self.cores))
         logger.info(f"core count: {count}")
         return count
 
+    # the core events of the events file as groups of Event for the
+    # perf_event_open backend. cmn events still need perf stat, they're
+    # collected with it if perf is installed
+    def _direct_events(self):
+        groups = list(event_groups(load_event_file(self.event_file).events))
+        core = [group for group in groups if group[0].pmu == "core"]
+        events = {"core": core, "cmn": ""}
+        if len(core) < len(groups):
+            try:
+                check_perf_availibility()
+            except EnvironmentError:
+                logger.warning("perf not available, the cmn events aren't collected")
+            else:
+                perf_events = EventParser.get_events(self.event_file, self.cpu_info)
+                events["cmn"] = perf_events["cmn"]
+        return events
+
     def _collect_pmu(self, events):
         perf_base = f"perf stat -I {self.interval_ms} -x,"
-        if events["core"]:
-            core_cmd = f"{perf_base} -C {self.cores} -e {events['core']} -o {self.output}/core_pmu.csv"
-            pid = subprocess.Popen(core_cmd, shell=True, preexec_fn=os.setsid).pid
-            logger.debug(f"core_pid: {pid}")
-            self.process_queue.append(pid)
+        if events["core"] and self.backend == "direct":
+            from collector.perfevent import CounterGroups, CounterSampler
+
+            groups = CounterGroups(events["core"], cpu_list(self.cores))
+            self.sampler = CounterSampler(groups, self.interval_ms, self.duration)
+            self.sampler.start()
+            logger.debug("core counters opened with perf_event_open")
+        elif events["core"]:
+            # -A: a line per core instead of their sum, --per-socket: a sum
+            # per socket. per-core runs are summed per socket in postprocess
+            scope = ""
+            if self.percore:
+                scope = " -A"
+            elif self.persocket:
+                scope = " --per-socket"
+            core_cmd = f"{perf_base}{scope} -C {self.cores} -e {events['core']}"
+            live = None
+            if self.live:
+                from postprocessor.live import LiveMetrics
+
+                live = LiveMetrics(
+                    self.event_file,
+                    self.core_count,
+                    self.duration,
+                    persocket=self.persocket,
+                )
+            self._add_perf("core perf", core_cmd, f"{self.output}/core_pmu.csv", live)
 
         if events["cmn"]:
-            cmn_cmd = (
-                f"{perf_base} -C 0 -e {events['cmn']} -o {self.output}/cmn_pmu.csv"
+            cmn_cmd = f"{perf_base} -C 0 -e {events['cmn']}"
+            self._add_perf("cmn perf", cmn_cmd, f"{self.output}/cmn_pmu.csv")
+
+    # have the supervisor run perf stat writing to path. in live mode or to
+    # compress its output, perf writes to its stdout instead, which is saved
+    # (to compressed chunks) and evaluated as the supervisor reads it
+    def _add_perf(self, name, cmd, path, live=None):
+        if not self.live and not self.compress:
+            self.supervisor.add_perf(name, f"{cmd} -o {path}")
+        else:
+            from collector.live import StatsWriter
+
+            sink = StatsWriter(
+                path, live, self.duration, self.compress, self.interval_ms
             )
-            pid = subprocess.Popen(cmn_cmd, shell=True, preexec_fn=os.setsid).pid
-            logger.debug(f"cmn_proc: {pid}")
-            self.process_queue.append(pid)
+            self.supervisor.add_perf(name, f"{cmd} --log-fd 1", sink)
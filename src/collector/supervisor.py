@@ -0,0 +1,185 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import asyncio
+import logging
+import os
+import signal
+from collections import deque
+
+logger = logging.getLogger("app")
+grace_seconds = 10  # for a child to exit after it was asked to
+stderr_lines = 20  # kept of each child, for the error of an early exit
+
+
+# a process started by the supervisor, in its own process group. with
+# pipe, its stdout goes to sink (write(line) and close()) or the debug log
+# and its stderr to the log, else it writes to the terminal
+class Child:
+    def __init__(self, name, cmd, sink=None, stop_signal=signal.SIGINT, pipe=True):
+        self.name = name
+        self.cmd = cmd
+        self.sink = sink
+        self.stop_signal = stop_signal
+        self.pipe = pipe
+        self.proc = None
+        self.stderr: deque[str] = deque(maxlen=stderr_lines)
+        self.pumps = []
+
+    async def start(self):
+        pipe = asyncio.subprocess.PIPE if self.pipe else None
+        self.proc = await asyncio.create_subprocess_shell(
+            self.cmd, stdout=pipe, stderr=pipe, start_new_session=True
+        )
+        logger.debug("%s started, pid %d: %s", self.name, self.proc.pid, self.cmd)
+        if self.pipe:
+            self.pumps = [
+                asyncio.create_task(self._pump_stdout()),
+                asyncio.create_task(self._pump_stderr()),
+            ]
+
+    async def _pump_stdout(self):
+        try:
+            async for line in self.proc.stdout:
+                if self.sink is not None:
+                    self.sink.write(line)
+                else:
+                    logger.debug("%s: %s", self.name, line.decode(errors="replace"))
+        finally:
+            if self.sink is not None:
+                self.sink.close()
+
+    async def _pump_stderr(self):
+        async for line in self.proc.stderr:
+            text = line.decode(errors="replace").rstrip()
+            self.stderr.append(text)
+            logger.warning("%s: %s", self.name, text)
+
+    def running(self):
+        return self.proc is not None and self.proc.returncode is None
+
+    def _signal(self, sig):
+        try:
+            os.killpg(self.proc.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    # ask the child to exit, kill it if it doesn't within grace seconds.
+    # returns once its output is read
+    async def stop(self, grace):
+        if self.running():
+            logger.debug("stopping %s", self.name)
+            self._signal(self.stop_signal)
+            try:
+                await asyncio.wait_for(self.proc.wait(), grace)
+            except asyncio.TimeoutError:
+                logger.warning("%s didn't exit in %ss, killing it", self.name, grace)
+                self._signal(signal.SIGKILL)
+                await self.proc.wait()
+        try:
+            await asyncio.wait_for(asyncio.gather(*self.pumps), grace)
+        except asyncio.TimeoutError:
+            # a grandchild still holds the pipes open
+            logger.warning("output of %s not closed, dropping the rest", self.name)
+            for pump in self.pumps:
+                pump.cancel()
+
+
+# runs the workload and the perf processes of a collection for duration
+# seconds. the collection stops early on SIGINT or SIGTERM, when the
+# workload exits, or when a perf process exits on its own, which is an
+# error. stopping asks every perf
+# process to exit (SIGINT, perf writes its last interval) and waits for its
+# output, then the workload is terminated if it is still running
+class Supervisor:
+    def __init__(self, duration, progress=True, grace=grace_seconds):
+        self.duration = duration
+        self.progress = progress
+        self.grace = grace
+        self.workload = None
+        self.collectors: list[Child] = []
+        self.error = None
+        self.reason = None
+
+    def add_workload(self, cmd):
+        self.workload = Child("workload", cmd, stop_signal=signal.SIGTERM, pipe=False)
+
+    def add_perf(self, name, cmd, sink=None):
+        self.collectors.append(Child(name, cmd, sink))
+
+    # run the collection, raises RuntimeError if a perf process failed
+    def run(self):
+        asyncio.run(self._run())
+        if self.error:
+            raise RuntimeError(self.error)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        signals = (signal.SIGINT, signal.SIGTERM)
+        for sig in signals:
+            loop.add_signal_handler(sig, self._on_signal, stop, sig)
+        tasks = []
+        try:
+            if self.workload is not None:
+                await self.workload.start()
+                tasks.append(asyncio.create_task(self._watch_workload(stop)))
+            for child in self.collectors:
+                await child.start()
+                tasks.append(asyncio.create_task(self._watch(child, stop)))
+            tasks.append(asyncio.create_task(self._countdown(stop)))
+            await stop.wait()
+            if self.progress:
+                print()
+            logger.info("stopping the collection: %s", self.reason)
+        finally:
+            for task in tasks:
+                task.cancel()
+            # also whatever started before a failure
+            await asyncio.gather(*(c.stop(self.grace) for c in self.collectors))
+            if self.workload is not None:
+                await self.workload.stop(self.grace)
+            for sig in signals:
+                loop.remove_signal_handler(sig)
+
+    def _stop(self, stop, reason):
+        if not stop.is_set():
+            self.reason = reason
+            stop.set()
+
+    def _on_signal(self, stop, sig):
+        self._stop(stop, f"{signal.Signals(sig).name} received")
+
+    # stop after duration seconds, showing the progress every second
+    async def _countdown(self, stop):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for second in range(self.duration + 1):
+            if self.progress:
+                print(f"[{second:04}/{self.duration:04}]", end="\r", flush=True)
+            if second == self.duration:
+                break
+            try:
+                delay = max(start + second + 1 - loop.time(), 0)
+                await asyncio.wait_for(stop.wait(), delay)
+                return
+            except asyncio.TimeoutError:
+                pass
+        self._stop(stop, f"{self.duration}s collected")
+
+    # a perf process exiting before it's stopped ends the collection
+    async def _watch(self, child, stop):
+        code = await child.proc.wait()
+        if stop.is_set():
+            return
+        output = "; ".join(child.stderr) or "no output"
+        self.error = f"{child.name} exited with {code} while collecting: {output}"
+        logger.error(self.error)
+        self._stop(stop, f"{child.name} exited")
+
+    # there's nothing left to collect once the workload exited
+    async def _watch_workload(self, stop):
+        code = await self.workload.proc.wait()
+        logger.info("workload exited with %d", code)
+        self._stop(stop, "workload exited")
@@ -0,0 +1,143 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("app")
+
+# wall and cpu time of the stages of a command, written to timings.json in
+# its output directory with --profile. stages nest, "postprocess/plot" is the
+# plot stage run inside the postprocess stage. cpu time includes child
+# processes that exited during the stage, e.g. the postprocess subprocess or
+# the worker pool of --jobs
+timings_file = "timings.json"
+dump_kinds = ("cprofile", "tracemalloc")
+_command = None
+_output = None  # directory of timings.json, None when not profiling
+_dumps: set[str] = set()
+_stages: dict[str, list] = {}  # path -> [calls, wall, cpu]
+_path: list[str] = []
+_dumping = False  # in a heavy stage, its snapshots cover the nested ones
+_started = 0.0
+
+
+# start recording the stages of command. dumps are the snapshots (cprofile,
+# tracemalloc) written for the heavy stages
+def start(command, output, dumps=()):
+    global _command, _output, _dumps, _started
+    _command, _output, _dumps = command, str(output), set(dumps)
+    _stages.clear()
+    _path.clear()
+    _started = time.time()
+
+
+def enabled():
+    return _output is not None
+
+
+def _cpu():
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+@contextmanager
+def stage(name, heavy=False):
+    global _dumping
+    if _output is None:
+        yield
+        return
+    heavy = heavy and bool(_dumps) and not _dumping
+    _dumping = _dumping or heavy
+    _path.append(name)
+    path = "/".join(_path)
+    entry = _stages.setdefault(path, [0, 0.0, 0.0])
+    profile = None
+    if heavy and "cprofile" in _dumps:
+        import cProfile
+
+        profile = cProfile.Profile()
+        profile.enable()
+    if heavy and "tracemalloc" in _dumps:
+        import tracemalloc
+
+        tracemalloc.start()
+    wall, cpu = time.perf_counter(), _cpu()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - wall, _cpu() - cpu
+        _path.pop()
+        entry[0] += 1
+        entry[1] += wall
+        entry[2] += cpu
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(_dump_file(path, "prof"))
+        if heavy and "tracemalloc" in _dumps:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            snapshot.dump(_dump_file(path, "tracemalloc"))
+        _dumping = _dumping and not heavy
+
+
+_done = object()
+
+
+# the items of iterable, the time spent producing them counted as a stage.
+# for the generators of a streaming pipeline, whose work happens on demand
+def iterate(name, iterable):
+    if _output is None:
+        return iterable
+    return _iterate(name, iter(iterable))
+
+
+def _iterate(name, it):
+    while True:
+        with stage(name):
+            item = next(it, _done)
+        if item is _done:
+            return
+        yield item
+
+
+def _dump_file(path, suffix):
+    directory = os.path.join(_output, "profile")
+    os.makedirs(directory, exist_ok=True)
+    name = f"{_command}.{path.replace('/', '.')}.{suffix}"
+    logger.info("%s snapshot: %s", suffix, os.path.join(directory, name))
+    return os.path.join(directory, name)
+
+
+# add the stages of the command to timings.json, keeping those of the other
+# commands of the run. the file gets the owner of the output directory
+def write():
+    if _output is None:
+        return
+    path = os.path.join(_output, timings_file)
+    try:
+        with open(path) as f:
+            timings = json.load(f)
+    except (OSError, ValueError):
+        timings = {}
+    timings[_command] = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(_started)),
+        "wall": round(time.time() - _started, 6),
+        "stages": [
+            {"stage": p, "calls": calls, "wall": round(wall, 6), "cpu": round(cpu, 6)}
+            for p, (calls, wall, cpu) in _stages.items()
+        ],
+    }
+    os.makedirs(_output, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(timings, f, indent=2)
+    owner = os.stat(_output)
+    try:
+        os.chown(path, owner.st_uid, owner.st_gid)
+    except OSError:
+        pass
+    logger.info("stage timings: %s", path)
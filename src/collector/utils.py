@@ -6,15 +6,13 @@ import logging
 import glob
 import os
 import subprocess
-import time
 import getpass
 import pwd
 import grp
+import shutil
 
 # from pathlib import Path
-from postprocessor import tda as TDA
-from postprocessor import plot as PLOT
-from click.testing import CliRunner
+from collector import timing
 
 logger = logging.getLogger("app")
 mux_files = glob.glob("sys/devices/*pmu*/perf_event_mux_interval_ms") + glob.glob(
@@ -36,7 +34,11 @@ def check_perf_availibility():
 def mkdir_clean(path):
     os.makedirs(path, exist_ok=True)
     for f in os.listdir(path):
-        os.remove(os.path.join(path, f))
+        f = os.path.join(path, f)
+        if os.path.isdir(f):
+            shutil.rmtree(f)
+        else:
+            os.remove(f)
 
 
 def set_perf_mux():
@@ -65,49 +67,49 @@ def reset_perf_mux():
             logger.warning(f"couldn't update {f}: {e}")
 
 
-def progress_bar(seconds):
-    for i in range(seconds + 1):
-        print(f"[{i:04}/{seconds:04}]", end="\r")
-        time.sleep(1)
-
-
+# postprocess the capture in output and write the reports. postprocessing
+# runs in this process, reusing the events file already parsed for the
+# collection
 def run_postprocess(
-    core_count, duration, output, debug, plot, tda, event_file, persocket, src_path
+    core_count,
+    duration,
+    output,
+    debug,
+    plot,
+    tda,
+    event_file,
+    persocket,
+    src_path,
+    percore=False,
 ):
     output = src_path.parent / output
-    env = os.environ.copy()
-    cmd = [
-        "sudo",
-        "postprocess",
-        "--cpus",
-        str(core_count),
-        "--metric",
-        str(event_file),
-        "--duration",
-        str(duration),
-        "--output",
-        str(output / "metrics.csv"),
-        str(output / "core_pmu.csv"),
-    ]
+    # core_pmu.npz instead of core_pmu.csv with the perf_event_open backend
+    files = [output / "core_pmu.csv", output / "core_pmu.npz"]
     if not tda:
-        cmd.append(str(output / "cmn_pmu.csv"))
-    if debug:
-        cmd.insert(6, "--debug")
-    if persocket:
-        cmd.append(" --persocket")
-    logger.debug(f"Running postprocess with command {cmd}")
-    subprocess.run(cmd, check=True)
-    env["PYTHONPATH"] = "src"
+        files.append(output / "cmn_pmu.csv")
+    from postprocessor import postprocess
+
+    with timing.stage("postprocess", heavy=True):
+        postprocess.process_files(
+            files,
+            output / "metrics.csv",
+            event_file,
+            core_count,
+            duration,
+            persocket=persocket,
+            percore=percore,
+        )
+    # the report generators load plotly and pandas, only import them if used
     if plot:
-        runner = CliRunner()
-        res = runner.invoke(PLOT.main, ["-d", str(output)])
-        if res.exit_code != 0:
-            raise RuntimeError(f"APP plot failed with code {res.exit_code}")
+        from postprocessor import plot as PLOT
+
+        with timing.stage("plot", heavy=True):
+            PLOT.write_report(str(output))
     if tda:
-        runner = CliRunner()
-        res = runner.invoke(TDA.main, ["-i", str(output)])
-        if res.exit_code != 0:
-            raise RuntimeError(f"TDA plot failed with code {res.exit_code}")
+        from postprocessor import tda as TDA
+
+        with timing.stage("tda", heavy=True):
+            TDA.write_html(str(output), "metrics.csv", "tda.html", "sunburst")
 
 
 def change_ownership_recursive(path, user=None, group=None):
@@ -0,0 +1,232 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import glob
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import NamedTuple
+import click
+from collector.logger_setup import setup_logger
+from postprocessor import postprocess
+from postprocessor.capture import capture_files, chunk_pattern
+from postprocessor.eventfile import load_event_file
+
+logger = logging.getLogger("app")
+
+# the collector leaves run.json in its output directory, with how the run was
+# collected, so it can be postprocessed again without the app's options
+run_file = "run.json"
+input_files = ("core_pmu.csv", "core_pmu.npz", "cmn_pmu.csv")
+core_files = input_files[:2]  # a run has one of them
+output_files = ("metrics.csv", "metrics.average.csv", "metrics.stats.csv")
+skip_dirs = ("store", "percore", "profile")
+
+
+class Run(NamedTuple):
+    path: str
+    metric: str | None  # events file
+    cores: int
+    duration: float | None
+    persocket: bool
+    percore: bool
+    plot: bool
+    tda: bool
+
+
+class Result(NamedTuple):
+    path: str
+    status: str  # done, skipped or failed
+    samples: int
+    size: int  # bytes of perf stat data
+    seconds: float
+    error: str | None = None
+
+
+# directories under dirs with a capture, in order
+def find_runs(dirs):
+    runs = []
+    for top in dirs:
+        for root, subdirs, files in os.walk(top):
+            subdirs[:] = sorted(d for d in subdirs if d not in skip_dirs)
+            # compressed chunks count by the name of the plain file
+            names = {chunk_pattern.sub(".csv", name) for name in files}
+            if any(name in names for name in core_files):
+                runs.append(root)
+    return runs
+
+
+# how to postprocess the run in path: from its run.json, the defaults for
+# what it doesn't have
+def read_run_info(path, metric, cores, duration, persocket, plot, tda):
+    try:
+        with open(os.path.join(path, run_file)) as f:
+            info = json.load(f)
+    except FileNotFoundError:
+        info = {}
+    return Run(
+        path,
+        info.get("event_file", metric),
+        info.get("core_count", cores),
+        info.get("duration", duration),
+        info.get("persocket", persocket),
+        info.get("percore", False),
+        info.get("plot", False) or plot,
+        info.get("tda", False) or tda,
+    )
+
+
+# the captures of the run, compressed ones by the name of the plain file
+def _inputs(run):
+    return [
+        f
+        for f in (os.path.join(run.path, name) for name in input_files)
+        if capture_files(f)
+    ]
+
+
+def _capture_files(inputs):
+    return [path for f in inputs for path in capture_files(f)]
+
+
+# the outputs are newer than the captures, run.json and the events file
+def up_to_date(run):
+    sources = _capture_files(_inputs(run)) + [
+        os.path.join(run.path, run_file),
+        run.metric,
+    ]
+    newest = max(os.path.getmtime(f) for f in sources if f and os.path.isfile(f))
+    outputs = [os.path.join(run.path, name) for name in output_files]
+    if run.tda:
+        outputs.append(os.path.join(run.path, "tda.html"))
+    if run.plot:
+        reports = glob.glob(os.path.join(run.path, "APP-report-*.html"))
+        outputs.append(max(reports, key=os.path.getmtime) if reports else "")
+    return all(os.path.isfile(f) and os.path.getmtime(f) >= newest for f in outputs)
+
+
+# postprocess one run and write its reports. failures are returned, so one
+# broken run doesn't stop the batch
+def process_run(run):
+    start = time.perf_counter()
+    inputs = _inputs(run)
+    size = sum(os.path.getsize(f) for f in _capture_files(inputs))
+    try:
+        if run.metric is None:
+            raise ValueError(f"no {run_file} and no --metric")
+        samples = postprocess.process_files(
+            inputs,
+            os.path.join(run.path, "metrics.csv"),
+            run.metric,
+            run.cores,
+            run.duration,
+            persocket=run.persocket,
+            percore=run.percore,
+        )
+        # the report generators load plotly and pandas, only import them if used
+        if run.plot:
+            from postprocessor import plot
+
+            plot.write_report(run.path)
+        if run.tda:
+            from postprocessor import tda
+
+            tda.write_html(run.path, "metrics.csv", "tda.html", "sunburst")
+    except Exception as e:
+        logger.exception("%s failed", run.path)
+        return Result(run.path, "failed", 0, size, time.perf_counter() - start, str(e))
+    return Result(run.path, "done", samples, size, time.perf_counter() - start)
+
+
+def print_summary(results, seconds):
+    done = [r for r in results if r.status == "done"]
+    counts = {
+        s: sum(r.status == s for r in results) for s in ("done", "skipped", "failed")
+    }
+    click.echo(
+        f"{len(results)} runs in {seconds:.1f}s: "
+        + ", ".join(f"{n} {status}" for status, n in counts.items())
+    )
+    for r in results:
+        if r.status == "failed":
+            click.echo(f"  failed: {r.path}: {r.error}")
+    if done and seconds > 0:
+        size = sum(r.size for r in done) / 1e6
+        samples = sum(r.samples for r in done)
+        click.echo(
+            f"throughput: {len(done) / seconds:.2f} runs/s, {size / seconds:.1f} MB/s, "
+            f"{samples / seconds:.0f} intervals/s"
+        )
+
+
+@click.command(
+    help="Postprocess every run (directory with a core_pmu.csv or core_pmu.npz) in DIRS"
+)
+@click.argument("dirs", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option(
+    "--metric", type=click.Path(), help="events file of runs without run.json"
+)
+@click.option("--cpus", type=int, default=80, help="cores of runs without run.json")
+@click.option("--duration", type=float, help="duration of runs without run.json")
+@click.option("--persocket", is_flag=True, help="per-socket runs without run.json")
+@click.option("--plot", is_flag=True, help="also write the plot report")
+@click.option("--tda", is_flag=True, help="also write the TDA report")
+@click.option(
+    "--jobs",
+    type=int,
+    default=os.cpu_count() or 1,
+    help="runs processed at a time  [default: cores]",
+)
+@click.option("--force", is_flag=True, help="also process runs that are up to date")
+@click.option("--debug", is_flag=True, help="enable debug messages")
+def batch(dirs, metric, cpus, duration, persocket, plot, tda, jobs, force, debug):
+    setup_logger("DEBUG" if debug else "INFO", "app_postprocess.log")
+    start = time.perf_counter()
+    runs = [
+        read_run_info(path, metric, cpus, duration, persocket, plot, tda)
+        for path in find_runs(dirs)
+    ]
+    logger.info("%d runs found", len(runs))
+    results = []
+    todo = []
+    for run in runs:
+        if not force and up_to_date(run):
+            logger.info("%s is up to date", run.path)
+            results.append(Result(run.path, "skipped", 0, 0, 0.0))
+        else:
+            todo.append(run)
+
+    # each events file is parsed once here. workers forked after start with
+    # the models loaded, others load them from the events file cache
+    for path in sorted({run.metric for run in todo if run.metric}):
+        try:
+            load_event_file(path)
+        except OSError as e:
+            logger.warning("events file %s: %s", path, e)
+
+    if jobs > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(min(jobs, len(todo))) as executor:
+            futures = {executor.submit(process_run, run): run for run in todo}
+            for future in as_completed(futures):
+                # a worker killed (out of memory, a crash) breaks the pool, the
+                # runs it had fail and the others are still summarized
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    logger.error("%s failed: %r", futures[future].path, e)
+                    results.append(
+                        Result(futures[future].path, "failed", 0, 0, 0.0, repr(e))
+                    )
+                logger.info("%s: %s", results[-1].path, results[-1].status)
+    else:
+        for run in todo:
+            results.append(process_run(run))
+            logger.info("%s: %s", results[-1].path, results[-1].status)
+
+    results.sort(key=lambda r: r.path)
+    print_summary(results, time.perf_counter() - start)
+    if any(r.status == "failed" for r in results):
+        raise SystemExit(1)
@@ -0,0 +1,118 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import glob
+import gzip
+import logging
+import os
+import re
+
+logger = logging.getLogger("app")
+
+# a perf stat capture can be written compressed, as numbered chunks next to
+# where the plain file would be: core_pmu.csv is then core_pmu.00000.csv.gz,
+# core_pmu.00001.csv.gz, ... a chunk is rotated at the start of an interval
+# once it has chunk_bytes of text, so every chunk but the last holds
+# complete intervals and can be parsed on its own
+compressions = {"gzip": ".gz", "zstd": ".zst"}
+chunk_bytes = 64 << 20  # uncompressed
+chunk_pattern = re.compile(r"\.(\d+)\.csv(\.gz|\.zst)$")
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise RuntimeError("zstd compression needs the zstandard package") from e
+    return zstandard
+
+
+# path of chunk index of the capture path
+def chunk_name(path, index, compression):
+    stem = str(path)[: -len(".csv")] if str(path).endswith(".csv") else str(path)
+    return f"{stem}.{index:05d}.csv{compressions[compression]}"
+
+
+# the chunks of the capture path in order, [] if it wasn't compressed
+def chunk_files(path):
+    stem = str(path)[: -len(".csv")] if str(path).endswith(".csv") else str(path)
+    found = []
+    for name in glob.glob(glob.escape(stem) + ".*.csv.*"):
+        match = chunk_pattern.search(name)
+        if match and name[: match.start()] == stem:
+            found.append((int(match.group(1)), name))
+    return [name for _, name in sorted(found)]
+
+
+# the files holding the capture path: itself, or its chunks
+def capture_files(path):
+    return [str(path)] if os.path.isfile(path) else chunk_files(path)
+
+
+def is_chunk(path):
+    return chunk_pattern.search(str(path)) is not None
+
+
+# the text of a chunk
+def read_chunk(path):
+    if str(path).endswith(compressions["zstd"]):
+        with open(path, "rb") as f:
+            return _zstandard().ZstdDecompressor().stream_reader(f).read()
+    with gzip.open(path, "rb") as f:
+        return f.read()
+
+
+# writes the lines of a perf stat capture to compressed chunks of path
+class ChunkWriter:
+    def __init__(self, path, compression, size=chunk_bytes):
+        if compression not in compressions:
+            raise ValueError(f"unknown compression {compression}")
+        self.path = path
+        self.compression = compression
+        self.size = size
+        self.index = 0
+        self.written = 0  # uncompressed bytes in the current chunk
+        self.raw = 0  # of all chunks
+        self.stamp = None  # of the last line
+        self.chunk = None
+        for name in chunk_files(path):
+            os.remove(name)
+
+    def _open(self):
+        name = chunk_name(self.path, self.index, self.compression)
+        if self.compression == "zstd":
+            compressor = _zstandard().ZstdCompressor(level=3)
+            self.chunk = compressor.stream_writer(open(name, "wb"))
+        else:
+            self.chunk = gzip.open(name, "wb", compresslevel=6)
+        self.written = 0
+
+    def write(self, line):
+        stamp = line.split(b",", 1)[0].strip()
+        if stamp and not stamp.startswith(b"#"):
+            # only rotate where a new interval starts
+            if self.written >= self.size and stamp != self.stamp:
+                self.chunk.close()
+                self.chunk = None
+                self.index += 1
+            self.stamp = stamp
+        if self.chunk is None:
+            self._open()
+        self.chunk.write(line)
+        self.written += len(line)
+        self.raw += len(line)
+
+    def close(self):
+        if self.chunk is not None:
+            self.chunk.close()
+            self.chunk = None
+        files = chunk_files(self.path)
+        size = sum(os.path.getsize(f) for f in files)
+        logger.info(
+            "%s: %d chunks, %d bytes compressed from %d",
+            self.path,
+            len(files),
+            size,
+            self.raw,
+        )
@@ -0,0 +1,100 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import hashlib
+import json
+import logging
+import os
+from postprocessor.store import read_index, store_path
+
+logger = logging.getLogger("app")
+
+# an incremental run leaves a checkpoint next to metrics.csv: how far each
+# input was processed and the running state of the outputs, so that a rerun
+# on the grown capture only processes the intervals appended since
+checkpoint_file = "checkpoint.json"
+checkpoint_version = 3
+
+
+def checkpoint_path(run_dir):
+    return os.path.join(run_dir, checkpoint_file)
+
+
+# what a checkpoint is valid for, any change starts over
+def run_options(files, output, metric, **options):
+    with open(metric, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return {
+        "files": [os.path.abspath(f) for f in files],
+        "output": os.path.abspath(output),
+        "metric": digest,
+        **options,
+    }
+
+
+# identity of an input file, a new capture at the same path starts over.
+# inodes get reused, perf's "# started on" line tells captures apart
+def file_id(path):
+    st = os.stat(path)
+    with open(path, "rb") as f:
+        first = f.readline(256).decode(errors="replace")
+    return [st.st_dev, st.st_ino, first]
+
+
+# reason why a checkpoint can't be resumed from, None if it can
+def _stale(checkpoint, options):
+    if checkpoint.get("version") != checkpoint_version:
+        return "different version"
+    if checkpoint["options"] != options:
+        return "options or inputs changed"
+    for entry in checkpoint["inputs"]:
+        if not os.path.isfile(entry["file"]) or file_id(entry["file"]) != entry["id"]:
+            return f"{entry['file']} was replaced"
+        if os.path.getsize(entry["file"]) < entry["offset"]:
+            return f"{entry['file']} was truncated"
+    output = options["output"]
+    if not os.path.isfile(output) or os.path.getsize(output) < checkpoint["bytes"]:
+        return f"{output} changed"
+    try:
+        rows = read_index(store_path(os.path.dirname(output)))["rows"]
+    except (OSError, ValueError):
+        return "run store missing"
+    if rows < checkpoint["rows"]:
+        return "run store changed"
+    return None
+
+
+# load the checkpoint of a run, None if there is none or it is stale
+def load_checkpoint(run_dir, options):
+    path = checkpoint_path(run_dir)
+    try:
+        with open(path, "r") as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        logger.warning("checkpoint %s is corrupt, starting over", path)
+        return None
+    reason = _stale(checkpoint, options)
+    if reason is not None:
+        logger.info("checkpoint %s not used, %s", path, reason)
+        return None
+    logger.info("resuming from checkpoint %s, %d samples", path, checkpoint["rows"])
+    return checkpoint
+
+
+def save_checkpoint(run_dir, checkpoint):
+    path = checkpoint_path(run_dir)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"version": checkpoint_version, **checkpoint}, f, indent=1)
+    os.replace(path + ".tmp", path)
+    logger.debug("checkpoint: %s", path)
+
+
+# a full run makes an old checkpoint invalid
+def remove_checkpoint(run_dir):
+    try:
+        os.remove(checkpoint_path(run_dir))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,30 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import click
+from postprocessor.batch import batch
+from postprocessor.postprocess import main as run
+
+
+# postprocess [OPTIONS] FILES... processes one run like it always did,
+# postprocess batch DIRS... all the runs in DIRS. postprocess --help is the
+# group's, to list both
+class Commands(click.Group):
+    def parse_args(self, ctx, args):
+        if not args or args[0] not in [*self.commands, *ctx.help_option_names]:
+            args = ["run", *args]
+        return super().parse_args(ctx, args)
+
+
+main = Commands(
+    "postprocess",
+    commands={"run": run, "batch": batch},
+    help="Postprocess one run (run, the default command) or all the runs in "
+    "directories (batch)",
+    context_settings={"help_option_names": ["-h", "--help"]},
+)
+
+
+if __name__ == "__main__":
+    main()
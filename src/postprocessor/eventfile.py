@@ -0,0 +1,191 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import ast
+import hashlib
+import logging
+import os
+import pickle
+import sys
+from itertools import groupby
+from typing import NamedTuple
+
+logger = logging.getLogger("app")
+
+# parsed events files are cached by content, so the collector and every
+# postprocess run skip parsing them again
+cache_version = 2
+cache_dir = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+    "ampere-pmu-profiler",
+)
+_loaded: dict[str, "EventFile"] = {}  # by content hash
+
+
+class Event(NamedTuple):
+    name: str  # as written in the events file, e.g. cycles:k
+    code: str | None  # rNNN code after "|", used if perf doesn't know the name
+    pmu: str  # core or cmn
+    group: int  # number of {} groups closed before the event
+    grouped: bool  # inside {}
+
+
+class Metric(NamedTuple):
+    name: str
+    expression: str  # as written in the events file
+    events: list[str]  # referenced events and consts, in order of appearance
+    tree: ast.Expression | None  # _e<N> stands for events[N], None if invalid
+    uncore: bool  # after the uncore_metrics marker, not split per socket
+    references: list[str]  # events that name a metric defined before it
+
+
+class EventFile(NamedTuple):
+    events: list[Event]  # in file order
+    metrics: list[Metric]
+
+
+# parse an events file: events and {} groups up to the ";" line, metric
+# formulas after it. a formula can use the metrics defined above it like
+# events, [IPC] is the value of the IPC metric
+def parse_event_file(text):
+    # the metric engine loads numpy, a cached events file doesn't need it
+    from postprocessor.metrics import parse_formula
+
+    events: list[Event] = []
+    metrics: list[Metric] = []
+    group = 0
+    grouped = False
+    uncore = False
+    defined = set()  # metric names so far
+    lines = iter(text.splitlines())
+    for row in lines:
+        if row.startswith(";"):
+            break
+        line = row.strip()
+        if not line or line.startswith("#") or line in ("events_core", "events_cmn"):
+            continue
+        if line == "{":
+            grouped = True
+        elif line == "}":
+            group += 1
+            grouped = False
+        elif line.startswith("ARM_CMN"):
+            events.append(Event(line, None, "cmn", group, grouped))
+        else:
+            name, bar, code = line.partition("|")
+            code = code.strip() if bar else None
+            events.append(Event(name.strip(), code, "core", group, grouped))
+
+    for row in lines:
+        if "uncore_metrics" in row:
+            uncore = True
+        if not row.strip() or row.startswith("#"):
+            continue
+        fields = row.split("=")
+        if len(fields) < 2:
+            logger.warning("not a metric: %s", row.strip())
+            continue
+        expression = fields[1].strip()
+        formula, tree = parse_formula(expression)
+        name = fields[0].strip()
+        references = [e for e in formula if e in defined]
+        metrics.append(Metric(name, expression, formula, tree, uncore, references))
+        defined.add(name)
+    return EventFile(events, metrics)
+
+
+def _cache_file(digest):
+    version = f"{sys.version_info.major}{sys.version_info.minor}"
+    return os.path.join(cache_dir, f"{digest}-{cache_version}-py{version}.pickle")
+
+
+# a pickle runs code when loaded, so root (the collector runs under sudo)
+# only uses a cache that other users can't write: the directory and the
+# file owned by root, not group or world writable
+def _trusted(st):
+    return os.geteuid() != 0 or (st.st_uid == 0 and not st.st_mode & 0o022)
+
+
+# the cached model, None if there is none or it can't be used
+def _read_cache(cache):
+    try:
+        with open(cache, "rb") as f:
+            if not _trusted(os.fstat(f.fileno())):
+                logger.warning(
+                    "events file cache %s not used, not owned by root", cache
+                )
+                return None
+            return pickle.load(f)
+    except (OSError, pickle.PickleError, EOFError, AttributeError, ValueError):
+        return None
+
+
+def _write_cache(cache, model):
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(f"{cache}.{os.getpid()}", "wb") as f:
+            pickle.dump(model, f)
+        os.replace(f"{cache}.{os.getpid()}", cache)
+    except OSError as e:
+        logger.debug("events file not cached: %s", e)
+
+
+# the parsed model of an events file, from the cache if it was parsed before
+def load_event_file(path):
+    with open(path, "rb") as f:
+        content = f.read()
+    digest = hashlib.sha256(content).hexdigest()
+    if digest in _loaded:
+        return _loaded[digest]
+    cache = _cache_file(digest)
+    try:
+        trusted = _trusted(os.stat(cache_dir))
+    except OSError:
+        trusted = True  # created by this process
+    if not trusted:
+        logger.debug("events file cache %s not used, not owned by root", cache_dir)
+    model = _read_cache(cache) if trusted else None
+    if model is not None:
+        logger.debug("events file %s loaded from %s", path, cache)
+    else:
+        model = parse_event_file(content.decode())
+        if trusted:
+            _write_cache(cache, model)
+    _loaded[digest] = model
+    return model
+
+
+# runs of events collected together: the events of a {} group, or a
+# single event outside of groups
+def event_groups(events):
+    for (_, grouped), run in groupby(events, lambda e: (e.group, e.grouped)):
+        if grouped:
+            yield list(run)
+        else:
+            yield from ([event] for event in run)
+
+
+# the events of a metric prefixed with a socket. like the formulas always
+# were, only the events before the first constant get the prefix. metrics
+# used in the formula always do, they refer to the same socket's metric
+def socket_events(metric, socket):
+    if not socket:
+        return metric.events
+    events = metric.events
+    first = next((i for i, e in enumerate(events) if e.startswith("const")), None)
+    first = len(events) if first is None else first
+    return [
+        socket + e if i < first or e in metric.references else e
+        for i, e in enumerate(events)
+    ]
+
+
+# the formula of a metric with its events replaced
+def rename_events(metric, events):
+    from postprocessor.metrics import event_pattern
+
+    if events == metric.events:
+        return metric.expression
+    names = dict(zip(metric.events, events))
+    return event_pattern.sub(lambda m: f"[{names[m.group(1)]}]", metric.expression)
@@ -0,0 +1,92 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import logging
+import re
+import numpy as np
+from postprocessor import postprocess
+from postprocessor.perfstat import parse_records, transpose_records
+
+logger = logging.getLogger("app")
+
+# metrics shown while collecting, when the events file has them. besides
+# these, the mpki metrics and level 1 TDA metrics (one trailing ".") are shown
+summary_names = ("IPC", "cpu_freq")
+
+
+def is_summary(name):
+    name = re.sub(r"^s\d+\.", "", name)
+    return name in summary_names or "mpki" in name or name.endswith("_.")
+
+
+# evaluates the metrics of an events file on perf stat -x, output one
+# interval at a time, while perf is still running. an interval is complete
+# once it has as many lines as the first one, which is only known when the
+# second one starts. the events file and constants are its own, postprocess
+# runs in the same process aren't affected
+class LiveMetrics:
+    def __init__(self, metric_file, cores, duration, persocket):
+        self.metric_file = str(metric_file)
+        self.consts = dict(
+            postprocess.constdict,
+            const_cpus=cores,
+            const_wall_clock_time=float(duration),
+        )
+        self.code_names = postprocess.get_code_names_from_eventfile(self.metric_file)
+        self.event_mapping, _ = postprocess.get_event_mappings(self.metric_file)
+        self.persocket = persocket
+        self.lines: list[bytes] = []  # of the interval being read
+        self.stamp = None
+        self.expected = None  # lines per interval
+        self.header = None
+        self.plan = None
+        self.program = None
+        self.timestamp = 0.0  # of the last interval evaluated
+
+    # names of the metrics evaluated, known after the first interval
+    @property
+    def names(self):
+        return [m.metric.name for m in self.plan] if self.plan is not None else []
+
+    # add a line of perf output. returns the (time, metric values) of the
+    # intervals it completed
+    def feed(self, line):
+        stamp = line.split(b",", 1)[0].strip()
+        if not stamp or stamp.startswith(b"#"):
+            return []
+        done = []
+        if self.lines and stamp != self.stamp:
+            done.append(self._evaluate())
+        self.stamp = stamp
+        self.lines.append(line)
+        if self.expected is not None and len(self.lines) >= self.expected:
+            done.append(self._evaluate())
+        return [d for d in done if d is not None]
+
+    def _evaluate(self):
+        data = np.frombuffer(b"".join(self.lines), dtype=np.uint8)
+        lines = len(self.lines)
+        self.lines = []
+        header, matrix = transpose_records(
+            parse_records(data, self.persocket), self.code_names, self.persocket, True
+        )
+        if not len(matrix):
+            return None
+        if self.plan is None:
+            self.header, self.expected = header, lines
+            compiled = postprocess.read_metrics(
+                header[1:], self.persocket, self.metric_file
+            )
+            self.plan = postprocess.build_metric_plan(
+                compiled, header[1:], self.event_mapping, self.consts
+            )
+            self.program = postprocess.compile_program(self.plan, self.consts)
+        width = min(len(self.header), matrix.shape[1])
+        row = np.full((1, len(self.header)), np.nan)
+        row[0, :width] = matrix[0, :width]
+        _, values, _ = postprocess.evaluate_chunk(
+            self.program, self.consts, row, self.timestamp
+        )
+        self.timestamp = row[0, 0]
+        return row[0, 0], values[0, 1 : 1 + len(self.plan)]
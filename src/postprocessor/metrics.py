@@ -0,0 +1,289 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import ast
+import functools
+import logging
+import operator
+import re
+from typing import NamedTuple
+from types import CodeType
+import numpy as np
+
+logger = logging.getLogger("app")
+
+# [event] references inside a metric formula
+event_pattern = re.compile(r"\[([^\[\]]+)\]")
+
+
+class CompiledMetric(NamedTuple):
+    name: str
+    expression: str
+    events: list[str]  # referenced events/consts, _e<N> in the code is events[N]
+    code: CodeType | None  # None if the formula doesn't parse
+    tree: ast.Expression | None = None  # what code was compiled from
+
+    # code objects can't be pickled, worker processes compile the formula again
+    def __reduce__(self):
+        return (compile_metric, (self.name, self.expression))
+
+
+# route every division through _div() so zero denominators can be tracked
+class _TrackDivision(ast.NodeTransformer):
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Div):
+            call = ast.Call(
+                func=ast.Name(id="_div", ctx=ast.Load()),
+                args=[node.left, node.right],
+                keywords=[],
+            )
+            return ast.copy_location(call, node)
+        return node
+
+
+# parse a formula into an expression tree with _e<N> placeholders for its
+# events. returns the events and the tree, None if it doesn't parse
+def parse_formula(expression):
+    events: list[str] = []
+
+    def placeholder(match):
+        event = match.group(1)
+        if event not in events:
+            events.append(event)
+        return f"_e{events.index(event)}"
+
+    source = event_pattern.sub(placeholder, expression)
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError:
+        return events, None
+    return events, ast.fix_missing_locations(_TrackDivision().visit(tree))
+
+
+# compile a parsed formula into a column-wise expression
+def compile_tree(name, expression, events, tree):
+    if tree is None:
+        logger.error("Syntax error evaluating %s", expression)
+        return CompiledMetric(name, expression, events, None)
+    code = compile(tree, f"<metric {name}>", "eval")
+    return CompiledMetric(name, expression, events, code, tree)
+
+
+# compile a formula once into a column-wise expression
+@functools.cache
+def compile_metric(name, expression):
+    return compile_tree(name, expression, *parse_formula(expression))
+
+
+# a / b with zero denominators replaced by 1. returns the quotient and the
+# denominators that were zero, None if there were none
+def divide(a, b):
+    b = np.asarray(b, dtype=np.float64)
+    hit = b == 0
+    if not hit.any():
+        return np.true_divide(a, b), None
+    return np.true_divide(a, np.where(hit, 1.0, b)), hit
+
+
+# evaluate a compiled metric over whole columns at once.
+# inputs maps each referenced event/const to an array (one value per sample)
+# or a scalar. returns the values and a mask of samples that divided by zero
+def evaluate_metric(metric, inputs, rows):
+    zero = np.zeros(rows, dtype=bool)
+
+    def _div(a, b):
+        nonlocal zero
+        values, hit = divide(a, b)
+        if hit is not None:
+            zero = zero | hit
+        return values
+
+    namespace = {f"_e{i}": inputs[e] for i, e in enumerate(metric.events)}
+    namespace["_div"] = _div
+    with np.errstate(all="ignore"):
+        values = eval(metric.code, {"__builtins__": {}}, namespace)  # nosec B307
+    values = np.broadcast_to(np.asarray(values, dtype=np.float64), (rows,))
+    return values, zero
+
+
+binary_ops = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+unary_ops = {ast.USub: operator.neg, ast.UAdd: operator.pos}
+
+
+# the metrics of a run compiled into one graph of operations. a metric's
+# formula can use metrics defined before it, and equal subexpressions (the
+# same operation on the same inputs) are a single node, so each is computed
+# once per chunk whichever metrics use it. nodes come after their inputs:
+#   ("column", i)  ("const", name)  ("sampletime",)  ("number", type, value)
+#   ("div", a, b)  ("binary", op, a, b)  ("unary", op, a)
+#   ("eval", metric, args)  formulas using other operations, evaluated whole
+class MetricProgram(NamedTuple):
+    nodes: list[tuple]
+    outputs: list[int | None]  # node of each metric, None if not evaluated
+    expressions: list[str]  # of each metric, for messages
+
+
+# plan is a list of (metric, columns, references) with the raw data column
+# of each event (None if one isn't collected) and the plan index of the
+# metrics referenced. consts are the names of constants
+def compile_program(plan, consts):
+    nodes: list[tuple] = []
+    ids: dict[tuple, int] = {}
+
+    def node(*key):
+        if key not in ids:
+            ids[key] = len(nodes)
+            nodes.append(key)
+        return ids[key]
+
+    def walk(tree, args):
+        if isinstance(tree, ast.Expression):
+            return walk(tree.body, args)
+        if isinstance(tree, ast.Name) and tree.id in args:
+            return args[tree.id]
+        if isinstance(tree, ast.Constant) and type(tree.value) in (int, float):
+            return node("number", type(tree.value), tree.value)
+        if (
+            isinstance(tree, ast.Call)
+            and isinstance(tree.func, ast.Name)
+            and tree.func.id == "_div"
+            and len(tree.args) == 2
+        ):
+            return node("div", walk(tree.args[0], args), walk(tree.args[1], args))
+        if isinstance(tree, ast.BinOp) and type(tree.op) in binary_ops:
+            op = binary_ops[type(tree.op)]
+            return node("binary", op, walk(tree.left, args), walk(tree.right, args))
+        if isinstance(tree, ast.UnaryOp) and type(tree.op) in unary_ops:
+            return node("unary", unary_ops[type(tree.op)], walk(tree.operand, args))
+        raise ValueError(ast.dump(tree))
+
+    outputs: list[int | None] = []
+    for resolved in plan:
+        metric, columns, references = resolved
+        inputs: list[int | None] = []
+        for event in metric.events:
+            if event in references:
+                inputs.append(outputs[references[event]])
+            elif event == "const_sampletime":
+                inputs.append(node("sampletime"))
+            elif event in consts:
+                inputs.append(node("const", event))
+            elif columns is not None:
+                inputs.append(node("column", columns[event]))
+            else:
+                inputs.append(None)
+        if metric.code is None or None in inputs:
+            outputs.append(None)
+            continue
+        args = {f"_e{i}": n for i, n in enumerate(inputs)}
+        try:
+            outputs.append(walk(metric.tree, args))
+        except ValueError:
+            outputs.append(node("eval", metric, tuple(inputs)))
+    logger.debug("%d metrics, %d operations", len(plan), len(nodes))
+    return MetricProgram(nodes, outputs, [m.metric.expression for m in plan])
+
+
+# run a program over a chunk of samples (time first). returns the values
+# and divide by zero mask of every metric, None for metrics not evaluated
+def run_program(program, data, sampletime, consts):
+    rows = len(data)
+    values: list = [None] * len(program.nodes)  # None if it failed
+    zeros: list = [None] * len(program.nodes)  # None if nothing divided by 0
+
+    def either(*masks):
+        masks = [m for m in masks if m is not None]
+        return functools.reduce(np.logical_or, masks) if masks else None
+
+    with np.errstate(all="ignore"):
+        for i, node in enumerate(program.nodes):
+            kind = node[0]
+            if kind == "column":
+                values[i] = data[:, node[1]]
+            elif kind == "const":
+                values[i] = consts[node[1]]
+            elif kind == "sampletime":
+                values[i] = sampletime
+            elif kind == "number":
+                values[i] = node[2]
+            else:
+                # input nodes: (div, a, b), (binary/unary, op, ...), (eval, metric, args)
+                args = node[1:] if kind == "div" else node[2:]
+                if kind == "eval":
+                    args = node[2]
+                if any(values[a] is None for a in args):
+                    continue
+                try:
+                    if kind == "div":
+                        values[i], hit = divide(values[args[0]], values[args[1]])
+                        if hit is not None:
+                            hit = np.broadcast_to(hit, (rows,))
+                    elif kind == "eval":
+                        metric = node[1]
+                        inputs = {e: values[a] for e, a in zip(metric.events, args)}
+                        values[i], hit = evaluate_metric(metric, inputs, rows)
+                        if not hit.any():
+                            hit = None
+                    else:
+                        values[i] = node[1](*(values[a] for a in args))
+                        hit = None
+                except Exception:
+                    logger.exception("Unknown error evaluating metrics")
+                    continue
+                zeros[i] = either(hit, *(zeros[a] for a in args))
+
+    results = []
+    for output in program.outputs:
+        if output is None or values[output] is None:
+            results.append(None)
+            continue
+        value = np.broadcast_to(np.asarray(values[output], dtype=np.float64), (rows,))
+        zero = zeros[output]
+        results.append((value, np.zeros(rows, dtype=bool) if zero is None else zero))
+    return results
+
+
+# format metric values the way metrics.csv always had them: 4 decimals,
+# "0" where the formula divided by zero and "" where an input was missing
+def format_metric(values, zero):
+    out = ["{:.4f}".format(v) for v in values.tolist()]
+    for i in np.flatnonzero(zero):
+        out[i] = "0"
+    for i in np.flatnonzero(np.isnan(values)):
+        out[i] = ""
+    return out
+
+
+# raw counters are written as rounded integers, "" if not a number
+def format_counters(values):
+    out = [""] * len(values)
+    finite = np.isfinite(values)
+    rounded = np.rint(values[finite]).tolist()
+    for i, v in zip(np.flatnonzero(finite).tolist(), rounded):
+        out[i] = str(int(v))
+    return out
+
+
+# convert csv rows into a float matrix, unparsable or missing cells become NaN
+def to_matrix(rows, width):
+    try:
+        return np.array(rows, dtype=np.float64).reshape(len(rows), width)
+    except ValueError:
+        pass
+    matrix = np.full((len(rows), width), np.nan)
+    for i, row in enumerate(rows):
+        for j, cell in enumerate(row[:width]):
+            try:
+                matrix[i, j] = float(cell)
+            except ValueError:
+                pass
+    return matrix
@@ -0,0 +1,164 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import json
+import logging
+import os
+from collections import Counter
+from typing import NamedTuple
+import numpy as np
+from collector.cpu import cpu_sockets
+from postprocessor.perfstat import read_records
+from postprocessor.store import core_store_path, read_column, read_index
+
+logger = logging.getLogger("app")
+
+
+# the counters of consecutive intervals of a perf stat -A capture. they are
+# kept as intervals x cores x counters arrays from parsing to the store, the
+# aggregate and per socket samples are sums over groups of cores of them
+class CoreCounters(NamedTuple):
+    time: np.ndarray  # of each interval
+    cores: list[int]  # cpu numbers, ascending
+    header: list[str]  # counter names, in the order perf printed them
+    values: np.ndarray  # (intervals, cores, counters), NaN if not printed
+
+
+# the cpu number of a perf stat -A label like CPU12, -1 if it has none
+def cpu_number(label):
+    digits = label[len(label.rstrip("0123456789")) :]
+    return int(digits) if digits else -1
+
+
+# arrange the lines of a perf stat -A capture by interval, core and position
+# among the core's lines of the interval. like transpose_records, the names
+# are those of the first interval, and the last interval is only kept if
+# complete is set
+def core_counters(records, code_names, complete):
+    time = records.time
+    start = np.flatnonzero(np.concatenate(([True], time[1:] != time[:-1])))
+    cores = sorted(cpu_number(label) for label in records.sockets)
+    if len(time) == 0 or (not complete and len(start) < 2):
+        return CoreCounters(np.empty(0), cores, [], np.empty((0, len(cores), 0)))
+    if not complete:
+        lines = start[-1]
+        start = start[:-1]
+    else:
+        lines = len(time)
+    interval = np.repeat(np.arange(len(start)), np.diff(np.append(start, lines)))
+    rank = np.argsort([cpu_number(label) for label in records.sockets])
+    order = np.empty(len(rank), dtype=np.intp)
+    order[rank] = np.arange(len(rank))
+    core = order[records.socket[:lines]]
+
+    # lines of one core in one interval are consecutive after a stable sort
+    key = interval * len(cores) + core
+    lines_by_key = np.argsort(key, kind="stable")
+    sorted_key = key[lines_by_key]
+    first = np.flatnonzero(np.concatenate(([True], sorted_key[1:] != sorted_key[:-1])))
+    length = np.diff(np.append(first, lines))
+    position = np.empty(lines, dtype=np.intp)
+    position[lines_by_key] = np.arange(lines) - np.repeat(first, length)
+
+    values = np.full((len(start), len(cores), int(length.max())), np.nan)
+    values[interval, core, position] = records.value[:lines]
+    header = []
+    for i in lines_by_key[first[0] : first[0] + length[0]]:
+        # events collected in rNNN format are replaced with their name
+        event = records.events[records.event[i]]
+        header.append(code_names.get(event, event))
+    return CoreCounters(time[start], cores, header, values)
+
+
+# parse one segment of a perf stat -A file, may run in a worker process
+def parse_core_segment(infile, code_names, start, end, complete):
+    records = read_records(infile, "core", start, end)
+    return core_counters(records, code_names, complete)
+
+
+# the counters saved by the collector's perf_event_open backend, a capture
+# of every core already in arrays
+def load_counters(path):
+    with np.load(path) as data:
+        return CoreCounters(
+            data["time"],
+            data["cores"].tolist(),
+            data["header"].tolist(),
+            data["values"],
+        )
+
+
+# the values of counters rearranged to the given cores and number of
+# counters, cores or counters a segment doesn't have are NaN
+def align(counters, cores, width):
+    values = counters.values
+    if counters.cores == cores and values.shape[2] == width:
+        return values
+    aligned = np.full((len(values), len(cores), width), np.nan)
+    column = {core: i for i, core in enumerate(cores)}
+    found = [(column[c], i) for i, c in enumerate(counters.cores) if c in column]
+    if len(found) < len(counters.cores):
+        logger.warning("cpus %s weren't in the first interval", counters.cores)
+    if found:
+        to, src = map(list, zip(*found))
+        shared = min(width, values.shape[2])
+        aligned[:, to, :shared] = values[:, src, :shared]
+    return aligned
+
+
+# sums of the counters of groups of cores (lists of core indices) as
+# (intervals, groups, counters). a sum is NaN if no core of the group has
+# the counter
+def group_sums(values, groups):
+    sums = np.empty((len(values), len(groups), values.shape[2]))
+    for g, group in enumerate(groups):
+        part = values[:, group]
+        sums[:, g] = np.nansum(part, axis=1)
+        sums[:, g][np.isnan(part).all(axis=1)] = np.nan
+    return sums
+
+
+# the socket of each cpu: from run.json of the run if the collector recorded
+# it, else from this machine's topology, else the cpus split in two halves
+def core_sockets(cores, run_dir=None):
+    try:
+        with open(os.path.join(run_dir or "", "run.json")) as f:
+            recorded = json.load(f).get("core_sockets") or {}
+        return [int(recorded[str(core)]) for core in cores]
+    except (OSError, ValueError, KeyError):
+        pass
+    sockets = cpu_sockets(cores)
+    if sockets is not None:
+        logger.info("socket of each cpu read from this machine")
+        return sockets
+    logger.warning("socket of the cpus unknown, splitting them in two halves")
+    return [0 if i < len(cores) / 2 else 1 for i in range(len(cores))]
+
+
+# the samples of a per-core store
+class CoreRun(NamedTuple):
+    time: np.ndarray
+    cores: list[int]
+    columns: dict[str, np.ndarray]  # name -> (samples, cores)
+
+
+# load the per-core store of a run, memory mapped. only the requested
+# columns are read, repeated names are numbered like in read_run
+def read_cores(run_dir, columns=None):
+    path = core_store_path(run_dir)
+    index = read_index(path)
+    cores = index["cores"]
+    time = np.empty(0)
+    data = {}
+    seen: Counter[str] = Counter()
+    for column in index["columns"]:
+        name = column["name"]
+        if seen[name]:
+            name = f"{name}.{seen[name]}"
+        seen[column["name"]] += 1
+        if column["kind"] == "time":
+            time = read_column(path, column, index["rows"])
+        elif columns is None or name in columns:
+            data[name] = read_column(path, column, index["rows"], len(cores))
+    return CoreRun(time, cores, data)
@@ -0,0 +1,227 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import mmap
+from typing import NamedTuple
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from postprocessor.capture import is_chunk, read_chunk
+
+newline = ord("\n")
+comma = ord(",")
+comment = ord("#")
+not_counted = ord("<")
+# masks of the n low bytes of a uint64, n = 0..8
+low_bytes = np.array([(1 << 8 * n) - 1 for n in range(9)], dtype=np.uint64)
+
+# field positions in perf stat -x, lines, by layout:
+#   time,value,unit,event,...  (False)
+#   time,socket,cpus,value,unit,event,...  (True, --per-socket)
+#   time,cpu,value,unit,event,...  ("core", -A)
+fields = {
+    False: {"time": 0, "value": 1, "event": 3},
+    True: {"time": 0, "socket": 1, "value": 3, "event": 5},
+    "core": {"time": 0, "socket": 1, "value": 2, "event": 4},
+}
+
+
+# counter lines of a perf stat file, one entry per line
+class StatRecords(NamedTuple):
+    time: np.ndarray  # float64 timestamp, as printed by perf
+    socket: np.ndarray  # index into sockets (cpus with -A), 0 without either
+    event: np.ndarray  # index into events
+    value: np.ndarray  # float64, 0 for <not counted> or <not supported>
+    sockets: list[str]  # in order of first appearance
+    events: list[str]
+
+
+# move [lo, hi) field bounds past leading and trailing whitespace
+def _strip(data, lo, hi):
+    last = len(data) - 1
+    while True:
+        space = (lo < hi) & (data[np.minimum(lo, last)] <= 32)
+        if not space.any():
+            break
+        lo = lo + space
+    while True:
+        space = (hi > lo) & (data[np.maximum(hi - 1, 0)] <= 32)
+        if not space.any():
+            break
+        hi = hi - space
+    return lo, hi
+
+
+# copy the [lo, hi) fields of data into rows of a (fields, width) byte
+# matrix, zero padded to a multiple of 8 bytes. data must extend at least
+# that far past every lo
+def _gather(data, lo, hi):
+    length = hi - lo
+    words = (max(int(length.max(initial=0)), 1) + 7) // 8
+    cells = sliding_window_view(data, 8 * words)[lo]
+    packed = cells.view("<u8")
+    for i in range(words):
+        packed[:, i] &= low_bytes[np.clip(length - 8 * i, 0, 8)]
+    return cells
+
+
+# view gathered cells as a bytes array, one item per field
+def _as_bytes(cells):
+    return np.ascontiguousarray(cells).view(f"S{cells.shape[1]}").ravel()
+
+
+# convert bytes cells to float, cells that don't parse become default
+def _to_float(cells, default):
+    try:
+        return cells.astype(np.float64)
+    except ValueError:
+        pass
+    out = np.empty(len(cells))
+    for i, cell in enumerate(cells.tolist()):
+        try:
+            out[i] = float(cell)
+        except ValueError:
+            out[i] = default
+    return out
+
+
+# parse counter values, "<not counted>" or "<not supported>" count as 0
+def _to_values(data, lo, hi):
+    text = _as_bytes(_gather(data, lo, hi))
+    text[data[lo] == not_counted] = b"0"
+    return _to_float(text, 0.0)
+
+
+# number equal cells in order of first appearance
+def _labels(cells):
+    _, first, inverse = np.unique(
+        _as_bytes(cells), return_index=True, return_inverse=True
+    )
+    inverse = inverse.ravel()
+    order = np.argsort(first, kind="stable")
+    rank = np.empty(len(order), dtype=np.intp)
+    rank[order] = np.arange(len(order))
+    names = _as_bytes(cells[first[order]]).tolist()
+    labels = [n.decode(errors="replace") for n in names]
+    return rank[inverse], labels
+
+
+def _no_records():
+    empty = np.empty(0)
+    index = np.empty(0, dtype=np.intp)
+    return StatRecords(empty, index, index, empty, [], [])
+
+
+# tokenize perf stat -x, output in bulk. data is a uint8 array of whole lines,
+# comment lines, lines with too few fields and counters without a value or
+# name are skipped, as are lines whose timestamp doesn't parse. layout is a
+# key of fields
+def parse_records(data, layout):
+    field = fields[layout]
+    split = "socket" in field  # per socket or cpu
+    # every comma and newline, the fields of a line lie between its separators
+    sep = np.append(np.flatnonzero((data == comma) | (data == newline)), len(data))
+    line_end = np.flatnonzero(np.append(data[sep[:-1]] == newline, True))
+    first = np.concatenate(([0], line_end[:-1] + 1))
+    count = line_end - first
+    starts = np.concatenate(([0], sep[line_end[:-1]] + 1))
+    ends = sep[line_end]
+    keep = (ends > starts) & (count >= max(field.values()))
+    keep[keep] = data[starts[keep]] != comment
+    starts, ends, first = starts[keep], ends[keep], first[keep]
+    if not len(starts):
+        return _no_records()
+    # zeros after data leave room for gathering fixed width cells
+    pad = int((ends - starts).max()) + 8
+    data = np.concatenate((data, np.zeros(pad, np.uint8)))
+
+    def bounds(k):
+        lo = starts if k == 0 else sep[first + k - 1] + 1
+        return lo, sep[first + k]
+
+    time_lo, time_hi = bounds(field["time"])
+    value_lo, value_hi = _strip(data, *bounds(field["value"]))
+    event_lo, event_hi = _strip(data, *bounds(field["event"]))
+    keep = (value_hi > value_lo) & (event_hi > event_lo)
+    if not keep.any():
+        return _no_records()
+    if split:
+        socket_lo, socket_hi = _strip(data, *bounds(field["socket"]))
+        socket_lo, socket_hi = socket_lo[keep], socket_hi[keep]
+    time_lo, time_hi = time_lo[keep], time_hi[keep]
+    value_lo, value_hi = value_lo[keep], value_hi[keep]
+    event_lo, event_hi = event_lo[keep], event_hi[keep]
+
+    # lines of an interval share their timestamp, parse each run of equal
+    # stamps once. they're kept as printed, intervals of a few ms apart
+    # mustn't collide and the rate metrics divide by their differences
+    stamps = _as_bytes(_gather(data, time_lo, time_hi))
+    run = np.flatnonzero(np.concatenate(([True], stamps[1:] != stamps[:-1])))
+    parsed = _to_float(stamps[run], np.nan)
+    time = np.repeat(parsed, np.diff(np.append(run, len(stamps))))
+
+    value = _to_values(data, value_lo, value_hi)
+    event, events = _labels(_gather(data, event_lo, event_hi))
+    if split:
+        socket, sockets = _labels(_gather(data, socket_lo, socket_hi))
+    else:
+        socket, sockets = np.zeros(len(time), dtype=np.intp), [""]
+
+    parsed = ~np.isnan(time)
+    if not parsed.all():
+        time, value = time[parsed], value[parsed]
+        event, socket = event[parsed], socket[parsed]
+    return StatRecords(time, socket, event, value, sockets, events)
+
+
+# read the [start, end) byte range of a perf stat file through mmap. a
+# compressed chunk is read whole
+def read_records(infile, layout, start=0, end=None):
+    if is_chunk(infile):
+        data = np.frombuffer(read_chunk(infile), dtype=np.uint8)
+        return parse_records(data, layout)
+    with open(infile, "rb") as fin:
+        size = fin.seek(0, 2)
+        end = size if end is None else end
+        if end <= start:
+            return parse_records(np.empty(0, dtype=np.uint8), layout)
+        with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = np.frombuffer(mm, dtype=np.uint8, count=end - start, offset=start)
+            try:
+                return parse_records(data, layout)
+            finally:
+                del data
+
+
+# one row per interval with the counters in the order perf printed them.
+# returns the column names (of the first interval) and a matrix with the
+# timestamp first, intervals with fewer counters are padded with NaN. the
+# last interval is only kept if complete is set, perf may have been stopped
+# while writing it
+def transpose_records(records, code_names, persocket, complete):
+    time = records.time
+    start = np.flatnonzero(np.concatenate(([True], time[1:] != time[:-1])))
+    if len(time) == 0 or (not complete and len(start) < 2):
+        return [], np.empty((0, 1))
+    if not complete:
+        lines = start[-1]
+        start = start[:-1]
+    else:
+        lines = len(time)
+    length = np.diff(np.append(start, lines))
+    interval = np.repeat(np.arange(len(start)), length)
+    position = np.arange(lines) - np.repeat(start, length)
+
+    matrix = np.full((len(start), 1 + int(length.max())), np.nan)
+    matrix[:, 0] = time[start]
+    matrix[interval, position + 1] = records.value[:lines]
+
+    header = ["time"]
+    for i in range(length[0]):
+        # events collected in rNNN format are replaced with their name
+        event = records.events[records.event[i]]
+        name = code_names.get(event, event)
+        if persocket:
+            name = f"s{records.socket[i]}.{name}"
+        header.append(name)
+    return header, matrix
@@ -7,12 +7,15 @@
 ###########################################################################
 
 import os
-import sys
 from datetime import datetime
-from plotly import graph_objects as go
+import numpy as np
 import pandas as pd
+from plotly import graph_objects as go
 from plotly.subplots import make_subplots
 import click
+from collector import timing
+from postprocessor.report import write_figure
+from postprocessor.store import read_run
 
 report_dir = ""
 data_dir = "data"
@@ -32,6 +35,90 @@ titles = (
     "<b>CCIX Bandwidth",
 )
 html_rows = len(titles)
+max_points = 2000  # per trace, longer runs are downsampled for the report
+
+# metrics.csv columns used by the report
+plot_columns = (
+    "cpu_freq",
+    "IPC",
+    "IPC_kernel",
+    "branch_mispredict%",
+    "dtlb_walk%",
+    "itlb_walk%",
+    "dtlb_mpki",
+    "itlb_mpki",
+    "branch_mpki",
+    "l1d_miss%",
+    "l1i_miss%",
+    "l2_miss%",
+    "l1d_mpki",
+    "l1i_mpki",
+    "l2_mpki",
+    "frontend_stall%",
+    "backend_stall%",
+    "stall_frontend%",
+    "stall_frontend_lat%",
+    "stall_frontend_cache%",
+    "stall_frontend_tlb%",
+    "stall_frontend_recovery%",
+    "stall_fronetend_bob%",
+    "stall_backend%",
+    "stall_backend_tlb%",
+    "stall_backend_l1d%",
+    "stall_backend_l2d%",
+    "stall_backend_core%",
+    "stall_backend_res%",
+    "stall_backend_rob%",
+    "stall_backend_ixu%",
+    "stall_backend_fsu%",
+    "stall_backend_lob%",
+    "stall_backend_sob%",
+    "slc_miss%",
+    "memrd_bw_GBps",
+    "memwr_bw_GBps",
+    "ccix_in_bw_MBps",
+    "ccix_out_bw_MBps",
+)
+
+
+# reduce the samples to at most points rows for the report. the samples are
+# split in points/2 buckets of consecutive samples, every column keeps its
+# min and max of each bucket in the order they occurred. their times differ
+# between columns, a column's are in "<name>.time" (see times()), "time" has
+# the first and last sample of each bucket. peaks stay visible where they
+# occurred and the report size doesn't depend on the length of the run,
+# metrics.csv and the store keep every sample
+def downsample(df, points=max_points):
+    if not points or len(df) <= points:
+        return df
+    width = -(-len(df) // (points // 2))
+    buckets = -(-len(df) // width)
+    names = [c for c in df.columns if c != "time"]
+    values = df[names].to_numpy(dtype=np.float64, na_value=np.nan)
+    padding = np.full((buckets * width - len(df), len(names)), np.nan)
+    values = np.concatenate((values, padding)).reshape(buckets, width, len(names))
+    missing = np.isnan(values)
+    low = np.where(missing, np.inf, values).argmin(axis=1)
+    high = np.where(missing, -np.inf, values).argmax(axis=1)
+    rows = np.arange(buckets)[:, None]
+    columns = np.arange(len(names))
+    # the sample of each kept value, padding is only picked in an empty bucket
+    picked = np.stack((np.minimum(low, high), np.maximum(low, high)), axis=1)
+    out = values[rows[:, :, None], picked, columns]
+    time = df["time"].to_numpy(dtype=np.float64)
+    samples = np.minimum(rows[:, :, None] * width + picked, len(df) - 1)
+    last = np.minimum(np.arange(1, buckets + 1) * width, len(df)) - 1
+    data = {"time": np.column_stack((time[::width], time[last])).ravel()}
+    for i, name in enumerate(names):
+        data[name] = out[:, :, i].ravel()
+        data[f"{name}.time"] = time[samples[:, :, i].ravel()]
+    return pd.DataFrame(data)
+
+
+# the times of the values of a column, of its own if it was downsampled
+def times(df, name):
+    column = f"{name}.time"
+    return df[column] if column in df.columns else df["time"]
 
 
 def add_metrics(fig, data, y_title, y_range, row_index, col_index):
@@ -41,7 +128,9 @@ def add_metrics(fig, data, y_title, y_range, row_index, col_index):
     )
 
 
-def generate_graph(data_dir, report_dir, filepath, metrics_df, workload_tag=None):
+def generate_graph(
+    data_dir, report_dir, filepath, metrics_df, workload_tag=None, samples=None
+):
 
     fig = make_subplots(
         rows=html_rows, cols=1, vertical_spacing=0.05, subplot_titles=titles
@@ -53,23 +142,55 @@ def generate_graph(data_dir, report_dir, filepath, metrics_df, workload_tag=None
 
     # core metrics
     ts = metrics_df["time"]
-    freq = go.Scatter(x=ts, y=metrics_df["cpu_freq"], name="Core-Freq")
-    ipc = go.Scatter(x=ts, y=metrics_df["IPC"], name="IPC")
-    ipc_k = go.Scatter(x=ts, y=metrics_df["IPC_kernel"], name="IPC_kernel")
-    br_mis = go.Scatter(
-        x=ts, y=metrics_df["branch_mispredict%"], name="Branch MisPrediction"
+    if any(c.endswith(".time") for c in metrics_df.columns):
+        ts = None  # downsampled, each trace has its own times
+    freq = go.Scattergl(
+        x=times(metrics_df, "cpu_freq"), y=metrics_df["cpu_freq"], name="Core-Freq"
+    )
+    ipc = go.Scattergl(x=times(metrics_df, "IPC"), y=metrics_df["IPC"], name="IPC")
+    ipc_k = go.Scattergl(
+        x=times(metrics_df, "IPC_kernel"), y=metrics_df["IPC_kernel"], name="IPC_kernel"
+    )
+    br_mis = go.Scattergl(
+        x=times(metrics_df, "branch_mispredict%"),
+        y=metrics_df["branch_mispredict%"],
+        name="Branch MisPrediction",
+    )
+    dtlb_miss = go.Scattergl(
+        x=times(metrics_df, "dtlb_walk%"), y=metrics_df["dtlb_walk%"], name="DTLB Walk"
+    )
+    itlb_miss = go.Scattergl(
+        x=times(metrics_df, "itlb_walk%"), y=metrics_df["itlb_walk%"], name="ITLB Walk"
+    )
+    dtlb_mpki = go.Scattergl(
+        x=times(metrics_df, "dtlb_mpki"), y=metrics_df["dtlb_mpki"], name="DTLB MPKI"
+    )
+    itlb_mpki = go.Scattergl(
+        x=times(metrics_df, "itlb_mpki"), y=metrics_df["itlb_mpki"], name="ITLB MPKI"
+    )
+    br_mpki = go.Scattergl(
+        x=times(metrics_df, "branch_mpki"),
+        y=metrics_df["branch_mpki"],
+        name="Branch MPKI",
+    )
+    l1d_miss = go.Scattergl(
+        x=times(metrics_df, "l1d_miss%"), y=metrics_df["l1d_miss%"], name="L1-D Miss%"
+    )
+    l1i_miss = go.Scattergl(
+        x=times(metrics_df, "l1i_miss%"), y=metrics_df["l1i_miss%"], name="L1-I Miss%"
+    )
+    l2_miss = go.Scattergl(
+        x=times(metrics_df, "l2_miss%"), y=metrics_df["l2_miss%"], name="L2 Miss%"
+    )
+    l1d_mpki = go.Scattergl(
+        x=times(metrics_df, "l1d_mpki"), y=metrics_df["l1d_mpki"], name="L1-D MPKI"
+    )
+    l1i_mpki = go.Scattergl(
+        x=times(metrics_df, "l1i_mpki"), y=metrics_df["l1i_mpki"], name="L1-I MPKI"
+    )
+    l2_mpki = go.Scattergl(
+        x=times(metrics_df, "l2_mpki"), y=metrics_df["l2_mpki"], name="L2 MPKI"
     )
-    dtlb_miss = go.Scatter(x=ts, y=metrics_df["dtlb_walk%"], name="DTLB Walk")
-    itlb_miss = go.Scatter(x=ts, y=metrics_df["itlb_walk%"], name="ITLB Walk")
-    dtlb_mpki = go.Scatter(x=ts, y=metrics_df["dtlb_mpki"], name="DTLB MPKI")
-    itlb_mpki = go.Scatter(x=ts, y=metrics_df["itlb_mpki"], name="ITLB MPKI")
-    br_mpki = go.Scatter(x=ts, y=metrics_df["branch_mpki"], name="Branch MPKI")
-    l1d_miss = go.Scatter(x=ts, y=metrics_df["l1d_miss%"], name="L1-D Miss%")
-    l1i_miss = go.Scatter(x=ts, y=metrics_df["l1i_miss%"], name="L1-I Miss%")
-    l2_miss = go.Scatter(x=ts, y=metrics_df["l2_miss%"], name="L2 Miss%")
-    l1d_mpki = go.Scatter(x=ts, y=metrics_df["l1d_mpki"], name="L1-D MPKI")
-    l1i_mpki = go.Scatter(x=ts, y=metrics_df["l1i_mpki"], name="L1-I MPKI")
-    l2_mpki = go.Scatter(x=ts, y=metrics_df["l2_mpki"], name="L2 MPKI")
 
     dtlb_max = (metrics_df["dtlb_mpki"]).max()
     itlb_max = (metrics_df["itlb_mpki"]).max()
@@ -90,62 +211,104 @@ def generate_graph(data_dir, report_dir, filepath, metrics_df, workload_tag=None
 
     curr_row += 1
     if set(["frontend_stall%", "backend_stall%"]).issubset(metrics_df.columns):
-        front_stall = go.Scatter(
-            x=ts, y=metrics_df["frontend_stall%"], name="FrontEndStall"
+        front_stall = go.Scattergl(
+            x=times(metrics_df, "frontend_stall%"),
+            y=metrics_df["frontend_stall%"],
+            name="FrontEndStall",
         )
-        back_stall = go.Scatter(
-            x=ts, y=metrics_df["backend_stall%"], name="BackEndStall"
+        back_stall = go.Scattergl(
+            x=times(metrics_df, "backend_stall%"),
+            y=metrics_df["backend_stall%"],
+            name="BackEndStall",
         )
         add_metrics(fig, front_stall, "Stall %", 100, curr_row, 1)
         add_metrics(fig, back_stall, "Stall %", 100, curr_row, 1)
 
     if set(["stall_frontend%", "stall_backend%"]).issubset(metrics_df.columns):
-        stall_frontend = go.Scatter(x=ts, y=metrics_df["stall_frontend%"], name="FE")
-        stall_frontend_lat = go.Scatter(
-            x=ts, y=metrics_df["stall_frontend_lat%"], name="FE_Latency"
+        stall_frontend = go.Scattergl(
+            x=times(metrics_df, "stall_frontend%"),
+            y=metrics_df["stall_frontend%"],
+            name="FE",
         )
-        stall_frontend_cache = go.Scatter(
-            x=ts, y=metrics_df["stall_frontend_cache%"], name="FE_Cache"
+        stall_frontend_lat = go.Scattergl(
+            x=times(metrics_df, "stall_frontend_lat%"),
+            y=metrics_df["stall_frontend_lat%"],
+            name="FE_Latency",
         )
-        stall_frontend_tlb = go.Scatter(
-            x=ts, y=metrics_df["stall_frontend_tlb%"], name="FE_TLB"
+        stall_frontend_cache = go.Scattergl(
+            x=times(metrics_df, "stall_frontend_cache%"),
+            y=metrics_df["stall_frontend_cache%"],
+            name="FE_Cache",
         )
-        stall_frontend_flush = go.Scatter(
-            x=ts, y=metrics_df["stall_frontend_recovery%"], name="FE_Flush"
+        stall_frontend_tlb = go.Scattergl(
+            x=times(metrics_df, "stall_frontend_tlb%"),
+            y=metrics_df["stall_frontend_tlb%"],
+            name="FE_TLB",
         )
-        stall_frontend_bob = go.Scatter(
-            x=ts, y=metrics_df["stall_fronetend_bob%"], name="FE_BOB"
+        stall_frontend_flush = go.Scattergl(
+            x=times(metrics_df, "stall_frontend_recovery%"),
+            y=metrics_df["stall_frontend_recovery%"],
+            name="FE_Flush",
         )
-        stall_backend = go.Scatter(x=ts, y=metrics_df["stall_backend%"], name="BE")
-        stall_backend_tlb = go.Scatter(
-            x=ts, y=metrics_df["stall_backend_tlb%"], name="BE_TLB"
+        stall_frontend_bob = go.Scattergl(
+            x=times(metrics_df, "stall_fronetend_bob%"),
+            y=metrics_df["stall_fronetend_bob%"],
+            name="FE_BOB",
         )
-        stall_backend_l1d = go.Scatter(
-            x=ts, y=metrics_df["stall_backend_l1d%"], name="BE_l1d"
+        stall_backend = go.Scattergl(
+            x=times(metrics_df, "stall_backend%"),
+            y=metrics_df["stall_backend%"],
+            name="BE",
         )
-        stall_backend_l2d = go.Scatter(
-            x=ts, y=metrics_df["stall_backend_l2d%"], name="BE_l2d"
+        stall_backend_tlb = go.Scattergl(
+            x=times(metrics_df, "stall_backend_tlb%"),
+            y=metrics_df["stall_backend_tlb%"],
+            name="BE_TLB",
         )
-        stall_backend_core = go.Scatter(
-            x=ts, y=metrics_df["stall_backend_core%"], name="BE_core"
+        stall_backend_l1d = go.Scattergl(
+            x=times(metrics_df, "stall_backend_l1d%"),
+            y=metrics_df["stall_backend_l1d%"],
+            name="BE_l1d",
         )
-        stall_backend_res = go.Scatter(
-            x=ts, y=metrics_df["stall_backend_res%"], name="BE_Resource"
+        stall_backend_l2d = go.Scattergl(
+            x=times(metrics_df, "stall_backend_l2d%"),
+            y=metrics_df["stall_backend_l2d%"],
+            name="BE_l2d",
         )
-        stall_backend_rob = go.Scatter(
-            x=ts, y=metrics_df["stall_backend_rob%"], name="BE_ROB"
+        stall_backend_core = go.Scattergl(
+            x=times(metrics_df, "stall_backend_core%"),
+            y=metrics_df["stall_backend_core%"],
+            name="BE_core",
         )
-        stall_backend_ixu = go.Scatter(
-            x=ts, y=metrics_df["stall_backend_ixu%"], name="BE_IXU"
+        stall_backend_res = go.Scattergl(
+            x=times(metrics_df, "stall_backend_res%"),
+            y=metrics_df["stall_backend_res%"],
+            name="BE_Resource",
         )
-        stall_backend_fsu = go.Scatter(
-            x=ts, y=metrics_df["stall_backend_fsu%"], name="BE_FSU"
+        stall_backend_rob = go.Scattergl(
+            x=times(metrics_df, "stall_backend_rob%"),
+            y=metrics_df["stall_backend_rob%"],
+            name="BE_ROB",
         )
-        stall_backend_lob = go.Scatter(
-            x=ts, y=metrics_df["stall_backend_lob%"], name="BE_LOB"
+        stall_backend_ixu = go.Scattergl(
+            x=times(metrics_df, "stall_backend_ixu%"),
+            y=metrics_df["stall_backend_ixu%"],
+            name="BE_IXU",
         )
-        stall_backend_sob = go.Scatter(
-            x=ts, y=metrics_df["stall_backend_sob%"], name="BE_SOB"
+        stall_backend_fsu = go.Scattergl(
+            x=times(metrics_df, "stall_backend_fsu%"),
+            y=metrics_df["stall_backend_fsu%"],
+            name="BE_FSU",
+        )
+        stall_backend_lob = go.Scattergl(
+            x=times(metrics_df, "stall_backend_lob%"),
+            y=metrics_df["stall_backend_lob%"],
+            name="BE_LOB",
+        )
+        stall_backend_sob = go.Scattergl(
+            x=times(metrics_df, "stall_backend_sob%"),
+            y=metrics_df["stall_backend_sob%"],
+            name="BE_SOB",
         )
 
         add_metrics(fig, stall_frontend, "FrontEnd %", 100, curr_row, 1)
@@ -183,7 +346,11 @@ def generate_graph(data_dir, report_dir, filepath, metrics_df, workload_tag=None
     add_metrics(fig, l1i_miss, "Cache Miss %", 100, curr_row, 1)
     add_metrics(fig, l2_miss, "Cache Miss %", 100, curr_row, 1)
     if "slc_miss%" in metrics_df.columns:
-        slc_miss = go.Scatter(x=ts, y=metrics_df["slc_miss%"], name="SLC Miss%")
+        slc_miss = go.Scattergl(
+            x=times(metrics_df, "slc_miss%"),
+            y=metrics_df["slc_miss%"],
+            name="SLC Miss%",
+        )
         add_metrics(fig, slc_miss, "Cache Miss %", 100, curr_row, 1)
 
     curr_row += 1
@@ -193,11 +360,15 @@ def generate_graph(data_dir, report_dir, filepath, metrics_df, workload_tag=None
 
     curr_row += 1
     if set(["memrd_bw_GBps", "memwr_bw_GBps"]).issubset(metrics_df.columns):
-        memrd_bw = go.Scatter(
-            x=ts, y=metrics_df["memrd_bw_GBps"], name="Memory Rd Bandwidth"
+        memrd_bw = go.Scattergl(
+            x=times(metrics_df, "memrd_bw_GBps"),
+            y=metrics_df["memrd_bw_GBps"],
+            name="Memory Rd Bandwidth",
         )
-        memwr_bw = go.Scatter(
-            x=ts, y=metrics_df["memwr_bw_GBps"], name="Memory Wr Bandwidth"
+        memwr_bw = go.Scattergl(
+            x=times(metrics_df, "memwr_bw_GBps"),
+            y=metrics_df["memwr_bw_GBps"],
+            name="Memory Wr Bandwidth",
         )
         # max values
         memrd_max = (metrics_df["memrd_bw_GBps"]).max()
@@ -208,11 +379,15 @@ def generate_graph(data_dir, report_dir, filepath, metrics_df, workload_tag=None
 
     curr_row += 1
     if set(["ccix_in_bw_MBps", "ccix_out_bw_MBps"]).issubset(metrics_df.columns):
-        ccix_in = go.Scatter(
-            x=ts, y=metrics_df["ccix_in_bw_MBps"], name="CCIX In Bandwidth"
+        ccix_in = go.Scattergl(
+            x=times(metrics_df, "ccix_in_bw_MBps"),
+            y=metrics_df["ccix_in_bw_MBps"],
+            name="CCIX In Bandwidth",
         )
-        ccix_out = go.Scatter(
-            x=ts, y=metrics_df["ccix_out_bw_MBps"], name="CCIX Out Bandwidth"
+        ccix_out = go.Scattergl(
+            x=times(metrics_df, "ccix_out_bw_MBps"),
+            y=metrics_df["ccix_out_bw_MBps"],
+            name="CCIX Out Bandwidth",
         )
         # max values
         ccix_in_max = (metrics_df["ccix_in_bw_MBps"]).max()
@@ -221,9 +396,15 @@ def generate_graph(data_dir, report_dir, filepath, metrics_df, workload_tag=None
         add_metrics(fig, ccix_in, "MB/s", ccix_max, curr_row, 1)
         add_metrics(fig, ccix_out, "MB/s", ccix_max, curr_row, 1)
 
+    title = "<b>Ampere PMU Profiler</b>"
+    if samples is not None and samples > len(metrics_df):
+        title += (
+            f"<br><sup>min and max of {samples} samples shown in"
+            f" {len(metrics_df)} points, all samples are in {filepath}</sup>"
+        )
     fig.update_layout(
         title={
-            "text": "<b>Ampere PMU Profiler</b>",
+            "text": title,
             "font": {"color": "#f63823", "size": 18},
         },
         height=1500,
@@ -239,7 +420,33 @@ def generate_graph(data_dir, report_dir, filepath, metrics_df, workload_tag=None
     )
     if report_dir != "":
         report_file = os.path.join(report_dir, report_file)
-    fig.write_html(str(report_file), auto_open=False)
+    # webgl traces, drawn against one copy of the timestamps if they share them
+    with timing.stage("write_html"):
+        write_figure(str(report_file), "Ampere PMU Profiler", fig, x=ts)
+
+
+# the report of the run in data_dir, written next to its metrics. runs of
+# more than points samples are downsampled, 0 plots every sample
+def write_report(data_dir, tag=None, points=max_points):
+    report_dir = data_dir
+    if tag:
+        workload_tag = tag
+    else:
+        workload_tag = ""
+    try:
+        filepath = os.path.join(data_dir, "metrics.csv")
+        with timing.stage("read_run"):
+            metrics_df = read_run(data_dir, plot_columns)
+    except IOError:
+        print("No metrics available.")
+        return
+    samples = len(metrics_df)
+    with timing.stage("downsample"):
+        metrics_df = downsample(metrics_df, points)
+    with timing.stage("generate_graph"):
+        generate_graph(
+            data_dir, report_dir, filepath, metrics_df, workload_tag, samples
+        )
 
 
 @click.command()
@@ -252,19 +459,16 @@ def generate_graph(data_dir, report_dir, filepath, metrics_df, workload_tag=None
     show_default=True,
 )
 @click.option("-t", "--tag", type=str, help="workload tag", show_default=False)
-def main(data_dir, tag):
-    report_dir = data_dir
-    if tag:
-        workload_tag = tag
-    else:
-        workload_tag = ""
-    try:
-        filepath = os.path.join(data_dir, "metrics.csv")
-        metrics_df = pd.read_csv(filepath, sep=",")
-    except IOError:
-        print("No metrics available.")
-        sys.exit()
-    generate_graph(data_dir, report_dir, filepath, metrics_df, workload_tag)
+@click.option(
+    "-p",
+    "--points",
+    type=int,
+    default=max_points,
+    help="max points per trace, longer runs are downsampled (0: all samples)",
+    show_default=True,
+)
+def main(data_dir, tag, points):
+    write_report(data_dir, tag, points)
 
 
 if __name__ == "__main__":
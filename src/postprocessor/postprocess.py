@@ -8,17 +8,51 @@
 
 
 from collections import OrderedDict
-from collections import Counter
+from collections import Counter, deque
+from itertools import chain, islice
+from functools import partial
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext
 from typing import NamedTuple
-import sys
 import os
-import re
 import csv
-import string
+import io
+import logging
+import math
 import click
+import numpy as np
+from collector import timing
 from collector.logger_setup import setup_logger
-
-eventname: list[str] = []
+from postprocessor.capture import capture_files, chunk_files
+from postprocessor.checkpoint import (
+    file_id,
+    load_checkpoint,
+    remove_checkpoint,
+    run_options,
+    save_checkpoint,
+)
+from postprocessor.percore import (
+    align,
+    core_sockets,
+    group_sums,
+    load_counters,
+    parse_core_segment,
+)
+from postprocessor.perfstat import read_records, transpose_records
+from postprocessor.stats import MetricStats, get_stats
+from postprocessor.store import StoreWriter, core_store_path, store_path
+from postprocessor.eventfile import load_event_file, rename_events, socket_events
+from postprocessor.metrics import (
+    CompiledMetric,
+    compile_program,
+    compile_tree,
+    format_metric,
+    format_counters,
+    run_program,
+    to_matrix,
+)
+
+logger = logging.getLogger("app")
 constdict = {
     "const_cpus": 80,
     "const_sampletime": 1.0,
@@ -28,59 +62,8 @@ constdict = {
     "const_wall_clock_time": 0,
 }
 metricfile = "events.txt"
-
-
-class EventInfo(NamedTuple):
-    name: str
-    code: str
-    groupid: int
-
-
-# get the PMU names from metric expression
-def get_metric_events(formula):
-    f_len = len(formula)
-    start = 0
-    metric_events = []
-    while start < f_len:
-        s_idx = formula.find("[", start)
-        e_idx = formula.find("]", start)
-        if s_idx != -1 and e_idx != -1:
-            metric_events.append(formula[s_idx + 1 : e_idx])
-        else:
-            break
-        start = e_idx + 1
-    return metric_events
-
-
-def get_expression_socket(expr, socket):
-    f_len = len(expr)
-    start = 0
-    expr_new = expr
-    while start < f_len:
-        s_idx = expr.find("[", start)
-        e_idx = expr.find("]", start)
-        if s_idx != -1 and e_idx != -1:
-            event_all = expr[s_idx : e_idx + 1]  # event with the []: [cycles]
-            event = expr[s_idx + 1 : e_idx]  # event without []: cycles
-            event_s = "[" + socket + event + "]"  # event with socket: s0.cycles
-            if event.startswith("const"):  # bypass the const replacement
-                break
-            expr_new = expr_new.replace(event_all, event_s)  # [cycles] ==> [s0.cycles]
-        else:
-            break
-        start = e_idx + 1
-    # print(expr, "==>", expr_new)
-    return expr_new
-
-
-def get_event_index(event, mapping, winnerID):
-    offset = 0
-    i = 0
-    while i < winnerID:
-        offset += len(mapping[i])
-        i += 1
-    grpindx = mapping[winnerID].index(event)
-    return offset + grpindx
+chunk_rows = 4096  # samples evaluated at a time
+segment_bytes = 8 << 20  # perf stat data parsed at a time
 
 
 def most_frequent_group(grplist):
@@ -90,90 +73,59 @@ def most_frequent_group(grplist):
     return min(num for num, count in counter.items() if count == max_count)
 
 
-def get_groupid(event, eventmapping):
-    group_id = []  # if present in multiple groups
-    for grpid, events in eventmapping.items():
-        if event in events:
-            group_id.append(grpid)
-    return group_id
+# normalize an event name the way formulas and columns are matched
+def normalize_event(event):
+    return event.replace("-", "_").replace(":", "_")
 
 
-# evaluate formula or expression
-def evaluate_expression(expr, rawdata, event_mapping):
-    global eventname
-    tmp_expr = expr
-    metric_events = get_metric_events(expr)
-    expr = expr.replace("[", "")
-    expr = expr.replace("]", "")
+class ResolvedMetric(NamedTuple):
+    metric: CompiledMetric
+    columns: dict[str, int] | None  # event -> raw data column, None if not collected
+    references: dict[str, int]  # metric used in the formula -> its plan index
 
-    # assign consts in the expression and create a list for collected events
-    collected_events = []
-    for event in metric_events:
-        if event in constdict:
-            expr = expr.replace(event, str(constdict[event]))
-        else:
-            # replace :, - with _ . workaround needed for substring replacement in expr
-            tmp_event = event
-            event = event.replace("-", "_")
-            event = event.replace(":", "_")
-            expr = expr.replace(tmp_event, event)
-            collected_events.append(event)
-    logger.debug("collected events %s", collected_events)
-    grps = []
-    event_in_multiple_groups = []
-    for event in collected_events:
-        event_grp_list = get_groupid(event, event_mapping)
-        grps.append(event_grp_list)
-        if len(event_grp_list) > 1 and event not in event_in_multiple_groups:
-            event_in_multiple_groups.append(event)
-        logger.debug("event: %s event_grp_list %s", event, event_grp_list)
-    if any(grp for grp in grps):
-        winnerid = most_frequent_group(grps)
-        logger.debug("Winner %s", winnerid)
-        logger.debug("event in multiple groups %s", event_in_multiple_groups)
-
-    for i, event in enumerate(eventname):
-        event = event.replace("-", "_")
-        event = event.replace(":", "_")
-        if event in collected_events and event in event_in_multiple_groups:
-            idx = get_event_index(event, event_mapping, winnerid)
-            logger.debug(
-                "idx:event:rawdata:expr-> %s:%s:%s:%s",
-                idx,
-                event,
-                rawdata[idx + 1],
-                expr,
-            )
-            expr = re.sub(
-                r"\b" + event + r"\b", str(rawdata[idx + 1]), expr
-            )  # +1 for time
-            collected_events.remove(event)  # remove event after it has been visited
-        elif event in collected_events:
-            logger.debug(
-                "i:event:rawdata:expr-> %s:%s:%s:%s", i, event, rawdata[i + 1], expr
-            )
-            expr = re.sub(
-                r"\b" + event + r"\b", str(rawdata[i + 1]), expr
-            )  # +1 for time
-            collected_events.remove(event)  # remove event after it has been visited
 
-    result = ""
-    try:
-        result = str("{:.4f}".format(eval(expr)))
-    except ZeroDivisionError:
-        logger.error("Divide by Zero evaluating %s", tmp_expr)
-        result = "0"
-        pass
-    except SyntaxError:
-        logger.error("Syntax error evaluating %s", expr)
-        logger.error(tmp_expr)
-        result = ""
-        pass
-    except Exception:
-        logger.exception("Unknown error evaluating %s  %s", tmp_expr, expr)
-        result = ""
-
-    return result
+# resolve the raw data column of every metric operand once per run (0 is time).
+# events collected in multiple groups are read from the group shared by
+# most of the formula's events so that all operands come from one group.
+# operands named after a metric before it refer to that metric, the ones
+# in consts are constants
+def build_metric_plan(compiled, header, event_mapping, consts=constdict):
+    columns: dict[str, int] = {}
+    for i, event in enumerate(header):
+        columns.setdefault(normalize_event(event), i + 1)  # +1 for time
+
+    groups: dict[str, list[int]] = {}  # event -> groups it is collected in
+    positions = {}  # (group, event) -> column
+    offset = 0
+    for grpid, events in event_mapping.items():
+        for i, event in enumerate(events):
+            if (grpid, event) not in positions:
+                positions[(grpid, event)] = offset + i + 1
+                groups.setdefault(event, []).append(grpid)
+        offset += len(events)
+
+    plan = []
+    defined: dict[str, int] = {}  # metric name -> plan index
+    for metric in compiled:
+        references = {e: defined[e] for e in metric.events if e in defined}
+        events = [e for e in metric.events if e not in consts and e not in references]
+        grps = [groups.get(normalize_event(e), []) for e in events]
+        winnerid = most_frequent_group(grps) if any(grps) else None
+        logger.debug("%s: events %s groups %s", metric.name, events, grps)
+        resolved: dict[str, int] | None = {}
+        for event in events:
+            name = normalize_event(event)
+            if name not in columns:
+                logger.warning("%s: event %s not collected", metric.name, event)
+                resolved = None
+                break
+            if len(groups.get(name, [])) > 1 and (winnerid, name) in positions:
+                resolved[event] = positions[(winnerid, name)]
+            else:
+                resolved[event] = columns[name]
+        plan.append(ResolvedMetric(metric, resolved, references))
+        defined[metric.name] = len(plan) - 1
+    return plan
 
 
 def get_compatiable_event(e):
@@ -185,313 +137,540 @@ def get_compatiable_event(e):
     return tmp
 
 
-# generate metrics from raw counters
-def loadmetrics(infile, outfile, cores, persocket):
-    global eventname
-    global metricfile
-    start = False
-    uncore_metrics = False
+# build the metric list of an events file (metricfile by default) for the
+# collected events. with persocket, metrics are evaluated per socket on the
+# s0./s1. events, except uncore ones
+def read_metrics(eventname, persocket, metric_file=None):
     metrics = []
     metrics_s1 = []
-    event_mapping, event_list = get_event_mappings()
-    logger.debug("infile: %s, outfile: %s", infile, outfile)
-    logger.debug("eventname: %s", eventname)
-
-    with open(metricfile, "r") as f_metric:
-        for row in f_metric:
-            if row.startswith(";"):
-                start = True
-                continue
-            if not start:
-                continue
-
-            if "uncore_metrics" in row:  # uncore_metrics doenn't support persocket mode
-                logger.debug("found uncore events")
-                uncore_metrics = True
-
-            if not row.strip() or row.startswith("#"):
-                continue
-
-            if persocket and not uncore_metrics:
-                check = 2
-            else:
-                check = 1
-
-            temp = row.split("=")
-            metric = temp[0].strip()
-            expression = temp[1].strip()
-
-            add_metric = True
-            metric_tmp = metric
-            socket = ""
-
-            for c in range(check):
-                if persocket and not uncore_metrics:
-                    socket = "s0." if c == 0 else "s1."
-                expression_new = get_expression_socket(expression, socket)
-                metric_events = get_metric_events(expression_new)
-                logger.debug("expression_new: %s", expression_new)
-                for e in metric_events:
-                    if e.startswith("const"):
-                        continue
-                    if e not in eventname:
-                        if get_compatiable_event(e) not in eventname:
-                            logger.debug("Skipping event: %s", e)
-                            add_metric = False
-
-                if add_metric and persocket:
-                    metric_tmp = socket + metric
-                if c == 0:
-                    metrics.append({"name": metric_tmp, "expression": expression_new})
-                    # logger.debug("%s : %s",c,metrics)
-                if c == 1:
-                    metrics_s1.append(
-                        {"name": metric_tmp, "expression": expression_new}
-                    )
-
-    f_metric.close()
-
-    constdict["const_cpus"] = cores
+    eventname = set(eventname)
+
+    for metric in load_event_file(metric_file or metricfile).metrics:
+        sockets = ["s0.", "s1."] if persocket and not metric.uncore else [""]
+        add_metric = True
+        name = metric.name
+        for c, socket in enumerate(sockets):
+            events = socket_events(metric, socket)
+            for e in events:
+                if e.startswith("const") or e[len(socket) :] in metric.references:
+                    continue
+                if e not in eventname and get_compatiable_event(e) not in eventname:
+                    logger.debug("Skipping event: %s", e)
+                    add_metric = False
+            if add_metric and persocket:
+                name = socket + metric.name
+            compiled = compile_tree(
+                name, rename_events(metric, events), events, metric.tree
+            )
+            (metrics if c == 0 else metrics_s1).append(compiled)
 
-    metricrow = []
     if persocket:
         metrics.extend(metrics_s1)
-    for m in metrics:
-        metricrow.append(m["name"])
-
-    fout = open(outfile, "w")
-    outcsv = csv.writer(fout, dialect="excel")
-
-    fin = open(infile, "r")
-    incsv = csv.reader(fin, delimiter=",")
-
-    rowcount = 0
-    timestamp = 0.00
-    for row in incsv:
-        outrow = []
-        mval = [""] * len(metricrow)
-        if not row:
+    return metrics
+
+
+# evaluate all metrics for a chunk of samples. returns the chunk's rows as
+# csv text, the values (time first) and divide by zero counts. the values
+# are the evaluated ones, the csv has them with 4 decimals: NaN is an empty
+# cell, a division by zero 0. counters are rounded like in the csv
+def evaluate_chunk(program, consts, data, timestamp):
+    sampletime = np.diff(data[:, 0], prepend=timestamp)
+    divzero: Counter[str] = Counter()
+    columns = []
+    metrics = np.full((len(data), len(program.outputs)), np.nan)
+    results = run_program(program, data, sampletime, consts)
+    for i, (expression, result) in enumerate(zip(program.expressions, results)):
+        if result is None:
+            columns.append([""] * len(data))
             continue
-        if rowcount > 0:
-            interval = float(row[0]) - timestamp
-            timestamp = float(row[0])
-            constdict["const_sampletime"] = interval
-
-            for m in metrics:
-                idx = metricrow.index(m["name"])
-                result = evaluate_expression(m["expression"], row, event_mapping)
-                mval[idx] = result
-            outrow.append(row[0])
-            outrow.extend(mval)
-            rawdata = row[1:]
-            for i, r in enumerate(rawdata):
-                try:
-                    rawdata[i] = str((round(float(r))))
-                except Exception:
-                    rawdata[i] = ""
-
-            outrow.extend(rawdata)
-        else:
-            outrow.append(row[0])
-            outrow.extend(metricrow)
-            outrow.extend(row[1:])
-        outcsv.writerow(outrow)
-        rowcount = rowcount + 1
+        values, zero = result
+        if zero.any():
+            divzero[expression] += np.count_nonzero(zero)
+        metrics[:, i] = np.where(zero & ~np.isnan(values), 0.0, values)
+        columns.append(format_metric(values, zero))
+    counters = np.rint(data[:, 1:])
+    columns.extend(format_counters(counters[:, i]) for i in range(counters.shape[1]))
+    values = np.column_stack([data[:, :1], metrics, counters])
+    out = io.StringIO()
+    csv.writer(out, dialect="excel").writerows(zip(data[:, 0].tolist(), *columns))
+    return out.getvalue(), values, divzero
+
+
+# split rows into chunks of chunk_rows samples with the timestamp before each
+def get_chunks(rows, width, timestamp=0.0):
+    for chunk in iter(lambda: list(islice(rows, chunk_rows)), []):
+        data = to_matrix(chunk, width)
+        yield data, timestamp
+        timestamp = data[-1, 0]
+
+
+# map fn over argument tuples in a process pool with at most window tasks in
+# flight, results are yielded in order
+def ordered_map(executor, fn, tasks, window):
+    pending: deque[Future] = deque()
+    for args in tasks:
+        pending.append(executor.submit(fn, *args))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# generate metrics from raw counters. rows is a header followed by one row
+# per sample, metrics are evaluated chunk_rows samples at a time, in parallel
+# if an executor is given. with a checkpoint to resume from, the samples are
+# appended to the outputs of the checkpointed run. returns the running
+# averages and statistics of the columns
+def loadmetrics(rows, outfile, cores, persocket, executor=None, jobs=1, resume=None):
+    event_mapping, _ = get_event_mappings()
+    logger.debug("outfile: %s", outfile)
+
+    header = next(rows, None)
+    if header is None:
+        logger.error("no samples found")
+        return None
+    logger.debug("eventname: %s", header[1:])
 
+    constdict["const_cpus"] = cores
+    compiled = read_metrics(header[1:], persocket)
+    metricrow = [m.name for m in compiled]
+    plan = build_metric_plan(compiled, header[1:], event_mapping)
+    program = compile_program(plan, constdict)
+
+    averages = RunningAverages(metricrow + header[1:])
+    stats = MetricStats(metricrow + header[1:])
+    if resume is not None:
+        averages.restore(resume["averages"])
+        stats.restore(resume["stats"])
+        # drop anything written after the checkpoint
+        os.truncate(outfile, resume["bytes"])
+
+    evaluate = partial(evaluate_chunk, program, dict(constdict))
+    chunks = get_chunks(rows, len(header), averages.timestamp)
+    if executor is None:
+        results = (evaluate(*chunk) for chunk in chunks)
+    else:
+        results = ordered_map(executor, evaluate, chunks, 2 * jobs)
 
-# get event to rNNN mapping
-def get_event_mappings():
+    divzero: Counter[str] = Counter()
+    store = StoreWriter(
+        store_path(os.path.dirname(outfile)), metricrow, header[1:], averages.samples
+    )
+    with open(outfile, "w" if resume is None else "a") as fout:
+        if resume is None:
+            outcsv = csv.writer(fout, dialect="excel")
+            outcsv.writerow([header[0]] + metricrow + header[1:])
+        for text, values, counts in results:
+            fout.write(text)
+            store.append(values)
+            averages.update(values)
+            stats.update(values)
+            divzero.update(counts)
+    store.close()
+
+    for expression, count in divzero.items():
+        logger.error("Divide by Zero evaluating %s in %d samples", expression, count)
+    return averages, stats
+
+
+# get event to rNNN mapping of an events file, metricfile by default
+def get_event_mappings(metric_file=None):
     event_mapping = OrderedDict()
     event_list = []
-    group_id = 0
-    with open(metricfile, "r") as f_event:
-        for row in f_event:
-            if not row.strip() or row.startswith("#"):
-                continue
-            new_group = False
-            if row.startswith(";"):
-                break
-            if row.startswith("}"):
-                new_group = True
-                logger.debug("new group with id: %s", group_id)
-
-            row = row.strip()
-            if "|" in row:
-                event = row.split("|")
-                name = event[0].strip()
-                code = event[1].strip()
-                event_list.append(EventInfo(name=name, code=code, groupid=group_id))
-                name = name.replace(":", "_")
-                name = name.replace("-", "_")
-                if event_mapping.get(group_id) is None:
-                    event_mapping.setdefault(group_id, [name])
-                else:
-                    event_mapping[group_id].append(name)
-            if new_group:
-                group_id += 1
+    for event in load_event_file(metric_file or metricfile).events:
+        if event.code is None:
+            continue
+        event_list.append(event)
+        event_mapping.setdefault(event.group, []).append(normalize_event(event.name))
     return event_mapping, event_list
 
 
-# process raw pmu counters, transpose the data with one raw for each timestamp
-def process_stats(infile, persocket, outfile):
-    logger.debug("processing stats with %s input and output %s", infile, outfile)
-    global eventname
-    prev_time = 0.00
-    first_out_row = True
-    rowdata = []
-    row0data = []
-    socket = []
-    _, event_list = get_event_mappings()
+# rNNN code to event name lookup
+def get_code_names(event_list):
+    code_names: dict[str, str] = {}
+    for event in event_list:
+        name = code_names.setdefault(event.code, event.name)
+        if name != event.name:
+            logger.warning(
+                "%s is used for both %s and %s", event.code, name, event.name
+            )
+    return code_names
+
+
+def get_code_names_from_eventfile(metric_file=None):
+    _, event_list = get_event_mappings(metric_file)
     logger.debug(
         "events in eventlist: %s", ", ".join(str(events) for events in event_list)
     )
-
-    fout = open(outfile, "w")
-    outcsv = csv.writer(fout, delimiter=",")
-    index = 0
-    with open(infile, "r") as fin:
-        incsv = csv.reader(fin, delimiter=",")
-        row0data.append("time")
-        for it, row in enumerate(incsv):
-            if it == 0:
-                continue
-            if not row:
+    return get_code_names(event_list)
+
+
+# process raw pmu counters, transpose the data with one row for each
+# timestamp. the file is parsed a segment at a time, in a process pool if an
+# executor is given. without an end offset the last interval of the file is
+# dropped, perf may have been stopped while writing it. a resumed stream
+# starts in the middle of the file and gets its header from the checkpoint
+def process_stats(
+    infile, persocket, executor=None, jobs=1, start=0, end=None, header=None
+):
+    logger.debug("processing stats with %s input", infile)
+    code_names = get_code_names_from_eventfile()
+    segments = capture_segments(infile, start, end)
+    logger.debug("%s: %d segments", infile, len(segments))
+    tasks = (
+        (path, persocket, code_names, lo, hi, complete)
+        for path, lo, hi, complete in segments
+    )
+    if executor is None:
+        results = (parse_segment(*args) for args in tasks)
+    else:
+        results = ordered_map(executor, parse_segment, tasks, 2 * jobs)
+    if header is not None:
+        yield header
+    for names, matrix in results:
+        if names and header is None:
+            header = names
+            yield names
+        yield from matrix.tolist()
+
+
+# process a per-core capture: perf stat -A output, or the arrays of the
+# perf_event_open backend (.npz). with percore, the counters of every core
+# and the metrics evaluated on them are written to the per-core store next
+# to outfile. the samples are yielded like process_stats does, as sums over
+# the cores: of all of them, or of each socket's with persocket
+def process_core_stats(infile, outfile, persocket, executor=None, jobs=1, percore=True):
+    logger.debug("processing per-core stats with %s input", infile)
+    if infile.endswith(".npz"):
+        results = iter([load_counters(infile)])
+    else:
+        code_names = get_code_names_from_eventfile()
+        tasks = (
+            (path, code_names, lo, hi, complete)
+            for path, lo, hi, complete in capture_segments(infile)
+        )
+        if executor is None:
+            results = (parse_core_segment(*args) for args in tasks)
+        else:
+            results = ordered_map(executor, parse_core_segment, tasks, 2 * jobs)
+    run_dir = os.path.dirname(outfile)
+    store = groups = None
+    timestamp = 0.0
+    try:
+        for counters in results:
+            if not len(counters.time):
                 continue
+            if groups is None:
+                cores, header = counters.cores, counters.header
+                if percore:
+                    consts = dict(constdict, const_cpus=1)
+                    compiled = read_metrics(header, False)
+                    plan = build_metric_plan(compiled, header, get_event_mappings()[0])
+                    program = compile_program(plan, consts)
+                    outputs = enumerate(program.outputs)
+                    evaluated = [i for i, o in outputs if o is not None]
+                    names = [compiled[i].name for i in evaluated]
+                    store = StoreWriter(
+                        core_store_path(run_dir), names, header, cores=cores
+                    )
+                    logger.info("%d cpus, %d per-core metrics", len(cores), len(names))
+                groups = [list(range(len(cores)))]
+                columns = header
+                if persocket:
+                    sockets = core_sockets(cores, run_dir)
+                    ids = sorted(set(sockets))
+                    groups = [[i for i, s in enumerate(sockets) if s == k] for k in ids]
+                    columns = [f"s{k}.{name}" for k in ids for name in header]
+                yield ["time"] + columns
+            values = align(counters, cores, len(header))
+            if store is not None:
+                metrics = core_metrics(
+                    program, consts, counters.time, values, timestamp
+                )
+                timestamp = counters.time[-1]
+                time = np.broadcast_to(
+                    counters.time[:, None, None], (len(values), 1, len(cores))
+                )
+                store.append(
+                    np.concatenate(
+                        (time, metrics[:, evaluated], values.transpose(0, 2, 1)),
+                        axis=1,
+                    )
+                )
+            sums = group_sums(values, groups).reshape(len(values), -1)
+            yield from np.column_stack((counters.time, sums)).tolist()
+    finally:
+        if store is not None:
+            store.close()
+
+
+# evaluate the metrics on the counters of every core, each core counts as a
+# single cpu. values are (intervals, cores, counters), the metrics are
+# returned as (intervals, metrics, cores) with 0 where a formula divided by
+# zero and NaN where it wasn't evaluated
+def core_metrics(program, consts, time, values, timestamp):
+    intervals, cores, width = values.shape
+    data = np.empty((intervals * cores, width + 1))
+    data[:, 0] = np.repeat(time, cores)
+    data[:, 1:] = values.reshape(-1, width)
+    sampletime = np.repeat(np.diff(time, prepend=timestamp), cores)
+    metrics = np.full((len(program.outputs), intervals * cores), np.nan)
+    for i, result in enumerate(run_program(program, data, sampletime, consts)):
+        if result is not None:
+            metrics[i] = np.where(result[1], 0.0, result[0])
+    return metrics.reshape(-1, intervals, cores).transpose(1, 0, 2)
+
+
+# the parts of a capture parsed at a time, as (file, start, end, complete):
+# segments of a perf stat file, or the chunks of a compressed capture. only
+# the last part may end in an interval perf didn't finish, unless the end
+# of the capture is given
+def capture_segments(infile, start=0, end=None):
+    chunks = [] if os.path.isfile(infile) else chunk_files(infile)
+    if chunks:
+        last = len(chunks) - 1
+        return [(chunk, 0, None, i < last) for i, chunk in enumerate(chunks)]
+    segments = stat_segments(infile, segment_bytes, start, end)
+    last = segments[-1][1]
+    return [(infile, lo, hi, end is not None or hi != last) for lo, hi in segments]
+
+
+# split [start, end) of a perf stat file into segments of about size bytes.
+# segments start at the first line of an interval, so each holds complete
+# intervals only
+def stat_segments(infile, size, start=0, end=None):
+    total = os.path.getsize(infile) if end is None else end
+    bounds = [start]
+    with open(infile, "rb") as fin:
+        while bounds[-1] + size < total:
+            fin.seek(bounds[-1] + size)
+            fin.readline()
+            prev = None
+            while True:
+                offset = fin.tell()
+                line = fin.readline()
+                if not line:
+                    break
+                stamp = line.split(b",", 1)[0].strip()
+                if not stamp or stamp.startswith(b"#"):
+                    continue
+                if prev is not None and stamp != prev:
+                    break
+                prev = stamp
+            if not line:
+                break
+            bounds.append(offset)
+    bounds.append(total)
+    return list(zip(bounds[:-1], bounds[1:]))
 
-            s = ""
-            if persocket:
-                s = row[1].strip()
-                if not socket:
-                    socket.append(s)
-                elif s and s not in socket:
-                    socket.append(s)
-                stat = row[5].strip()
-                val = row[3].strip()
 
+# timestamp of a perf stat line, None for comments and unparsable lines
+def line_time(line):
+    stamp = line.split(b",", 1)[0].strip()
+    if not stamp or stamp.startswith(b"#"):
+        return None
+    try:
+        return float(stamp)
+    except ValueError:
+        return None
+
+
+# find the last interval of a perf stat file, perf may still be writing it.
+# returns its offset and the timestamp of the interval before, the last
+# complete one. the timestamp is None if there is no complete interval
+def last_interval(infile):
+    with open(infile, "rb") as fin:
+        total = fin.seek(0, 2)
+        size = 1 << 16
+        while True:
+            start = max(total - size, 0)
+            fin.seek(start)
+            lines = fin.read(total - start).split(b"\n")
+            # a partial first line (and whatever follows the last newline)
+            offset = start + len(lines[0]) + 1 if start else 0
+            lines = lines[1:-1] if start else lines[:-1]
+            offsets = [offset]
+            for line in lines:
+                offsets.append(offsets[-1] + len(line) + 1)
+            last = None
+            end = start
+            for line, offset in zip(reversed(lines), reversed(offsets[:-1])):
+                time = line_time(line)
+                if time is None:
+                    continue
+                if last is not None and time != last:
+                    return end, time
+                last, end = time, offset
+            if start == 0:
+                return end, None
+            size *= 4
+
+
+# offset of the first interval at or after time in [start, end) of a perf
+# stat file, found by bisecting on the increasing timestamps
+def interval_offset(infile, time, start, end):
+    with open(infile, "rb") as fin:
+        lo, hi = start, end
+        while hi - lo > 1 << 16:
+            mid = (lo + hi) // 2
+            fin.seek(mid - 1)
+            fin.readline()
+            while True:
+                offset = fin.tell()
+                line = fin.readline()
+                if not line or offset >= end:
+                    break
+                stamp = line_time(line)
+                if stamp is not None:
+                    break
+            if not line or offset >= end or stamp >= time:
+                hi = mid
             else:
-                stat = row[3].strip()
-                val = row[1].strip()
-
-            if not stat or not val:
-                continue
-
-            # check if any collected event is rNNN format and replace with the name
-            if stat.startswith("r"):
-                code = stat[1:]
-                if all(c in string.hexdigits for c in code):
-                    name = event_list[index].name
-                    stat = name
-            try:
-                time = round(float(row[0].strip()), 2)
-            except (ValueError, IndexError):
-                continue
-
-            if prev_time != time:
-                if len(rowdata) > 0 and first_out_row:
-                    first_out_row = False
-                    outcsv.writerow(row0data)
-                    eventname.extend(row0data[1:])
-
-                if not first_out_row:
-                    outcsv.writerow(rowdata)
-                rowdata = []
-                rowdata.append(time)
-                index = 0
-
-            if first_out_row:
-                if not persocket:
-                    row0data.append(stat)
-                else:
-                    row0data.append("s" + str(socket.index(s)) + "." + stat)
-
-            index = index + 1
-            try:
-                rowdata.append(float(val))
-            except Exception:
-                # for some cases, "not counted" or "not supported" will be captured:
-                # 1.670835594,<not counted>,,r31,0,100.00,,
-                # 1.670835594,<not supported>,,bus_access,0,100.00,,
-                # append a 0 instead of an empty string can aovid the error:
-                # ValueError: could not convert string to float: ''
-                rowdata.append(float(0))
-
-            prev_time = time
-    fin.close()
-    fout.close()
-
-
-def join_files(n, outdir, outfile):
-    # assume intermediate files are named tmp0.csv, tmp1.csv so on
-    fout = open(outfile, "w")
-    outcsv = csv.writer(fout, delimiter=",")
-    incsvs = []
-    lines = sys.maxsize
-    for i in range(n):
-        fin = open(os.path.join(outdir, "tmp" + str(i) + ".csv"), "r")
-        csvreader = csv.reader(fin, delimiter=",")
-        current_line_count = len(list(csvreader))
-        if current_line_count < lines:
-            lines = current_line_count
-        fin.close()
-
-    for i in range(n):
-        fin = open(os.path.join(outdir, "tmp" + str(i) + ".csv"), "r")
-        incsvs.append(csv.reader(fin, delimiter=","))
-
-    count = 0
-    for row in incsvs[0]:
-        if count >= lines:
+                lo = offset
+        fin.seek(lo)
+        while True:
+            offset = fin.tell()
+            line = fin.readline()
+            if not line or offset >= end:
+                return end
+            stamp = line_time(line)
+            if stamp is not None and stamp >= time:
+                return offset
+
+
+# transpose one segment of a perf stat file, may run in a worker process
+def parse_segment(infile, persocket, code_names, start, end, complete):
+    records = read_records(infile, persocket, start, end)
+    return transpose_records(records, code_names, persocket, complete)
+
+
+# how far join_files got: the header of each stream (None if it had no
+# samples), the timestamp of the first sample of each stream that wasn't
+# joined (None if there is none) and the tolerance used
+class JoinProgress:
+    def __init__(self):
+        self.headers = []
+        self.pending = []
+        self.tolerance = None
+
+
+# merge several streams on their interval timestamp. samples within tolerance
+# of the earliest pending timestamp are joined into one row, a stream without
+# such a sample contributes a gap (empty cells) to that row. the tolerance
+# defaults to half the sampling interval of the first stream. rows after the
+# until timestamp are left in the streams
+def join_files(streams, tolerance=None, until=None, progress=None):
+    progress = JoinProgress() if progress is None else progress
+    headers = []
+    iters = []
+    index = []
+    for i, stream in enumerate(streams):
+        header = next(stream, None)
+        progress.headers.append(header)
+        progress.pending.append(None)
+        if header is None:
+            logger.warning("no samples found in stream %d", i)
+            continue
+        headers.append(header)
+        iters.append(stream)
+        index.append(i)
+    if not headers:
+        return
+    widths = [len(h) - 1 for h in headers]
+    yield headers[0] + [name for h in headers[1:] for name in h[1:]]
+
+    if tolerance is None:
+        first = list(islice(iters[0], 2))
+        iters[0] = chain(first, iters[0])
+        tolerance = math.inf
+        if len(first) == 2 and first[1][0] > first[0][0]:
+            tolerance = (first[1][0] - first[0][0]) / 2
+    progress.tolerance = tolerance
+    logger.debug("joining %d streams with tolerance %s", len(iters), tolerance)
+
+    heads = [next(it, None) for it in iters]
+    gaps = [0] * len(iters)
+    while True:
+        pending = [h[0] for h in heads if h is not None]
+        if not pending:
             break
-        outrow = []
-        outrow.extend(row)
-        for i in range(1, n):
-            extrow = next(incsvs[i])
-            outrow.extend(extrow[1:])
-        outcsv.writerow(outrow)
-        count += 1
-
-
-def get_averages(infile, resdir):
-    fin = open(infile, "r")
-    incsv = csv.reader(fin, delimiter=",")
-    # outfile = (infile.split('.'))[0]+".average.csv"
+        earliest = min(pending)
+        if until is not None and earliest > until:
+            break
+        time = None
+        values = []
+        for i, head in enumerate(heads):
+            if head is None or head[0] - earliest >= tolerance:
+                logger.debug("stream %d has no sample at %s", i, earliest)
+                values.extend([math.nan] * widths[i])
+                gaps[i] += 1
+                continue
+            if time is None:
+                time = head[0]
+            sample = head[1 : widths[i] + 1]
+            values.extend(sample)
+            values.extend([math.nan] * (widths[i] - len(sample)))
+            heads[i] = next(iters[i], None)
+        yield [time] + values
+
+    for i, head in zip(index, heads):
+        progress.pending[i] = None if head is None else head[0]
+    for i, count in enumerate(gaps):
+        if count:
+            logger.warning("stream %d: %d intervals missing", i, count)
+
+
+# running per column averages of metrics.csv, empty cells are skipped
+class RunningAverages:
+    def __init__(self, names):
+        self.names = names
+        self.samples = 0
+        self.timestamp = 0.0  # of the last sample
+        self.sums = np.zeros(len(names))
+        self.counts = np.zeros(len(names), dtype=np.int64)
+
+    # add samples as written to metrics.csv, time first
+    def update(self, values):
+        if len(values):
+            self.timestamp = float(values[-1, 0])
+        values = values[:, 1:]
+        valid = ~np.isnan(values)
+        # accumulate row by row, the same order as summing up metrics.csv
+        values = np.vstack([self.sums, np.where(valid, values, 0.0)])
+        self.sums = np.cumsum(values, axis=0)[-1]
+        self.counts += valid.sum(axis=0)
+        self.samples += len(valid)
+
+    # the running state, as kept in checkpoints
+    def state(self):
+        return {
+            "samples": self.samples,
+            "timestamp": self.timestamp,
+            "sums": self.sums.tolist(),
+            "counts": self.counts.tolist(),
+        }
+
+    def restore(self, state):
+        self.samples = state["samples"]
+        self.timestamp = state["timestamp"]
+        self.sums = np.array(state["sums"], dtype=np.float64)
+        self.counts = np.array(state["counts"], dtype=np.int64)
+
+
+def get_averages(averages, resdir):
     outfile = os.path.join(resdir, "metrics.average.csv")
-    fout = open(outfile, "w")
-    outcsv = csv.writer(fout, delimiter=",")
-
-    numlines = 0.0
-    header = []
-    sumrow = []
-    for row in incsv:
-        if not row:
-            continue
-
-        if numlines == 0:
-            header = row[1:]
-            sumrow = [0.0] * (len(header))
-            numlines = numlines + 1
-            continue
-        for i, r in enumerate(row):
-            if i == 0:
+    logger.info("number of samples: %d" % averages.samples)
+    with open(outfile, "w") as fout:
+        outcsv = csv.writer(fout, delimiter=",")
+        for i, h in enumerate(averages.names):
+            if averages.counts[i] == 0:
+                outcsv.writerow([h, "N/A"])
                 continue
-            sumrow[i - 1] = sumrow[i - 1] + float(r)
-        numlines = numlines + 1
-
-    numlines = numlines - 1
-    logger.info("number of samples: %d" % numlines)
-    for i, h in enumerate(header):
-        outcsv.writerow([h, str("{:,.4f}".format(sumrow[i] / numlines))])
+            average = averages.sums[i] / averages.counts[i]
+            outcsv.writerow([h, str("{:,.4f}".format(average))])
     logger.info("metric averages: %s", outfile)
 
 
-def clean_temp_files(tmp, files, resdir):
-    os.remove(tmp)
-    for i, f in enumerate(files):
-        tmpfile = os.path.join(resdir, f"tmp{i}.csv")
-        if os.path.exists(tmpfile):
-            os.remove(tmpfile)
-
-
 @click.command()
 @click.argument("files", nargs=-1, type=click.Path())
 @click.option("--output", required=True, type=click.Path(), help="output csv files")
@@ -500,42 +679,212 @@ def clean_temp_files(tmp, files, resdir):
 @click.option("--metric", type=click.Path(), help="metricfile/eventlist")
 @click.option("--debug", is_flag=True, help="enable debug messages")
 @click.option("--duration", help="sampling duration")
-def main(files, output, persocket, cpus, metric, debug, duration):
-    global metricfile, logger
+@click.option(
+    "--tolerance",
+    type=float,
+    help="max timestamp difference (s) of joined samples, default: interval/2",
+)
+@click.option(
+    "--jobs", type=int, default=1, help="number of worker processes", show_default=True
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="keep a checkpoint and only process intervals added since the last run",
+)
+@click.option(
+    "--percore",
+    is_flag=True,
+    help="core_pmu.csv has the counters of each core (perf stat -A),"
+    " keep them in the per-core store",
+)
+@click.option(
+    "--profile", is_flag=True, help="write the time of each stage to timings.json"
+)
+@click.option(
+    "--profile-dump",
+    multiple=True,
+    type=click.Choice(timing.dump_kinds),
+    help="also dump snapshots of the heavy stages, implies --profile",
+)
+def main(
+    files,
+    output,
+    persocket,
+    cpus,
+    metric,
+    debug,
+    duration,
+    tolerance,
+    jobs,
+    incremental,
+    percore,
+    profile,
+    profile_dump,
+):
+    global logger
     loglevel = "debug" if debug else "info"
     logger = setup_logger(loglevel.upper(), "app_postprocess.log")
+    if not any(capture_files(f) for f in files):
+        raise click.UsageError("no perf data files found")
+    if percore and incremental:
+        raise click.UsageError("--incremental isn't supported with --percore")
+    if profile or profile_dump:
+        timing.start("postprocess", os.path.dirname(output), profile_dump)
+    process_files(
+        files,
+        output,
+        metric if metric else "events.txt",
+        cpus if cpus else 80,
+        duration,
+        persocket=persocket,
+        tolerance=tolerance,
+        jobs=jobs,
+        incremental=incremental,
+        percore=percore,
+    )
+    timing.write()
+
+
+# postprocess perf stat files into output (metrics.csv) and the averages,
+# statistics and store next to it. the library entry point of the CLI above,
+# used by the collector in its own process, where the events file model
+# parsed for collection is reused. files that don't exist are skipped. with
+# percore, core_pmu.csv is a perf stat -A capture, see process_core_stats,
+# which also reads the core_pmu.npz of the perf_event_open backend.
+# returns the number of samples in metrics.csv
+def process_files(
+    files,
+    output,
+    metric,
+    cores,
+    duration=None,
+    persocket=False,
+    tolerance=None,
+    jobs=1,
+    incremental=False,
+    percore=False,
+):
+    global metricfile
     logger.info("Started Ampere PMU Profiler processing")
+    output = str(output)
     resdir = os.path.dirname(output)
-    tmpout = os.path.join(resdir, "tmp.csv")
-    metricfile = metric if metric else "events.txt"
+    metricfile = str(metric)
     logger.info("eventfile used: " + metricfile)
     logger.info("results directory: " + resdir)
-    count = 0
-    for i, f in enumerate(files):
-        if not os.path.isfile(f):
-            continue
-        tmpfile = os.path.join(resdir, f"tmp{i}.csv")
-        is_persocket = (
-            persocket and "core_pmu" in f
-        )  # only core pmu support persocket mode
-        logger.debug("Persocket: " + str(is_persocket))
-        process_stats(f, is_persocket, tmpfile)
-        count += 1
-    if count > 1:
-        logger.debug("joining tmp files")
-        join_files(count, resdir, tmpout)
-    else:
-        tmpout = os.path.join(resdir, "tmp0.csv")
-    cores = cpus if cpus else 80
     constdict["const_cpus"] = cores
-    constdict["const_wall_clock_time"] = duration
+    constdict["const_wall_clock_time"] = float(duration) if duration else 0
     logger.info("cores: " + str(cores))
-    logger.debug("generate metrics from raw counters")
-    loadmetrics(tmpout, output, cores, persocket)
-    if not debug:
-        clean_temp_files(tmpout, files, resdir)
+    inputs = [str(f) for f in files if capture_files(f)]
+    if not inputs:
+        raise FileNotFoundError("no perf data files found")
+    compressed = [f for f in inputs if not os.path.isfile(f)]
+    if incremental and compressed:
+        raise ValueError(f"incremental postprocessing of compressed {compressed}")
+    if incremental and (percore or any(f.endswith(".npz") for f in inputs)):
+        raise ValueError("incremental postprocessing of per-core captures")
+
+    checkpoint = None
+    ends, until = [None] * len(inputs), None
+    if incremental:
+        options = run_options(
+            inputs,
+            output,
+            metricfile,
+            persocket=persocket,
+            cpus=cores,
+            duration=duration,
+            tolerance=tolerance,
+        )
+        checkpoint = load_checkpoint(resdir, options)
+        # only intervals complete in every input are processed, perf may
+        # still be writing the last one
+        ends, lasts = map(list, zip(*(last_interval(f) for f in inputs)))
+        if checkpoint is not None and any(
+            entry["header"] is None and last is not None
+            for entry, last in zip(checkpoint["inputs"], lasts)
+        ):
+            logger.info("samples in an input that had none before, starting over")
+            checkpoint = None
+        until = min((last for last in lasts if last is not None), default=None)
+        logger.debug("processing intervals until %s", until)
+    else:
+        remove_checkpoint(resdir)
+    starts = [0] * len(inputs)
+    headers = [None] * len(inputs)
+    if checkpoint is not None:
+        starts = [entry["offset"] for entry in checkpoint["inputs"]]
+        headers = [entry["header"] for entry in checkpoint["inputs"]]
+        tolerance = checkpoint["tolerance"]
+
+    # worker processes count in the cpu time of the stage once they exit
+    pool = ProcessPoolExecutor(jobs) if jobs > 1 else nullcontext()
+    with timing.stage("metrics", heavy=True), pool as executor:
+        streams = []
+        for i, f in enumerate(inputs):
+            is_persocket = (
+                persocket and "core_pmu" in f
+            )  # only core pmu support persocket mode
+            logger.debug("stream %d: %s, Persocket: %s", i, f, is_persocket)
+            if f.endswith(".npz") or (percore and "core_pmu" in f):
+                stream = process_core_stats(
+                    f, output, persocket, executor, jobs, percore
+                )
+            else:
+                stream = process_stats(
+                    f, is_persocket, executor, jobs, starts[i], ends[i], headers[i]
+                )
+            streams.append(timing.iterate("process_stats", stream))
+        logger.debug("generate metrics from raw counters")
+        progress = JoinProgress()
+        rows = join_files(streams, tolerance, until, progress)
+        with timing.stage("loadmetrics"):
+            results = loadmetrics(
+                timing.iterate("join_files", rows),
+                output,
+                cores,
+                persocket,
+                executor,
+                jobs,
+                checkpoint,
+            )
     logger.debug("constants: %s", constdict)
-    get_averages(output, resdir)
+    if results is None:
+        return 0
+    averages, stats = results
+    with timing.stage("get_averages"):
+        get_averages(averages, resdir)
+    with timing.stage("get_stats"):
+        get_stats(stats, resdir)
+    if incremental:
+        with timing.stage("checkpoint"):
+            offsets = []
+            for i, f in enumerate(inputs):
+                if progress.headers[i] is None:
+                    offsets.append(0)
+                elif progress.pending[i] is None:
+                    offsets.append(ends[i])
+                else:
+                    offsets.append(
+                        interval_offset(f, progress.pending[i], starts[i], ends[i])
+                    )
+            tolerance = progress.tolerance
+            save_checkpoint(
+                resdir,
+                {
+                    "options": options,
+                    "inputs": [
+                        {"file": f, "id": file_id(f), "offset": o, "header": h}
+                        for f, o, h in zip(options["files"], offsets, progress.headers)
+                    ],
+                    "tolerance": tolerance if math.isfinite(tolerance) else None,
+                    "bytes": os.path.getsize(output),
+                    "rows": averages.samples,
+                    "averages": averages.state(),
+                    "stats": stats.state(),
+                },
+            )
+    return averages.samples
 
 
 if __name__ == "__main__":
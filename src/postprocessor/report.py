@@ -0,0 +1,78 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import base64
+import html
+import logging
+import os
+import numpy as np
+
+logger = logging.getLogger("app")
+
+# the html reports load plotly.js from a copy next to them, written from the
+# installed plotly package, so they open without network access and the
+# reports of a run share one bundle
+plotlyjs_file = "plotly.min.js"
+
+
+# write the plotly.js bundle to directory, unless it's already there
+def write_plotlyjs(directory):
+    from plotly.offline import get_plotlyjs
+
+    bundle = get_plotlyjs().encode()
+    path = os.path.join(directory, plotlyjs_file)
+    if not os.path.isfile(path) or os.path.getsize(path) != len(bundle):
+        with open(path, "wb") as f:
+            f.write(bundle)
+        logger.debug("plotly.js written to %s", path)
+    return plotlyjs_file
+
+
+# script tag loading the shared bundle
+def plotlyjs_tag():
+    return f'<script src="{plotlyjs_file}" charset="utf-8"></script>'
+
+
+# a div with the figure and the script drawing it. the figure's arrays are
+# embedded as base64 binary. with x, every trace is drawn against these x
+# values, which are embedded once instead of once per trace
+def figure_html(fig, div_id, x=None):
+    script = ["(function () {"]
+    if x is not None:
+        fig.update_traces(x=None)
+        data = np.ascontiguousarray(x, dtype="<f8").tobytes()
+        script += [
+            f'  var bytes = atob("{base64.b64encode(data).decode()}");',
+            "  var buffer = new Uint8Array(bytes.length);",
+            "  for (var i = 0; i < bytes.length; i++) buffer[i] = bytes.charCodeAt(i);",
+            "  var x = new Float64Array(buffer.buffer);",
+        ]
+    # "</script>" in a title mustn't end the script
+    figure = fig.to_json().replace("</", "<\\/")
+    script.append(f"  var figure = {figure};")
+    if x is not None:
+        script.append("  figure.data.forEach(function (trace) { trace.x = x; });")
+    script += [
+        f'  Plotly.newPlot("{div_id}", figure.data, figure.layout, {{"responsive": true}});',
+        "})();",
+    ]
+    height = fig.layout.height
+    style = f"height:{height}px; width:100%;" if height else "width:100%;"
+    return (
+        f'<div id="{div_id}" style="{style}"></div>\n'
+        f'<script type="text/javascript">\n' + "\n".join(script) + "\n</script>\n"
+    )
+
+
+# write an html page with the figure, loading plotly.js from next to it
+def write_figure(path, title, fig, x=None):
+    write_plotlyjs(os.path.dirname(path) or ".")
+    page = (
+        "<!DOCTYPE html>\n<html>\n<head>\n"
+        f'<meta charset="utf-8">\n<title>{html.escape(title)}</title>\n'
+        f"{plotlyjs_tag()}\n</head>\n<body>\n"
+        f"{figure_html(fig, 'report', x)}</body>\n</html>\n"
+    )
+    with open(path, "w") as f:
+        f.write(page)
@@ -0,0 +1,170 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import csv
+import logging
+import math
+import os
+import numpy as np
+
+logger = logging.getLogger("app")
+
+# quantiles come from a sketch (DDSketch): values are counted in buckets
+# whose bounds grow by a factor gamma, so a quantile is within
+# relative_accuracy of the exact one and memory doesn't grow with the samples
+relative_accuracy = 0.01
+gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+log_gamma = math.log(gamma)
+min_value = 1e-9  # smaller magnitudes are counted as 0
+max_buckets = 2048  # per column and sign, the lowest buckets merge beyond
+quantiles = (0.5, 0.95, 0.99)
+# a sketch key is (column * 2 + negative) << bucket_bits | bucket + bucket_offset
+bucket_bits = 20
+bucket_offset = 1 << (bucket_bits - 1)
+bucket_mask = (1 << bucket_bits) - 1
+stats_fields = ["count", "mean", "stddev", "min"]
+stats_fields += [f"p{round(q * 100)}" for q in quantiles] + ["max"]
+
+
+# count, mean, stddev, min, max and quantiles of every column, updated a
+# chunk at a time. empty and non-finite values are skipped
+class MetricStats:
+    def __init__(self, names):
+        self.names = names
+        n = len(names)
+        self.counts = np.zeros(n, dtype=np.int64)
+        self.sums = np.zeros(n)
+        # the variance comes from sums of the values shifted by the first one
+        # of each column, which keeps it accurate for large means
+        self.shift = np.full(n, np.nan)
+        self.shifted = np.zeros(n)
+        self.squares = np.zeros(n)
+        self.mins = np.full(n, np.inf)
+        self.maxs = np.full(n, -np.inf)
+        self.zeros = np.zeros(n, dtype=np.int64)
+        self.keys = np.empty(0, dtype=np.int64)  # sketch buckets, sorted
+        self.buckets = np.empty(0, dtype=np.int64)  # values in each bucket
+
+    # add samples as written to metrics.csv, time first
+    def update(self, values):
+        values = values[:, 1:]
+        valid = np.isfinite(values)
+        if not valid.any():
+            return
+        first = valid.any(axis=0) & np.isnan(self.shift)
+        rows = valid.argmax(axis=0)
+        self.shift[first] = values[rows[first], np.flatnonzero(first)]
+        # accumulate row by row like the averages, so that the results don't
+        # depend on where the chunks break
+        shifted = np.where(valid, values - self.shift, 0.0)
+        self.sums = _running_sum(self.sums, np.where(valid, values, 0.0))
+        self.shifted = _running_sum(self.shifted, shifted)
+        self.squares = _running_sum(self.squares, shifted**2)
+        self.counts += valid.sum(axis=0)
+        self.mins = np.minimum(self.mins, np.where(valid, values, np.inf).min(axis=0))
+        self.maxs = np.maximum(self.maxs, np.where(valid, values, -np.inf).max(axis=0))
+        self._add(values, valid)
+
+    def _add(self, values, valid):
+        column = np.broadcast_to(np.arange(values.shape[1]), values.shape)[valid]
+        values = values[valid]
+        magnitude = np.abs(values)
+        zero = magnitude < min_value
+        self.zeros += np.bincount(column[zero], minlength=len(self.names))
+        bucket = np.ceil(np.log(magnitude[~zero]) / log_gamma).astype(np.int64)
+        group = column[~zero] * 2 + (values[~zero] < 0)
+        keys = group << bucket_bits | bucket + bucket_offset
+        self._merge(
+            np.concatenate((self.keys, keys)),
+            np.concatenate((self.buckets, np.ones(len(keys), dtype=np.int64))),
+        )
+
+    # sum up the counts of equal keys, merging the lowest buckets of a
+    # column and sign that has more than max_buckets
+    def _merge(self, keys, counts):
+        keys, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse.ravel(), counts).astype(np.int64)
+        group = keys >> bucket_bits
+        start = np.flatnonzero(np.concatenate(([True], group[1:] != group[:-1])))
+        size = np.diff(np.append(start, len(keys)))
+        if (size > max_buckets).any():
+            for first, n in zip(start[size > max_buckets], size[size > max_buckets]):
+                lowest = first + n - max_buckets
+                keys[first:lowest] = keys[lowest]
+            self._merge(keys, counts)
+            return
+        self.keys, self.buckets = keys, counts
+
+    # the quantiles of column i, NaN without samples
+    def quantiles(self, i):
+        if self.counts[i] == 0:
+            return [math.nan] * len(quantiles)
+        lo, mid, hi = np.searchsorted(
+            self.keys, [(2 * i + k) << bucket_bits for k in range(3)]
+        )
+        # buckets in order of value: negative ones from the largest magnitude
+        buckets = (self.keys & bucket_mask) - bucket_offset
+        value = 2 * gamma ** buckets.astype(np.float64) / (gamma + 1)
+        values = np.concatenate((-value[mid:hi][::-1], [0.0], value[lo:mid]))
+        counts = np.concatenate(
+            (self.buckets[mid:hi][::-1], [self.zeros[i]], self.buckets[lo:mid])
+        )
+        cumulative = np.cumsum(counts)
+        ranks = [q * (self.counts[i] - 1) for q in quantiles]
+        found = values[np.searchsorted(cumulative, ranks, side="right")]
+        return np.clip(found, self.mins[i], self.maxs[i]).tolist()
+
+    # count, mean, stddev, min, quantiles and max of column i
+    def summary(self, i):
+        count = int(self.counts[i])
+        if count == 0:
+            return [0] + [math.nan] * (len(stats_fields) - 1)
+        mean = self.sums[i] / count
+        m2 = max(self.squares[i] - self.shifted[i] ** 2 / count, 0.0)
+        stddev = math.sqrt(m2 / (count - 1)) if count > 1 else math.nan
+        return [count, mean, stddev, self.mins[i], *self.quantiles(i), self.maxs[i]]
+
+    # the running state, as kept in checkpoints
+    def state(self):
+        return {
+            "counts": self.counts.tolist(),
+            "sums": self.sums.tolist(),
+            "shift": self.shift.tolist(),
+            "shifted": self.shifted.tolist(),
+            "squares": self.squares.tolist(),
+            "mins": self.mins.tolist(),
+            "maxs": self.maxs.tolist(),
+            "zeros": self.zeros.tolist(),
+            "keys": self.keys.tolist(),
+            "buckets": self.buckets.tolist(),
+        }
+
+    def restore(self, state):
+        self.counts = np.array(state["counts"], dtype=np.int64)
+        self.sums = np.array(state["sums"], dtype=np.float64)
+        self.shift = np.array(state["shift"], dtype=np.float64)
+        self.shifted = np.array(state["shifted"], dtype=np.float64)
+        self.squares = np.array(state["squares"], dtype=np.float64)
+        self.mins = np.array(state["mins"], dtype=np.float64)
+        self.maxs = np.array(state["maxs"], dtype=np.float64)
+        self.zeros = np.array(state["zeros"], dtype=np.int64)
+        self.keys = np.array(state["keys"], dtype=np.int64)
+        self.buckets = np.array(state["buckets"], dtype=np.int64)
+
+
+# sums + the rows of values, added up in row order
+def _running_sum(sums, values):
+    return np.cumsum(np.vstack([sums, values]), axis=0)[-1]
+
+
+def get_stats(stats, resdir):
+    outfile = os.path.join(resdir, "metrics.stats.csv")
+    with open(outfile, "w") as fout:
+        outcsv = csv.writer(fout, dialect="excel")
+        outcsv.writerow(["metric"] + stats_fields)
+        for i, name in enumerate(stats.names):
+            count, *values = stats.summary(i)
+            cells = ["" if math.isnan(v) else "{:.4f}".format(v) for v in values]
+            outcsv.writerow([name, count] + cells)
+    logger.info("metric statistics: %s", outfile)
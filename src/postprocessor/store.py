@@ -0,0 +1,125 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import json
+from collections import Counter
+import logging
+import os
+import shutil
+import numpy as np
+
+logger = logging.getLogger("app")
+
+# a run store is a directory next to metrics.csv with one binary file per
+# column and an index.json describing them. counters are int64 with
+# missing_counter for samples that weren't collected, metrics and the time
+# index are float64 with NaN for empty cells. a per-core store (the percore
+# directory of a -A run) has the cpus in its index, each of its metric and
+# counter files holds rows x cpus values, row-major
+store_dir = "store"
+core_store_dir = "percore"
+missing_counter = np.iinfo(np.int64).min
+dtypes = {"time": "<f8", "metric": "<f8", "counter": "<i8"}
+
+
+def store_path(run_dir):
+    return os.path.join(run_dir, store_dir)
+
+
+def core_store_path(run_dir):
+    return os.path.join(run_dir, core_store_dir)
+
+
+# writes a new run store, or appends to one that has rows samples already.
+# with cores (the cpu numbers) it writes a per-core store
+class StoreWriter:
+    def __init__(self, path, metric_names, counter_names, rows=0, cores=None):
+        self.path = path
+        self.cores = cores
+        if not rows:
+            shutil.rmtree(path, ignore_errors=True)
+            os.makedirs(path)
+        self.columns = (
+            [{"name": "time", "kind": "time"}]
+            + [{"name": n, "kind": "metric"} for n in metric_names]
+            + [{"name": n, "kind": "counter"} for n in counter_names]
+        )
+        self.files = []
+        for i, column in enumerate(self.columns):
+            column["dtype"] = dtypes[column["kind"]]
+            column["file"] = f"{i:05}.bin"
+            file = os.path.join(path, column["file"])
+            if rows:
+                # drop anything written after the rows being appended to
+                os.truncate(file, rows * np.dtype(column["dtype"]).itemsize)
+            self.files.append(open(file, "ab" if rows else "wb"))
+        self.rows = rows
+
+    # append a chunk of samples, one column per store column. values of a
+    # per-core store are (samples, columns, cores), time repeated per core
+    def append(self, values):
+        for i, (column, f) in enumerate(zip(self.columns, self.files)):
+            data = values[:, i]
+            if self.cores is not None and column["kind"] == "time":
+                data = data[:, 0]
+            if column["kind"] == "counter":
+                data = np.where(np.isnan(data), missing_counter, data)
+            data.astype(column["dtype"]).tofile(f)
+        self.rows += len(values)
+
+    def close(self):
+        for f in self.files:
+            f.close()
+        index = {"rows": self.rows, "columns": self.columns}
+        if self.cores is not None:
+            index["cores"] = self.cores
+        with open(os.path.join(self.path, "index.json"), "w") as f:
+            json.dump(index, f, indent=1)
+        logger.debug("run store: %s, %d samples", self.path, self.rows)
+
+
+def read_index(path):
+    with open(os.path.join(path, "index.json"), "r") as f:
+        return json.load(f)
+
+
+# read a column of a run store, memory mapped. per-core columns other than
+# time are (rows, cores)
+def read_column(path, column, rows, cores=None):
+    shape = (rows,) if cores is None or column["kind"] == "time" else (rows, cores)
+    if rows == 0:
+        return np.empty(shape, dtype=column["dtype"])
+    file = os.path.join(path, column["file"])
+    return np.memmap(file, dtype=column["dtype"], mode="r", shape=shape)
+
+
+# load the samples of a run as a DataFrame, only the requested columns (and
+# time) are read. falls back to metrics.csv for runs without a store
+def read_run(run_dir, columns=None):
+    import pandas as pd
+
+    path = store_path(run_dir)
+    if not os.path.exists(os.path.join(path, "index.json")):
+        filepath = os.path.join(run_dir, "metrics.csv")
+        usecols = None if columns is None else lambda c: c == "time" or c in columns
+        return pd.read_csv(filepath, sep=",", usecols=usecols)
+
+    index = read_index(path)
+    data = {}
+    seen: Counter[str] = Counter()
+    for column in index["columns"]:
+        # repeated names are numbered the way pandas reads them from csv
+        name = column["name"]
+        if seen[name]:
+            name = f"{name}.{seen[name]}"
+        seen[column["name"]] += 1
+        if columns is not None and name != "time" and name not in columns:
+            continue
+        values = read_column(path, column, index["rows"])
+        if column["kind"] == "counter":
+            missing = values == missing_counter
+            if missing.any():
+                values = pd.arrays.IntegerArray(np.where(missing, 0, values), missing)
+        data[name] = values
+    return pd.DataFrame(data)
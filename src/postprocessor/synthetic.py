@@ -0,0 +1,200 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import logging
+import os
+import re
+import time
+import click
+import numpy as np
+from postprocessor.eventfile import event_groups, load_event_file
+
+logger = logging.getLogger("app")
+
+# synthetic perf stat -I -x, captures for an events file, to test and
+# benchmark postprocessing without root, perf or an Ampere PMU. counter
+# values follow the cycles of the cores with a utilization that drifts over
+# time, so IPC, frequency and MPKIs come out in plausible ranges
+frequency = 3.0e9  # cycles per second of a busy core
+pmu_counters = 10  # core events counted at once, more are multiplexed
+chunk_intervals = 1024  # intervals generated at a time
+cmn_name = re.compile(r"name='([^']*)'")
+
+
+# events counted per cycle, picked once per event from its name
+def _core_rates(names, rng):
+    rates = {}
+    for name in names:
+        base, _, modifier = name.partition(":")
+        if base in rates:
+            rate = rates[base]
+        elif "cycles" in base and "stall" not in base:
+            rate = 1.0
+        elif base in ("instructions", "op_spec", "op_retired") or "inst" in base:
+            rate = rng.uniform(0.5, 3.0)  # IPC
+        elif "slot" in base:
+            rate = rng.uniform(0.1, 1.5)  # of 4 slots per cycle
+        elif "stall" in base:
+            rate = rng.uniform(0.02, 0.4)
+        else:
+            rate = 10 ** rng.uniform(-4, -0.5)
+        rates[base] = rate
+        rates[name] = rate * (0.1 if modifier == "k" else 1.0)
+    return np.array([rates[name] for name in names])
+
+
+# the name perf prints for an event of the events file. core events perf
+# doesn't know by name are collected, and printed, as their rNNN code
+def _printed_names(events, hex_fraction, rng):
+    names = []
+    for event in events:
+        if event.pmu == "cmn":
+            match = cmn_name.search(event.name)
+            names.append(match.group(1) if match else event.name.lower())
+        elif event.code and rng.random() < hex_fraction:
+            names.append(event.code)
+        else:
+            names.append(event.name)
+    return names
+
+
+# write one perf stat file. chunks yields (intervals, events) arrays of
+# counts, sockets the per socket or per cpu prefixes ("S0,40," or "CPU0,"
+# ...) or [""]
+def _write_stats(path, names, running, chunks, times, sockets, not_counted, rng):
+    with open(path, "w") as f:
+        f.write(f"# started on {time.ctime(0)}\n\n")
+        start = 0
+        for values in chunks:
+            stamps = times[start : start + len(values)]
+            start += len(values)
+            missing = rng.random(values.shape) < not_counted
+            for stamp, row, skip in zip(stamps, values.tolist(), missing.tolist()):
+                lines = []
+                for k, (name, run) in enumerate(zip(names, running)):
+                    for s, socket in enumerate(sockets):
+                        i = k * len(sockets) + s
+                        if skip[i]:
+                            value, run_ns, pct = "<not counted>", 0, "0.00"
+                        else:
+                            value, run_ns, pct = int(row[i]), run[0], run[1]
+                        lines.append(
+                            f"{stamp:14.9f},{socket}{value},,{name},{run_ns},{pct},,\n"
+                        )
+                f.write("".join(lines))
+
+
+# utilization of the cores per interval, a random walk between 0.2 and 1
+def _utilization(count, rng):
+    walk = np.cumsum(rng.normal(0, 0.05, count))
+    return 0.6 + 0.4 * np.sin(walk)
+
+
+# the counts of each interval, chunk_intervals at a time: the work of the
+# interval times the rate of each event, with some noise
+def _counts(work, rates, rng):
+    for lo in range(0, len(work), chunk_intervals):
+        hi = min(lo + chunk_intervals, len(work))
+        noise = rng.lognormal(0, 0.05, (hi - lo, len(rates)))
+        yield work[lo:hi, None] * rates * noise
+
+
+# write core_pmu.csv (and cmn_pmu.csv if the events file has CMN events) to
+# output, as the collector would for duration seconds. like a capture ended
+# with Ctrl-C, the last interval is a short one. with percore the core
+# counters are those of each core, like perf stat -A prints them. returns the
+# files written
+def generate(
+    event_file,
+    output,
+    cores=80,
+    interval=1.0,
+    duration=60.0,
+    persocket=False,
+    sockets=2,
+    hex_fraction=0.2,
+    not_counted=0.01,
+    seed=0,
+    percore=False,
+):
+    rng = np.random.default_rng(seed)
+    model = load_event_file(event_file)
+    intervals = max(int(round(duration / interval)), 1)
+    files = []
+    os.makedirs(output, exist_ok=True)
+    for pmu in ("core", "cmn"):
+        events = [e for e in model.events if e.pmu == pmu]
+        if not events:
+            continue
+        names = _printed_names(events, hex_fraction, rng)
+        groups = [g for g in event_groups(model.events) if g[0].pmu == pmu]
+        share = min(1.0, pmu_counters / len(events)) if pmu == "core" else 1.0
+        run_ns = int(interval * 1e9 * share)
+        running = [(run_ns, f"{share * 100:.2f}")] * len(names)
+        logger.debug("%s: %d events in %d groups", pmu, len(events), len(groups))
+
+        prefixes = [""]
+        if percore and pmu == "core":
+            prefixes = [f"CPU{c}," for c in range(cores)]
+        elif persocket and pmu == "core":
+            prefixes = [f"S{s},{cores // sockets}," for s in range(sockets)]
+        if pmu == "core":
+            rates = _core_rates([e.name for e in events], rng)
+            scale = cores / len(prefixes) * interval * frequency
+        else:
+            rates = 10 ** rng.uniform(6, 9, len(events))  # per second
+            scale = interval
+        rates = np.repeat(rates, len(prefixes))
+        # perf's timestamps drift a little after each interval
+        times = np.arange(1, intervals + 2) * interval + rng.uniform(1e-4, 2e-3)
+        times[-1] = times[-2] + interval * rng.uniform(0.1, 0.9)
+        load = _utilization(intervals + 1, rng)
+        load[-1] *= (times[-1] - times[-2]) / interval
+        chunks = _counts(load * scale, rates, rng)
+        path = os.path.join(output, f"{pmu}_pmu.csv")
+        _write_stats(path, names, running, chunks, times, prefixes, not_counted, rng)
+        files.append(path)
+        logger.info("%s: %d intervals of %d events", path, intervals, len(names))
+    return files
+
+
+@click.command()
+@click.option("-e", "--eventfile", required=True, type=click.Path(exists=True))
+@click.option("-o", "--output", default="synthetic", help="Output directory")
+@click.option("-c", "--cores", type=int, default=80, help="Number of cores")
+@click.option("-i", "--interval", type=float, default=1.0, help="Interval (s)")
+@click.option("-n", "--duration", type=float, default=60.0, help="Duration (s)")
+@click.option("-s", "--persocket", is_flag=True, help="Per socket core counters")
+@click.option("-A", "--percore", is_flag=True, help="Per core core counters")
+@click.option("--hex-fraction", type=float, default=0.2, help="Events named rNNN")
+@click.option("--not-counted", type=float, default=0.01, help="<not counted> rate")
+@click.option("--seed", type=int, default=0, help="Random seed")
+def main(
+    eventfile,
+    output,
+    cores,
+    interval,
+    duration,
+    persocket,
+    percore,
+    hex_fraction,
+    not_counted,
+    seed,
+):
+    generate(
+        eventfile,
+        output,
+        cores=cores,
+        interval=interval,
+        duration=duration,
+        persocket=persocket,
+        hex_fraction=hex_fraction,
+        not_counted=not_counted,
+        seed=seed,
+        percore=percore,
+    )
+
+
+if __name__ == "__main__":
+    main()
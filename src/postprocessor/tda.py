@@ -4,11 +4,45 @@
 
 from postprocessor import icicle
 from postprocessor import sunburst
+from postprocessor import timeline
+import logging
 import os
-from postprocessor.postprocess import setup_logger
+from collector import timing
+from collector.logger_setup import setup_logger
+from postprocessor.report import figure_html, plotlyjs_tag, write_plotlyjs
+from postprocessor.store import read_index, read_run, store_path
+from postprocessor.tdatree import build_tree
 import click
+import pandas as pd
 
-logger = setup_logger()
+logger = logging.getLogger("app")
+
+
+# averages of the TDA metrics (names ending with ".") as metric, value rows.
+# computed from the run store if there is one, else read from average_csv
+def read_tda_averages(res_dir, average_csv):
+    path = store_path(res_dir)
+    if os.path.exists(os.path.join(path, "index.json")):
+        names = [
+            c["name"]
+            for c in read_index(path)["columns"]
+            if c["kind"] == "metric" and c["name"].endswith(".")
+        ]
+        means = read_run(res_dir, names)[names].mean()
+        return pd.DataFrame({"metric": names, "value": means.to_numpy()})
+    try:
+        return pd.read_csv(
+            average_csv, keep_default_na=False, names=["metric", "value"]
+        )
+    except FileNotFoundError:
+        raise SystemExit(f"{average_csv} File not found")
+
+
+# whether the samples of the run are there, in the store or metrics.csv
+def has_samples(res_dir):
+    return os.path.exists(
+        os.path.join(store_path(res_dir), "index.json")
+    ) or os.path.exists(os.path.join(res_dir, "metrics.csv"))
 
 
 def write_html(res_dir, base_input_file, html_report_out, chart_type):
@@ -29,22 +63,36 @@ def write_html(res_dir, base_input_file, html_report_out, chart_type):
             # text('input{position: fixed;}')
 
             with tag("head"):
-                doc.asis(
-                    '<script src="https://cdn.plot.ly/plotly-latest.min.js"></script>'
-                )
+                # plotly.js is loaded from the run directory, not a CDN
+                write_plotlyjs(res_dir)
+                doc.asis(plotlyjs_tag())
                 with tag("h1"):
                     text("Ampere® PMU Profiler")
             with tag("body"):
-                if chart_type == "icicle":
-                    fig1 = icicle.get_icicle(tda_inp)
-                else:
-                    fig1 = sunburst.get_sunburst(tda_inp, res_dir)
+                with timing.stage("read_tda_averages"):
+                    tda_df = read_tda_averages(res_dir, tda_inp)
+                tree = build_tree(tda_df["metric"].tolist())
+                with timing.stage(chart_type):
+                    if chart_type == "icicle":
+                        fig1 = icicle.get_icicle(tda_df, tree)
+                    else:
+                        fig1 = sunburst.get_sunburst(tda_df, res_dir, tree)
                 with tag("h2", align="center"):
                     text("Top Down  Accounting (TDA)")
                 with doc.tag("div"):
                     doc.attr(id="tda")
-                    doc.asis(fig1.to_html(full_html=False, include_plotlyjs="cdn"))
+                    with timing.stage("to_html"):
+                        html = figure_html(fig1, "tda_chart")
+                    doc.asis(html)
                     # doc.asis(fig1)
+                # the tree of every interval, for runs with the samples
+                if len(tree.ids) > 1 and has_samples(res_dir):
+                    with timing.stage("timeline", heavy=True):
+                        fig2 = timeline.get_timeline(res_dir, tree)
+                        html = figure_html(fig2, "tda_timeline")
+                    with doc.tag("div"):
+                        doc.attr(id="timeline")
+                        doc.asis(html)
 
         result = indent(doc.getvalue())
         if "/" in html_report_out:
@@ -74,8 +122,27 @@ def write_html(res_dir, base_input_file, html_report_out, chart_type):
     help="Type of TDA chart to generate.",
     show_default=True,
 )
-def main(input_dir, chart_type):
-    write_html(input_dir, "metrics.csv", "tda.html", chart_type)
+@click.option(
+    "--profile", is_flag=True, help="write the time of each stage to timings.json"
+)
+@click.option(
+    "--profile-dump",
+    multiple=True,
+    type=click.Choice(timing.dump_kinds),
+    help="also dump snapshots of the heavy stages, implies --profile",
+)
+def main(input_dir, chart_type, profile, profile_dump):
+    # run from the app, its logger is already set up
+    if not logger.handlers:
+        setup_logger()
+    # run from the app without --profile, the stages count in the app's timings
+    profiling = profile or profile_dump
+    if profiling:
+        timing.start("tda", input_dir, profile_dump)
+    with timing.stage("write_html", heavy=True):
+        write_html(input_dir, "metrics.csv", "tda.html", chart_type)
+    if profiling:
+        timing.write()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,200 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import logging
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+from postprocessor.store import read_run
+
+logger = logging.getLogger("app")
+
+# the TDA metrics (names ending with ".") form a tree under the pipeline: the
+# trailing dots of a name give its level (frontend_. is on level 1,
+# frontend_latency_.. on level 2) and its parent is the metric on the level
+# above that comes last before it in the file
+root = "pipeline"
+descriptions = {
+    "pipeline": "% total pipeline slots",
+    "frontend": "% slots where frontend undersupplies the backend",
+    "frontend_latency": "% slots where processor was stalled due to frontend latency issues(cache/TLB); nothing to dispatch",
+    "i_cache_miss": "% cycles the processor was stalled due to instruction cache miss",
+    "i_tlb_miss": "% cycles the processor was stalled due to instruction TLB miss",
+    "recovery": "% cycles the processor was stalled due to flush recovery",
+    "bob_full": "% cycles the processor was stalled and backend out-of-order buffer was full(instruction scheduling)",
+    "frontend_bw": "% slots the processor didn't dispatch at full bandwidth - able to dispatch partial slots only (1,2 or 3 µops)",
+    "backend": "% slots where no µops are delivered due to lack of resources (memory/core)",
+    "memory": "% slots the processor was stalled due to backend memory subsystem issues (cache/TLB miss)",
+    "d_cache_l1_miss": "% cycles the processor was stalled due to data L1 cache miss",
+    "d_tlb_miss": "% cycles the processor was stalled due to data TLB miss",
+    "d_cache_l2_miss": "% cycles the processor was stalled due to data L2 cache miss",
+    "core": "% slots the processor was stalled due to backend non-memory subsystem issues",
+    "resource": "% cycles the processor was stalled due to core resource shortage",
+    "rob_full": "% cycles the processor was stalled and reorder buffer was full (out of order instructions waiting to be commited)",
+    "ixu_full": "% cycles the processor was stalled and integer execution unit was full (arithmetic and logic ops on integers)",
+    "fsu_full": "% cycles the processor was stalled and floating & SIMD unit was full (arithmetic on decimals and SIMD ops)",
+    "lob_full": "% cycles the processor was stalled and load-store buffer was full (managing memory read/write ops)",
+    "sob_full": "% cycles the processor was stalled and store buffer was full (holding data that needs to be written to memory)",
+    "retired": "% slots retiring, (useful work)",
+    "pipe_util": "% execute slots utilized",
+    "ixu_pipe_util": "% IXU execute slots utilized",
+    "fsu_pipe_util": "% FSU execute slots utilized",
+    "lost": "% slots wasted due to misspeculation",
+    "branch_mispredict": "% slots lost due to branch misprediction",
+    "other_clears": "% slots lost due to other/non-branch misspeculation",
+}
+# color of the level 1 nodes, the nodes under them take the same color
+colors = {
+    "retired": "#00CC96",  # Teal / Medium Aquamarine
+    "backend": "#636EFA",  # Royal Blue / Cornflower Blue
+    "lost": "#AB63FA",  # Amethyst / Muted Purple
+    "frontend": "#EF553B",  # Tomato / Coral Red
+    "(?)": "#B0C4DE",  # LightSteelBlue (default)
+}
+
+
+# the nodes of the tree in file order, the pipeline (100% of the slots)
+# first. parents come before their children
+class TdaTree(NamedTuple):
+    metrics: list[str]  # metrics.csv column of each node, "pipeline" for the root
+    ids: list[str]  # names without the trailing dots
+    parents: np.ndarray  # index of each node's parent, -1 for the root
+    levels: np.ndarray  # 0 for the root
+
+
+def is_tda_metric(name):
+    return name.endswith(".")
+
+
+def node_id(name):
+    return name.replace("_.", "").replace(".", "")
+
+
+# the tree of the TDA metrics in names, in events file order as in
+# metrics.csv. metrics without a metric on the level above before them are
+# left out
+def build_tree(names):
+    metrics, parents, levels = [root], [-1], [0]
+    last = {0: 0}  # level -> node seen last
+    for name in names:
+        if not is_tda_metric(name) or name == root:
+            continue
+        level = len(name) - len(name.rstrip("."))
+        if level - 1 not in last:
+            logger.debug("TDA metric %s has no parent", name)
+            continue
+        metrics.append(name)
+        parents.append(last[level - 1])
+        levels.append(level)
+        last[level] = len(metrics) - 1
+        for deeper in [k for k in last if k > level]:
+            del last[deeper]
+    ids = [node_id(m) for m in metrics]
+    return TdaTree(metrics, ids, np.array(parents), np.array(levels))
+
+
+# scale the values (samples x nodes, or one row of nodes) top down so that
+# the children of every node add up to it, keeping their ratios. children
+# that are all 0 share their parent equally. the root is 100, negative
+# values count as 0 and NaN stays NaN
+def realign(tree, values):
+    values = np.clip(np.array(values, dtype=np.float64), 0, None)
+    values[..., 0] = 100.0
+    count = np.bincount(tree.parents[1:], minlength=len(tree.ids))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for level in range(1, int(tree.levels.max(initial=0)) + 1):
+            kids = np.flatnonzero(tree.levels == level)
+            parents = tree.parents[kids]
+            # sum of the children of each node, NaN children skipped
+            owner = np.zeros((len(kids), len(tree.ids)))
+            owner[np.arange(len(kids)), parents] = 1.0
+            total = (np.nan_to_num(values[..., kids]) @ owner)[..., parents]
+            above = values[..., parents]
+            values[..., kids] = np.where(
+                total > 0, values[..., kids] / total * above, above / count[parents]
+            )
+    return values
+
+
+# nodes whose children don't add up to them within tolerance, in any sample
+def mismatches(tree, values, tolerance=1e-2):
+    values = np.atleast_2d(values)
+    totals = np.zeros_like(values)
+    np.add.at(totals.T, tree.parents[1:], np.nan_to_num(values[:, 1:]).T)
+    wrong = (np.abs(values - totals) > tolerance) & (totals != 0)
+    return [tree.ids[i] for i in np.flatnonzero(wrong.any(axis=0))]
+
+
+# the nodes showing the whole pipeline down to depth: those on that level
+# and the ones above without children on it. their values add up to 100
+def frontier(tree, depth):
+    has_kids = np.zeros(len(tree.ids), dtype=bool)
+    has_kids[tree.parents[(tree.levels <= depth) & (tree.parents >= 0)]] = True
+    keep = (tree.levels == depth) | ((tree.levels < depth) & ~has_kids)
+    return [i for i in np.flatnonzero(keep) if tree.levels[i] > 0]
+
+
+# the level 1 node each node is under, the root for itself
+def top_level(tree):
+    top = np.arange(len(tree.ids))
+    for i in range(1, len(tree.ids)):
+        if tree.levels[i] > 1:
+            top[i] = top[tree.parents[i]]
+    return top
+
+
+# the tree of the average TDA metrics (metric, value rows) as the charts
+# take it: a row per node with its metric, value, parent and node id, level
+# and description. values are rounded to 2 decimals and realigned. the tree
+# is built from the metrics if not given
+def tree_frame(df, tree=None):
+    if tree is None:
+        tree = build_tree(df["metric"].tolist())
+    averages = dict(zip(df["metric"], pd.to_numeric(df["value"], errors="coerce")))
+    values = [round(averages.get(m, np.nan), 2) for m in tree.metrics]
+    values = realign(tree, values)
+    wrong = mismatches(tree, values)
+    if wrong:
+        logger.warning("TDA children don't add up to %s", ", ".join(wrong))
+    return pd.DataFrame(
+        {
+            "metric": tree.metrics,
+            "value": values,
+            "parent": ["" if p < 0 else tree.ids[p] for p in tree.parents],
+            "id": tree.ids,
+            "level": tree.levels,
+            "description": [descriptions.get(i, "Description") for i in tree.ids],
+        }
+    )
+
+
+# the tree of every interval of a run at once, from the store or metrics.csv:
+# the time of the intervals and their realigned values, intervals x nodes.
+# intervals without any TDA sample are NaN
+def interval_values(res_dir, tree):
+    run = read_run(res_dir, tree.metrics[1:])
+    values = np.full((len(run), len(tree.metrics)), np.nan)
+    for i, name in enumerate(tree.metrics[1:], 1):
+        if name in run:
+            values[:, i] = run[name].to_numpy(dtype=np.float64, na_value=np.nan)
+    empty = np.isnan(values[:, 1:]).all(axis=1)
+    values = realign(tree, values)
+    values[empty] = np.nan
+    return run["time"].to_numpy(dtype=np.float64), values
+
+
+# reduce the intervals to at most points buckets of consecutive intervals,
+# timed by their first interval. the means of a bucket keep the children of
+# every node adding up to it
+def bucket_means(time, values, points):
+    if not points or len(time) <= points:
+        return time, values
+    width = -(-len(time) // points)
+    buckets = -(-len(time) // width)
+    padding = np.full((buckets * width - len(time), values.shape[1]), np.nan)
+    values = np.concatenate((values, padding)).reshape(buckets, width, -1)
+    count = (~np.isnan(values)).sum(axis=1)
+    with np.errstate(invalid="ignore"):
+        means = np.nansum(values, axis=1) / count
+    return time[::width], means
@@ -0,0 +1,61 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+from postprocessor.plot import max_points
+from postprocessor.tdatree import bucket_means, colors, frontier, interval_values
+
+depths = (1, 2)  # levels of the tree shown, one chart each
+
+""" returns stacked areas of the TDA of every interval, L1 and L2 """
+
+
+def get_timeline(res_dir, tree, points=max_points):
+    time, values = interval_values(res_dir, tree)
+    intervals = len(time)
+    time, values = bucket_means(time, values, points)
+
+    fig = make_subplots(
+        rows=len(depths),
+        cols=1,
+        shared_xaxes=True,
+        vertical_spacing=0.08,
+        subplot_titles=[f"<b>Level {depth}</b>" for depth in depths],
+    )
+    for row, depth in enumerate(depths, 1):
+        for i in frontier(tree, depth):
+            # level 1 keeps the colors of the sunburst
+            color = colors.get(tree.ids[i], colors["(?)"]) if depth == 1 else None
+            fig.add_trace(
+                go.Scatter(
+                    x=time,
+                    y=values[:, i],
+                    name=tree.ids[i],
+                    legendgroup=f"L{depth}",
+                    legendgrouptitle_text=f"Level {depth}",
+                    stackgroup=f"L{depth}",
+                    mode="lines",
+                    line=dict(width=0.5, color=color),
+                    hovertemplate="%{y:.2f}%",
+                ),
+                row=row,
+                col=1,
+            )
+        fig.update_yaxes(title_text="% slots", range=[0, 100], row=row, col=1)
+    fig.update_xaxes(title_text="time (s)", row=len(depths), col=1)
+    title = "<b>TDA over time</b>"
+    if intervals > len(time):
+        title += (
+            f"<br><sup>means of {intervals} intervals shown in"
+            f" {len(time)} points</sup>"
+        )
+    fig.update_layout(
+        title=title,
+        height=400 * len(depths),
+        hovermode="x unified",
+        legend=dict(groupclick="toggleitem"),
+        margin=dict(t=80, l=25, r=25, b=25),
+    )
+    return fig
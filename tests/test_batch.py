@@ -0,0 +1,57 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import json
+import os
+from click.testing import CliRunner
+from test_synthetic import events_dir, read_metrics
+from postprocessor import batch, cli
+from postprocessor.batch import process_run
+from postprocessor.synthetic import generate
+
+
+def test_batch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    event_file = os.path.join(events_dir, "events.txt")
+    generate(event_file, tmp_path / "runs" / "good", duration=10)
+    generate(event_file, tmp_path / "runs" / "broken", duration=10)
+    with open(tmp_path / "runs" / "broken" / "run.json", "w") as f:
+        json.dump({"event_file": str(tmp_path / "missing.txt")}, f)
+    args = ["batch", str(tmp_path / "runs"), "--metric", event_file, "--jobs", "1"]
+    result = CliRunner().invoke(cli.main, args)
+    assert result.exit_code == 1
+    assert "1 done, 0 skipped, 1 failed" in result.output
+    assert len(read_metrics(tmp_path / "runs" / "good")) == 10
+    # outputs newer than the inputs are kept
+    result = CliRunner().invoke(cli.main, args)
+    assert "0 done, 1 skipped, 1 failed" in result.output
+
+
+# a worker that dies like one killed for running out of memory
+def crash(run):
+    if run.path.endswith("crash"):
+        os._exit(1)
+    return process_run(run)
+
+
+def test_worker_killed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    event_file = os.path.join(events_dir, "events.txt")
+    for name in ("crash", "good"):
+        generate(event_file, tmp_path / "runs" / name, duration=10)
+    monkeypatch.setattr(batch, "process_run", crash)
+    args = ["batch", str(tmp_path / "runs"), "--metric", event_file, "--jobs", "2"]
+    result = CliRunner().invoke(cli.main, args)
+    # the broken pool fails the runs it had, the batch is still summarized
+    assert result.exit_code == 1
+    assert "2 runs in" in result.output
+    assert f"failed: {tmp_path / 'runs' / 'crash'}: BrokenProcessPool" in result.output
+
+
+def test_help():
+    # the group's help, not the default command's
+    for option in ("--help", "-h"):
+        result = CliRunner().invoke(cli.main, [option])
+        assert result.exit_code == 0
+        assert "batch" in result.output and "--output" not in result.output
@@ -0,0 +1,46 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import os
+import sys
+import pytest
+from test_synthetic import events_dir, postprocess_run
+from postprocessor import capture
+from postprocessor.capture import ChunkWriter, capture_files
+from postprocessor.synthetic import generate
+
+
+def test_compressed_capture(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    event_file = os.path.join(events_dir, "events_ampereone_ac04.txt")
+    generate(event_file, tmp_path / "plain", duration=60)
+    (tmp_path / "gz").mkdir()
+    for name in ("core_pmu.csv", "cmn_pmu.csv"):
+        writer = ChunkWriter(tmp_path / "gz" / name, "gzip", size=50_000)
+        with open(tmp_path / "plain" / name, "rb") as f:
+            for line in f:
+                writer.write(line)
+        writer.close()
+    chunks = capture_files(tmp_path / "gz" / "core_pmu.csv")
+    assert len(chunks) > 3 and chunks[0].endswith("core_pmu.00000.csv.gz")
+    plain = os.path.getsize(tmp_path / "plain" / "core_pmu.csv")
+    assert sum(os.path.getsize(c) for c in chunks) < plain / 4
+
+    assert postprocess_run(tmp_path / "plain", event_file, 60).exit_code == 0
+    # the chunks are read by the name of the plain file
+    files = [str(tmp_path / "gz" / n) for n in ("cmn_pmu.csv", "core_pmu.csv")]
+    result = postprocess_run(tmp_path / "gz", event_file, 60, files=files)
+    assert result.exit_code == 0, result.output
+    with open(tmp_path / "plain" / "metrics.csv") as a, open(
+        tmp_path / "gz" / "metrics.csv"
+    ) as b:
+        assert a.read() == b.read()
+
+
+def test_missing_zstandard(monkeypatch):
+    # None in sys.modules makes the import fail like a missing package
+    monkeypatch.setitem(sys.modules, "zstandard", None)
+    with pytest.raises(RuntimeError, match="zstandard package") as info:
+        capture._zstandard()
+    assert isinstance(info.value.__cause__, ImportError)
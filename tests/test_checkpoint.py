@@ -0,0 +1,75 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import json
+import logging
+import os
+from test_posprocess import write_capture, write_events
+from postprocessor import postprocess
+from postprocessor.checkpoint import checkpoint_path
+from postprocessor.store import read_run
+
+counters = ["cycles", "instructions", "bus_access"]
+
+
+# postprocess the capture of run_dir as it is after intervals
+def process(run_dir, events, intervals, incremental=True):
+    inputs = [
+        write_capture(run_dir / "core_pmu.csv", counters, intervals),
+        write_capture(run_dir / "cmn_pmu.csv", ["mem"], intervals, skip=(7,)),
+    ]
+    output = run_dir / "metrics.csv"
+    return postprocess.process_files(inputs, output, events, 4, incremental=incremental)
+
+
+def test_resume(tmp_path, caplog):
+    caplog.set_level(logging.INFO, "app")
+    events = write_events(tmp_path / "events.txt")
+    # with values that aren't exact in floating point
+    with open(events, "a") as f:
+        f.write("ratio = 1000 * [cycles] / ([instructions] + [bus_access] + 7)\n")
+    for run in ("full", "grown", "once"):
+        (tmp_path / run).mkdir()
+    assert process(tmp_path / "full", events, 30, incremental=False) == 29
+    # perf may still be writing the last interval, it's left for the next run
+    assert process(tmp_path / "grown", events, 12) == 11
+    assert process(tmp_path / "grown", events, 20) == 19
+    assert process(tmp_path / "grown", events, 30) == 29
+    assert caplog.text.count("resuming from checkpoint") == 2
+    with open(checkpoint_path(tmp_path / "grown")) as f:
+        assert json.load(f)["rows"] == 29
+    # nothing new, nothing changes
+    assert process(tmp_path / "grown", events, 30) == 29
+    for name in ("metrics.csv", "metrics.average.csv", "metrics.stats.csv"):
+        full, grown = tmp_path / "full" / name, tmp_path / "grown" / name
+        assert full.read_bytes() == grown.read_bytes()
+    assert read_run(tmp_path / "full").equals(read_run(tmp_path / "grown"))
+    # the running state doesn't depend on where the runs broke
+    assert process(tmp_path / "once", events, 30) == 29
+    states = []
+    for run in ("once", "grown"):
+        with open(checkpoint_path(tmp_path / run)) as f:
+            states.append(json.load(f)["stats"])
+    assert states[0] == states[1]
+
+
+def test_stale_checkpoint(tmp_path, caplog):
+    caplog.set_level(logging.INFO, "app")
+    events = write_events(tmp_path / "events.txt")
+    inputs = [tmp_path / "core_pmu.csv", tmp_path / "cmn_pmu.csv"]
+    output = tmp_path / "metrics.csv"
+    process(tmp_path, events, 10)
+    # a new capture at the same path starts over
+    capture = inputs[0]
+    capture.write_text(capture.read_text().replace("10:00:00", "11:00:00"))
+    caplog.clear()
+    postprocess.process_files(inputs, output, events, 4, incremental=True)
+    assert "core_pmu.csv was replaced" in caplog.text
+    # so do other options
+    caplog.clear()
+    postprocess.process_files(inputs, output, events, 8, incremental=True)
+    assert "options or inputs changed" in caplog.text
+    # a run that isn't incremental removes the checkpoint
+    postprocess.process_files(inputs, output, events, 8)
+    assert not os.path.exists(checkpoint_path(tmp_path))
@@ -0,0 +1,151 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import ast
+import hashlib
+import os
+import pickle
+import pytest
+from postprocessor import eventfile
+from postprocessor.eventfile import (
+    Event,
+    event_groups,
+    load_event_file,
+    parse_event_file,
+    rename_events,
+    socket_events,
+)
+
+text = (
+    "# core events\n"
+    "events_core\n"
+    "cycles\n"
+    "{\n"
+    "inst_retired | r08\n"
+    "bus_access:k\n"
+    "}\n"
+    "stall\n"
+    "events_cmn\n"
+    "ARM_CMN_0/hnf_pocq_reqs_recvd/\n"
+    ";\n"
+    "IPC = [inst_retired] / [cycles]\n"
+    "not a metric\n"
+    "CPI = 1 / [IPC]\n"
+    "##uncore_metrics, don't remove this seperator\n"
+    "util = [bus_access:k] / ([const_cpus] * [IPC])\n"
+)
+
+
+# a model that compares by value, the formula trees don't
+def dump(model):
+    return model.events, [m._replace(tree=ast.dump(m.tree)) for m in model.metrics]
+
+
+def test_parse():
+    model = parse_event_file(text)
+    assert model.events == [
+        Event("cycles", None, "core", 0, False),
+        Event("inst_retired", "r08", "core", 0, True),
+        Event("bus_access:k", None, "core", 0, True),
+        Event("stall", None, "core", 1, False),
+        Event("ARM_CMN_0/hnf_pocq_reqs_recvd/", None, "cmn", 1, False),
+    ]
+    ipc, cpi, util = model.metrics
+    assert ipc.events == ["inst_retired", "cycles"] and not ipc.uncore
+    # metrics defined above can be used like events
+    assert cpi.references == ["IPC"] and not ipc.references
+    assert util.uncore and util.references == ["IPC"]
+    assert [[e.name for e in group] for group in event_groups(model.events)] == [
+        ["cycles"],
+        ["inst_retired", "bus_access:k"],
+        ["stall"],
+        ["ARM_CMN_0/hnf_pocq_reqs_recvd/"],
+    ]
+
+
+def test_socket_events():
+    util = parse_event_file(text).metrics[2]
+    assert socket_events(util, "") == util.events
+    # events after the first const keep their names, metrics always get the socket
+    assert socket_events(util, "s1.") == ["s1.bus_access:k", "const_cpus", "s1.IPC"]
+    assert rename_events(util, ["a", "b", "c"]) == "[a] / ([b] * [c])"
+
+
+def test_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(eventfile, "cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(eventfile, "_loaded", {})
+    path = tmp_path / "events.txt"
+    path.write_text(text)
+    model = load_event_file(path)
+    assert dump(model) == dump(parse_event_file(text))
+    # cached by the sha256 of the content
+    digest = hashlib.sha256(text.encode()).hexdigest()
+    cache = eventfile._cache_file(digest)
+    assert os.path.basename(cache).startswith(digest)
+    with open(cache, "rb") as f:
+        assert dump(pickle.load(f)) == dump(model)
+
+    # a cached file isn't parsed again, in another process too
+    monkeypatch.setattr(eventfile, "_loaded", {})
+
+    def fail(text):
+        raise AssertionError("parsed")
+
+    monkeypatch.setattr(eventfile, "parse_event_file", fail)
+    assert load_event_file(path) is not model
+    assert dump(load_event_file(path)) == dump(model)
+    # a copy has the same content
+    copy = tmp_path / "copy.txt"
+    copy.write_text(text)
+    assert load_event_file(copy) is load_event_file(path)
+
+
+def test_corrupt_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(eventfile, "cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(eventfile, "_loaded", {})
+    path = tmp_path / "events.txt"
+    path.write_text(text)
+    cache = eventfile._cache_file(hashlib.sha256(text.encode()).hexdigest())
+    os.makedirs(os.path.dirname(cache))
+    with open(cache, "wb") as f:
+        f.write(b"\x80\x04truncated")
+    # parsed again and the cache rewritten
+    assert dump(load_event_file(path)) == dump(parse_event_file(text))
+    with open(cache, "rb") as f:
+        assert dump(pickle.load(f)) == dump(parse_event_file(text))
+    # an edited file is parsed again
+    path.write_text(text + "CPI2 = 2 / [IPC]\n")
+    assert len(load_event_file(path).metrics) == 4
+
+
+def test_cache_owner(tmp_path, monkeypatch):
+    if os.geteuid() != 0:
+        pytest.skip("needs root to own the cache")
+    monkeypatch.setattr(eventfile, "cache_dir", str(tmp_path / "cache"))
+    path = tmp_path / "events.txt"
+    path.write_text(text)
+    cache = eventfile._cache_file(hashlib.sha256(text.encode()).hexdigest())
+    os.makedirs(eventfile.cache_dir)
+
+    def load(owner, mode, directory=0):
+        with open(cache, "wb") as f:
+            pickle.dump("not a model", f)
+        os.chown(cache, owner, 0)
+        os.chmod(cache, mode)
+        os.chown(eventfile.cache_dir, directory, 0)
+        monkeypatch.setattr(eventfile, "_loaded", {})
+        return load_event_file(path)
+
+    assert load(0, 0o644) == "not a model"
+    # a cache another user could have written isn't loaded by root, it's
+    # parsed again and the cache replaced
+    for owner, mode in ((1000, 0o644), (0, 0o666)):
+        assert dump(load(owner, mode)) == dump(parse_event_file(text))
+        assert os.stat(cache).st_uid == 0
+        with open(cache, "rb") as f:
+            assert dump(pickle.load(f)) == dump(parse_event_file(text))
+    # in a directory of another user, the cache isn't used at all
+    assert dump(load(0, 0o644, 1000)) == dump(parse_event_file(text))
+    with open(cache, "rb") as f:
+        assert pickle.load(f) == "not a model"
@@ -0,0 +1,51 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import os
+import subprocess
+import sys
+
+# the app is started by scripts many times, its import has to stay cheap
+import_budget = 0.3  # seconds, for collector.cli
+heavy_modules = ("numpy", "pandas", "plotly", "yattag")
+
+
+def python(code, cwd=None):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=cwd,
+    )
+
+
+# cumulative import time of module in seconds, from -X importtime output
+def import_time(stderr, module):
+    for line in stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1e6
+    raise AssertionError(f"{module} not in import times")
+
+
+def test_cli_import_budget():
+    result = python("import collector.cli")
+    assert result.returncode == 0, result.stderr
+    assert import_time(result.stderr, "collector.cli") < import_budget
+
+
+def test_cli_import_skips_reports():
+    code = "import sys, collector.cli; print(' '.join(sys.modules))"
+    result = python(code)
+    assert result.returncode == 0, result.stderr
+    loaded = result.stdout.split()
+    assert not [m for m in loaded if m.split(".")[0] in heavy_modules]
+
+
+def test_tda_import_keeps_logs(tmp_path):
+    result = python("import postprocessor.tda", cwd=tmp_path)
+    assert result.returncode == 0, result.stderr
+    assert not os.listdir(tmp_path)
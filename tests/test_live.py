@@ -0,0 +1,82 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import numpy as np
+from test_posprocess import read_csv, write_capture, write_events
+from collector.live import StatsWriter, SummaryTable
+from postprocessor import postprocess
+from postprocessor.live import LiveMetrics, is_summary
+
+counters = ["cycles", "instructions", "bus_access"]
+
+
+def test_live_metrics(tmp_path):
+    events = write_events(tmp_path / "events.txt")
+    capture = write_capture(tmp_path / "core_pmu.csv", counters, 5)
+    metricfile, consts = postprocess.metricfile, dict(postprocess.constdict)
+    live = LiveMetrics(events, 4, 5, persocket=False)
+    done, lines = [], []
+    with open(capture, "rb") as f:
+        for i, line in enumerate(f):
+            for interval in live.feed(line):
+                done.append(interval)
+                lines.append(i)
+    # 2 header lines and 3 per interval. the first one is evaluated when the
+    # second starts, the others as soon as they have all their lines
+    assert lines == [5, 7, 10, 13, 16]
+    assert [time for time, _ in done] == [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert live.names == ["IPC", "bus_rate", "unknown_rate"]
+    # the events file and constants of postprocess are left alone
+    assert postprocess.metricfile == metricfile
+    assert postprocess.constdict == consts
+
+    # the same values as postprocessing, which drops the last interval
+    postprocess.process_files([capture], tmp_path / "metrics.csv", events, 4)
+    rows = read_csv(tmp_path / "metrics.csv")[1:]
+    for (_, values), row in zip(done, rows):
+        expected = [float(cell) if cell else np.nan for cell in row[1:4]]
+        assert np.array_equal(values, expected, equal_nan=True)
+
+
+def test_summary_names():
+    names = [
+        "IPC",
+        "s1.IPC",
+        "cpu_freq",
+        "l2_mpki",
+        "frontend_.",
+        "frontend_latency_..",
+    ]
+    assert [n for n in names if is_summary(n)] == names[:5]
+
+
+def test_summary_labels(capsys):
+    table = SummaryTable(["IPC", "cycles"], 2, interval_ms=250)
+    for timestamp in (0.2501, 0.5002, 0.7503):
+        table.add(timestamp, np.array([1.5, 10.0]))
+    lines = capsys.readouterr().out.splitlines()
+    # sub-second intervals get their own labels
+    assert [line.split()[0] for line in lines] == [
+        "time",
+        "0.25/2s",
+        "0.50/2s",
+        "0.75/2s",
+    ]
+    assert lines[0].split() == ["time", "IPC"]
+    assert lines[1].split()[1] == "1.500"
+
+
+def test_flush_per_interval(tmp_path):
+    path = tmp_path / "core_pmu.csv"
+    writer = StatsWriter(path)
+    writer.write(b"     1.000100000,1,,cycles,,,,\n")
+    writer.write(b"     1.000100000,2,,instructions,,,,\n")
+    # the lines of an interval are written together
+    assert path.read_bytes().startswith(b"# started on")
+    assert b"cycles" not in path.read_bytes()
+    # an interval is written out when the next one starts
+    writer.write(b"     2.000200000,3,,cycles,,,,\n")
+    assert path.read_bytes().endswith(b",2,,instructions,,,,\n")
+    writer.close()
+    assert path.read_bytes().endswith(b",3,,cycles,,,,\n")
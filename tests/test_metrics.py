@@ -0,0 +1,90 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import numpy as np
+from postprocessor.metrics import (
+    compile_metric,
+    compile_program,
+    evaluate_metric,
+    format_counters,
+    format_metric,
+    run_program,
+    to_matrix,
+)
+from postprocessor.postprocess import build_metric_plan
+
+
+def test_evaluate_columns():
+    metric = compile_metric("IPC", "[instructions] / [cycles]")
+    assert metric.events == ["instructions", "cycles"]
+    inputs = {
+        "instructions": np.array([2.0, 3.0, np.nan, 0.0]),
+        "cycles": np.array([1.0, 0.0, 2.0, 0.0]),
+    }
+    values, zero = evaluate_metric(metric, inputs, 4)
+    assert zero.tolist() == [False, True, False, True]
+    # divided by zero is written as 0, a missing input as an empty cell
+    assert format_metric(values, zero) == ["2.0000", "0", "", "0"]
+
+
+def test_evaluate_scalars():
+    # consts are scalars, the values still have one per sample
+    metric = compile_metric("util", "100 * [busy] / ([const_cpus] * 2)")
+    values, zero = evaluate_metric(
+        metric, {"busy": np.array([4.0, 8.0]), "const_cpus": 4}, 2
+    )
+    assert values.tolist() == [50.0, 100.0] and not zero.any()
+    metric = compile_metric("one", "[const_width] / [const_zero]")
+    values, zero = evaluate_metric(metric, {"const_width": 4, "const_zero": 0}, 3)
+    assert format_metric(values, zero) == ["0", "0", "0"]
+
+
+def test_syntax_error():
+    metric = compile_metric("broken", "[a] +* 2")
+    assert metric.code is None and metric.events == ["a"]
+
+
+def test_cells():
+    cells = format_counters(np.array([1.4, np.nan, 2.6, 1e12]))
+    assert cells == ["1", "", "3", "1000000000000"]
+    matrix = to_matrix([["1", "x"], ["2", "3"], ["4"]], 2)
+    assert np.array_equal(matrix, [[1, np.nan], [2, 3], [4, np.nan]], equal_nan=True)
+
+
+def test_program():
+    compiled = [
+        compile_metric("lost", "100 * ([a] - [b]) / ([c] * [const_width])"),
+        compile_metric("mispredict", "[lost] * [d] / [e]"),
+        compile_metric("other", "[lost] - [mispredict]"),
+        compile_metric("same", "100 * ([a] - [b]) / ([c] * [const_width])"),
+        compile_metric("missing", "[lost] / [f]"),
+        compile_metric("after", "[missing] + 1"),
+    ]
+    consts = {"const_width": 4}
+    plan = build_metric_plan(compiled, ["a", "b", "c", "d", "e"], {}, consts)
+    program = compile_program(plan, consts)
+    # a metric used in a formula and an equal formula are the same node
+    assert program.outputs[3] == program.outputs[0]
+    assert program.outputs[4:] == [None, None]
+    # time, a, b, c, d, e
+    data = np.array(
+        [[1.0, 10, 2, 1, 1, 4], [2.0, 10, 2, 0, 1, 4], [3.0, 10, 2, 1, 1, 0]]
+    )
+    results = run_program(program, data, 1.0, consts)
+    assert results[4:] == [None, None]
+    # the same values and zero divisions as the formulas written out
+    inline = [
+        "100 * ([a] - [b]) / ([c] * [const_width])",
+        "100 * ([a] - [b]) / ([c] * [const_width]) * [d] / [e]",
+        "100 * ([a] - [b]) / ([c] * [const_width])"
+        " - (100 * ([a] - [b]) / ([c] * [const_width]) * [d] / [e])",
+    ]
+    inputs = {name: data[:, i + 1] for i, name in enumerate("abcde")}
+    for (values, zero), expression in zip(results, inline):
+        expected = evaluate_metric(
+            compile_metric("inline", expression), dict(inputs, **consts), 3
+        )
+        assert format_metric(values, zero) == format_metric(*expected)
+    assert format_metric(*results[2]) == ["150.0000", "0", "0"]
+    assert format_metric(*results[1]) == ["50.0000", "0", "0"]
@@ -0,0 +1,35 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import json
+import os
+import numpy as np
+from test_synthetic import events_dir, postprocess_run, read_metrics
+from postprocessor.percore import read_cores
+from postprocessor.store import read_run
+from postprocessor.synthetic import generate
+
+
+def test_synthetic_percore(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    event_file = os.path.join(events_dir, "events.txt")
+    generate(event_file, tmp_path, cores=8, duration=10, percore=True, not_counted=0)
+    with open(tmp_path / "run.json", "w") as f:
+        json.dump({"core_sockets": {str(c): c // 4 for c in range(8)}}, f)
+    result = postprocess_run(tmp_path, event_file, 10, persocket=True, percore=True)
+    assert result.exit_code == 0, result.output
+    rows = read_metrics(tmp_path)
+    assert len(rows) == 10
+
+    run = read_cores(tmp_path, ["IPC", "cycles", "instructions"])
+    assert run.cores == list(range(8))
+    assert run.columns["cycles"].shape == (10, 8)
+    assert run.time.tolist() == [float(r["time"]) for r in rows]
+    ipc = run.columns["instructions"] / run.columns["cycles"]
+    assert np.allclose(run.columns["IPC"], ipc)
+    # the socket samples are the sums of their cores
+    sockets = read_run(tmp_path, ["s0.cycles", "s1.cycles"])
+    for socket, cores in ((0, slice(0, 4)), (1, slice(4, 8))):
+        cycles = run.columns["cycles"][:, cores].sum(axis=1)
+        assert sockets[f"s{socket}.cycles"].tolist() == cycles.tolist()
@@ -0,0 +1,47 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import time
+import numpy as np
+import pytest
+from test_synthetic import read_metrics
+from collector.perfevent import CounterGroups, CounterSampler
+from postprocessor import postprocess
+from postprocessor.eventfile import event_groups, load_event_file
+
+
+def test_perf_event_open(tmp_path):
+    event_file = tmp_path / "events.txt"
+    event_file.write_text(
+        "events_core\n{\ntask-clock\ncontext-switches\n}\ncpu-clock\nunknown\n"
+        ";\ntask_ms = [task-clock] / 1000000\n"
+    )
+    groups = list(event_groups(load_event_file(event_file).events))
+    # this process on any cpu, no privileges needed
+    counters = CounterGroups(groups, [-1], pid=0)
+    if (counters.leaders < 0).all():
+        pytest.skip("perf_event_open not available")
+    assert counters.header == ["task-clock", "context-switches", "cpu-clock", "unknown"]
+    assert counters.leaders[0, 2] < 0
+    sampler = CounterSampler(counters, 50, 0.3)
+    sampler.start()
+    end = time.monotonic() + 0.35
+    while time.monotonic() < end:
+        pass
+    sampler.stop()
+    sampler.save(tmp_path / "core_pmu.npz")
+    assert 5 <= sampler.samples <= 7
+    values = sampler.values[: sampler.samples, 0]
+    # busy all the time, the task clock counts about every interval's ns
+    assert np.all(np.abs(values[:, 0] / 50e6 - 1) < 0.5)
+    assert values[:, 3].tolist() == [0] * sampler.samples
+    assert (sampler.running[: sampler.samples, 0, :2] > 0).all()
+
+    postprocess.process_files(
+        [tmp_path / "core_pmu.npz"], tmp_path / "metrics.csv", event_file, 1
+    )
+    rows = read_metrics(tmp_path)
+    assert len(rows) == sampler.samples
+    assert float(rows[0]["task_ms"]) == pytest.approx(values[0, 0] / 1e6, rel=1e-4)
+    assert not (tmp_path / "percore").exists()
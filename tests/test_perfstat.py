@@ -0,0 +1,111 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import os
+import numpy as np
+from test_synthetic import events_dir, postprocess_run, read_metrics
+from postprocessor.perfstat import parse_records, read_records, transpose_records
+from postprocessor.store import read_run
+from postprocessor.synthetic import generate
+
+
+def records(text, layout=False):
+    return parse_records(np.frombuffer(text.encode(), dtype=np.uint8), layout)
+
+
+def test_values():
+    parsed = records(
+        "# started on Fri Oct 17 10:00:00 2025\n"
+        "\n"
+        "     1.000100000,123,,cycles,1000,100.00,,\n"
+        "     1.000100000,<not counted>,,r08,0,0.00,,\n"
+        "     1.000100000,<not supported>,,bus_access,0,0.00,,\n"
+        "     1.000100000,12345678901234567890,,instructions,1000,100.00,,\n"
+        "     1.000100000,  42.25 ,msec,cpu-clock,1000,100.00,,\n"
+        "     1.000100000,,,empty,1000,100.00,,\n"
+        "     1.000100000,7,,\n"
+        "     2.000200000,0,,cycles,1000,100.00,,"
+    )
+    # lines without a value or too few fields are skipped
+    assert parsed.events == ["cycles", "r08", "bus_access", "instructions", "cpu-clock"]
+    assert parsed.event.tolist() == [0, 1, 2, 3, 4, 0]
+    assert parsed.value.tolist() == [123, 0, 0, float(12345678901234567890), 42.25, 0]
+    assert parsed.time.tolist() == [1.0001] * 5 + [2.0002]
+    assert parsed.socket.tolist() == [0] * 6 and parsed.sockets == [""]
+
+
+def test_bad_timestamps():
+    parsed = records(
+        "1.000100000,1,,cycles,,,,\n"
+        "garbage,2,,cycles,,,,\n"
+        "2.000200000,3,,cycles,,,,\n"
+    )
+    assert parsed.time.tolist() == [1.0001, 2.0002]
+    assert parsed.value.tolist() == [1, 3]
+    assert not len(records("# only a comment\n").time)
+    assert not len(records("1.000100000,,,cycles,,,,\n").time)
+
+
+def test_layouts():
+    parsed = records(
+        "1.0001,S0,40,10,,cycles,,,\n1.0001,S1,40,<not counted>,,cycles,,,\n", True
+    )
+    assert parsed.sockets == ["S0", "S1"] and parsed.socket.tolist() == [0, 1]
+    assert parsed.value.tolist() == [10, 0]
+    parsed = records("1.0001,CPU3,10,,cycles,,,\n1.0001,CPU7,20,,cycles,,,\n", "core")
+    assert parsed.sockets == ["CPU3", "CPU7"] and parsed.value.tolist() == [10, 20]
+
+
+def test_transpose(tmp_path):
+    capture = tmp_path / "core_pmu.csv"
+    text = (
+        "1.0001,10,,cycles,,,,\n1.0001,20,,r08,,,,\n"
+        "2.0001,30,,cycles,,,,\n2.0001,40,,r08,,,,\n"
+        "3.0001,50,,cycles,,,,\n"
+    )
+    capture.write_text(text)
+    parsed = read_records(str(capture), False)
+    code_names = {"r08": "inst_retired"}
+    # rNNN codes get the names of their events
+    header, matrix = transpose_records(parsed, code_names, False, complete=True)
+    assert header == ["time", "cycles", "inst_retired"]
+    assert np.array_equal(
+        matrix,
+        [[1.0001, 10, 20], [2.0001, 30, 40], [3.0001, 50, np.nan]],
+        equal_nan=True,
+    )
+    # perf may have been stopped in the last interval
+    header, matrix = transpose_records(parsed, code_names, False, complete=False)
+    assert matrix[:, 0].tolist() == [1.0001, 2.0001]
+    # a byte range of whole lines
+    start, end = text.index("2.0001"), text.index("3.0001")
+    parsed = read_records(str(capture), False, start, end)
+    assert parsed.time.tolist() == [2.0001, 2.0001]
+
+    header, _ = transpose_records(
+        records("1.0001,S0,40,10,,cycles,,,\n1.0001,S1,40,20,,cycles,,,\n", True),
+        {},
+        True,
+        complete=True,
+    )
+    assert header == ["time", "s0.cycles", "s1.cycles"]
+
+
+def test_millisecond_intervals(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    event_file = os.path.join(events_dir, "events.txt")
+    (core,) = generate(event_file, tmp_path, duration=2, interval=0.01)
+    result = postprocess_run(tmp_path, event_file, 2)
+    assert result.exit_code == 0, result.output
+    rows = read_metrics(tmp_path)
+    assert len(rows) == 200
+    # the timestamps are perf's, not rounded to 10ms
+    with open(core) as f:
+        stamps = sorted({float(line.split(",")[0]) for line in f if line[0] == " "})
+    time = [float(r["time"]) for r in rows]
+    assert time == stamps[: len(time)]
+    # rates are over the measured intervals
+    run = read_run(tmp_path, ["cycles", "cpu_freq"])
+    freq = run["cycles"] / (80 * np.diff(time, prepend=0)) / 1e9
+    assert np.allclose(run["cpu_freq"], freq, rtol=1e-3)
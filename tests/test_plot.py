@@ -0,0 +1,61 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import os
+import numpy as np
+import pandas as pd
+from test_synthetic import events_dir, postprocess_run
+from postprocessor import plot
+from postprocessor.store import read_run
+from postprocessor.synthetic import generate
+
+
+def test_report_downsampling(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    event_file = os.path.join(events_dir, "events_ampereone_ac04.txt")
+    generate(event_file, tmp_path, duration=300)
+    result = postprocess_run(tmp_path, event_file, 300)
+    assert result.exit_code == 0, result.output
+    run = read_run(tmp_path, plot.plot_columns)
+    shown = plot.downsample(run, 50)
+    assert len(shown) <= 50
+    assert [c for c in shown.columns if not c.endswith(".time")] == list(run.columns)
+    # every bucket keeps its extremes, so do the whole series, at their times
+    for name in ("IPC", "cpu_freq", "l2_mpki"):
+        times = plot.times(shown, name)
+        for extreme in ("idxmax", "idxmin"):
+            row = getattr(run[name], extreme)()
+            kept = getattr(shown[name], extreme)()
+            assert shown[name][kept] == run[name][row]
+            assert times[kept] == run["time"][row]
+    assert plot.downsample(run, 0) is run
+
+    plot.write_report(str(tmp_path), points=50)
+    (report,) = tmp_path.glob("APP-report-*.html")
+    text = report.read_text()
+    assert "min and max of 300 samples shown in" in text
+    # webgl traces, plotly.js from the run directory
+    assert '"type":"scattergl"' in text
+    assert '<script src="plotly.min.js"' in text
+    assert (tmp_path / "plotly.min.js").exists()
+
+
+def test_downsample():
+    run = pd.DataFrame(
+        {
+            "time": np.arange(1.0, 11.0),
+            "a": [5, 1, 9, 3, 4, 2, 8, 6, 7, 0],
+            "b": [np.nan] * 5 + [1, 2, 3, 4, 5],
+        }
+    )
+    # buckets of 5 samples, each keeps its min and max in the order they occurred
+    shown = plot.downsample(run, 4)
+    assert shown["time"].tolist() == [1, 5, 6, 10]
+    assert shown["a"].tolist() == [1, 9, 8, 0]
+    assert shown["a.time"].tolist() == [2, 3, 7, 10]
+    assert shown["b"].tolist()[2:] == [1, 5]
+    assert shown["b.time"].tolist()[2:] == [6, 10]
+    assert np.isnan(shown["b"][:2]).all()
+    # samples that weren't downsampled share the time column
+    assert plot.times(run, "a").equals(run["time"])
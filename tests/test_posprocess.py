@@ -2,8 +2,17 @@
 #
 # SPDX-License-Identifier: BSD-3-Clause
 
+import csv
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
 from test_cli import run_command
-from postprocessor.postprocess import main
+from postprocessor import postprocess
+from postprocessor.eventfile import Event
+import numpy as np
+from postprocessor.metrics import compile_metric, compile_program
+from postprocessor.postprocess import build_metric_plan, get_code_names, main
+from postprocessor.postprocess import evaluate_chunk
 
 def test_postprocess():
     result = run_command(["sudo", "postprocess", "--cpus","32","--metric","src/events/events.txt","--duration","10","--output","test_cores/metrics.csv","test_cores/core_pmu.csv"])
@@ -11,4 +20,164 @@ def test_postprocess():
     assert result.returncode == 0
 
 
+def test_metric_plan():
+    compiled = [
+        compile_metric("IPC", "[instructions] / [cycles]"),
+        compile_metric("l1d_rate", "[l1d_cache] / [cycles] * [const_cpus]"),
+        compile_metric("l1d_ipc", "[IPC] * [l1d_cache]"),
+        compile_metric("lost", "[missing] + [cycles]"),
+    ]
+    header = ["cycles", "instructions", "cycles", "l1d-cache"]
+    mapping = {0: ["cycles", "instructions"], 1: ["cycles", "l1d_cache"]}
+    plan = build_metric_plan(compiled, header, mapping)
+    # columns count from 1, time is column 0. cycles is read from the group
+    # of the other events of each formula
+    assert plan[0].columns == {"instructions": 2, "cycles": 1}
+    assert plan[1].columns == {"l1d_cache": 4, "cycles": 3}
+    # metrics refer to the metrics before them by plan index
+    assert plan[2].columns == {"l1d_cache": 4} and plan[2].references == {"IPC": 0}
+    assert plan[3].columns is None
 
+
+def test_evaluate_chunk():
+    compiled = [
+        compile_metric("third", "[a] / [b]"),
+        compile_metric("lost", "[missing] + [a]"),
+    ]
+    plan = build_metric_plan(compiled, ["a", "b"], {})
+    program = compile_program(plan, {})
+    data = np.array([[1.0, 1, 3], [2.0, 2.4, 0], [3.0, np.nan, 3]])
+    text, values, divzero = evaluate_chunk(program, {}, data, 0.0)
+    rows = list(csv.reader(text.splitlines()))
+    assert rows[0] == ["1.0", "0.3333", "", "1", "3"]
+    assert rows[1] == ["2.0", "0", "", "2", "0"]
+    assert rows[2] == ["3.0", "", "", "", "3"]
+    # the values aren't rounded like the csv, counters are
+    assert values[0, 1] == 1 / 3
+    assert values[1, 1] == 0
+    assert np.isnan(values[:, 2]).all() and np.isnan(values[2, 1])
+    assert values[:, 3].tolist()[:2] == [1, 2]
+    assert divzero == {"[a] / [b]": 1}
+
+
+def test_code_names():
+    # the events that have a code
+    events = [
+        Event("l1d_cache", "r04", "core", 0, True),
+        Event("l1d_cache_refill", "r03", "core", 1, False),
+        Event("l1d_cache_rd", "r04", "core", 1, False),
+    ]
+    # the first event of a code names it
+    assert get_code_names(events) == {"r04": "l1d_cache", "r03": "l1d_cache_refill"}
+
+
+# a perf stat -x, capture of intervals of counts, the counts of an interval
+# are its number times the event's position plus one
+def write_capture(path, events, intervals, step=1.0, skip=()):
+    lines = ["# started on Fri Oct 17 10:00:00 2025\n", "\n"]
+    for k in range(1, intervals + 1):
+        if k in skip:
+            continue
+        for i, event in enumerate(events):
+            count = k * (i + 1)
+            lines.append(f"{k * step:14.9f},{count},,{event},1000,100.00,,\n")
+    path.write_text("".join(lines))
+    return path
+
+
+def write_events(path):
+    path.write_text(
+        "cycles\ninstructions\nbus_access\n;\n"
+        "IPC = [instructions] / [cycles]\n"
+        "bus_rate = [bus_access] / [const_sampletime]\n"
+        "unknown_rate = [unknown] / [cycles]\n"
+    )
+    return path
+
+
+def read_csv(path):
+    with open(path) as f:
+        return list(csv.reader(f))
+
+
+def test_streaming_chunks(tmp_path, monkeypatch):
+    events = write_events(tmp_path / "events.txt")
+    counters = ["cycles", "instructions", "bus_access"]
+    for run, rows in (("small", 3), ("large", 4096)):
+        monkeypatch.setattr(postprocess, "chunk_rows", rows)
+        (tmp_path / run).mkdir()
+        capture = write_capture(tmp_path / run / "core_pmu.csv", counters, 10)
+        output = tmp_path / run / "metrics.csv"
+        samples = postprocess.process_files([capture], output, events, 4)
+        # the last interval may be incomplete, it's dropped
+        assert samples == 9
+    for name in ("metrics.csv", "metrics.average.csv"):
+        small, large = tmp_path / "small" / name, tmp_path / "large" / name
+        assert read_csv(small) == read_csv(large)
+    rows = read_csv(tmp_path / "small" / "metrics.csv")
+    assert rows[0] == ["time", "IPC", "bus_rate", "unknown_rate"] + counters
+    # rates over the interval before, across chunks too
+    assert [r[2] for r in rows[1:]] == [f"{3 * k:.4f}" for k in range(1, 10)]
+    assert {r[3] for r in rows[1:]} == {""}
+    averages = dict(read_csv(tmp_path / "small" / "metrics.average.csv"))
+    assert averages["IPC"] == "2.0000" and averages["cycles"] == "5.0000"
+    assert averages["unknown_rate"] == "N/A"
+
+
+def test_join_on_timestamps():
+    core = [["time", "cycles"], [1.0, 10], [2.0, 20], [3.0, 30], [4.0, 40]]
+    cmn = [["time", "mem"], [1.001, 1], [3.002, 3], [4.0, 4], [5.0, 5]]
+    progress = postprocess.JoinProgress()
+    rows = list(postprocess.join_files([iter(core), iter(cmn)], progress=progress))
+    assert rows[0] == ["time", "cycles", "mem"]
+    # within half the core interval a sample joins, else it's a gap
+    rows = [[None if v != v else v for v in row] for row in rows[1:]]
+    assert rows == [
+        [1.0, 10, 1],
+        [2.0, 20, None],
+        [3.0, 30, 3],
+        [4.0, 40, 4],
+        [5.0, None, 5],
+    ]
+    assert progress.tolerance == 0.5
+
+    # the rows after until stay in the streams
+    progress = postprocess.JoinProgress()
+    streams = [iter(core), iter(cmn)]
+    rows = list(postprocess.join_files(streams, 0.01, until=2.0, progress=progress))
+    assert [row[0] for row in rows[1:]] == [1.0, 2.0]
+    assert progress.pending == [3.0, 3.002]
+
+
+def delayed(seconds, value):
+    time.sleep(seconds)
+    return value
+
+
+def test_ordered_map():
+    # later tasks often finish first, the results still come in order
+    with ThreadPoolExecutor(4) as executor:
+        tasks = ((0.05 * (k % 3), k) for k in range(10))
+        results = postprocess.ordered_map(executor, delayed, tasks, 3)
+        assert list(results) == list(range(10))
+
+
+def test_jobs(tmp_path, monkeypatch):
+    events = write_events(tmp_path / "events.txt")
+    counters = ["cycles", "instructions", "bus_access"]
+    # segments of a few intervals, chunks of a few samples
+    monkeypatch.setattr(postprocess, "segment_bytes", 500)
+    monkeypatch.setattr(postprocess, "chunk_rows", 7)
+    for run, jobs in (("serial", 1), ("pool", 3)):
+        (tmp_path / run).mkdir()
+        write_capture(tmp_path / run / "core_pmu.csv", counters, 50)
+        write_capture(tmp_path / run / "cmn_pmu.csv", ["mem"], 50, skip=(20,))
+        inputs = [tmp_path / run / "core_pmu.csv", tmp_path / run / "cmn_pmu.csv"]
+        output = tmp_path / run / "metrics.csv"
+        assert postprocess.process_files(inputs, output, events, 4, jobs=jobs) == 49
+    for name in ("metrics.csv", "metrics.average.csv", "metrics.stats.csv"):
+        serial, pool = tmp_path / "serial" / name, tmp_path / "pool" / name
+        assert serial.read_bytes() == pool.read_bytes()
+    # metrics are pickled into the workers by their formula
+    metric = compile_metric("IPC", "[instructions] / [cycles]")
+    assert pickle.loads(pickle.dumps(metric)) == metric
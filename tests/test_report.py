@@ -0,0 +1,43 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import base64
+import json
+import numpy as np
+from plotly import graph_objects as go
+from postprocessor.report import figure_html, plotlyjs_file, write_figure
+
+
+def figure(x):
+    fig = go.Figure()
+    fig.add_trace(go.Scattergl(x=x, y=[1.0, 2.0, 3.0], name="IPC"))
+    fig.add_trace(go.Scattergl(x=x, y=[4.0, 5.0, 6.0], name="cpu_freq"))
+    return fig
+
+
+def test_shared_x():
+    x = np.array([1.5, 2.5, 3.5])
+    text = figure_html(figure(x), "report", x)
+    # the timestamps are embedded once, as float64 bytes, for every trace
+    encoded = base64.b64encode(x.astype("<f8").tobytes()).decode()
+    assert text.count(encoded) == 1
+    assert "trace.x = x;" in text
+    # traces with their own x keep them
+    text = figure_html(figure(x), "report")
+    assert "trace.x = x;" not in text
+    data = json.loads(text.split("var figure = ")[1].split(";\n")[0])["data"]
+    assert all("x" in trace for trace in data)
+
+
+def test_write_figure(tmp_path):
+    path = tmp_path / "report.html"
+    write_figure(str(path), "</title><b>", figure([1.0, 2.0, 3.0]))
+    text = path.read_text()
+    assert "<title>&lt;/title&gt;&lt;b&gt;</title>" in text
+    assert f'<script src="{plotlyjs_file}"' in text
+    bundle = tmp_path / plotlyjs_file
+    written = bundle.stat().st_mtime_ns
+    # the bundle is shared by the reports of a run
+    write_figure(str(tmp_path / "tda.html"), "TDA", figure([1.0, 2.0, 3.0]))
+    assert bundle.stat().st_mtime_ns == written
@@ -0,0 +1,78 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import os
+import pytest
+from test_synthetic import events_dir, postprocess_run, read_metrics
+from collector.profiler import Profiler
+from collector.supervisor import Supervisor
+from collector.utils import run_postprocess
+from postprocessor import postprocess
+from postprocessor.synthetic import generate
+
+
+def test_process_files_matches_cli(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    event_file = os.path.join(events_dir, "events_ampereone_ac04.txt")
+    generate(event_file, tmp_path / "cli", duration=10)
+    generate(event_file, tmp_path / "api", duration=10)
+    result = postprocess_run(tmp_path / "cli", event_file, 10)
+    assert result.exit_code == 0, result.output
+    api = tmp_path / "api"
+    postprocess.process_files(
+        [api / "cmn_pmu.csv", api / "core_pmu.csv", api / "missing.csv"],
+        api / "metrics.csv",
+        event_file,
+        80,
+        10,
+    )
+    for name in ("metrics.csv", "metrics.average.csv", "metrics.stats.csv"):
+        with open(tmp_path / "cli" / name) as a, open(api / name) as b:
+            assert a.read() == b.read()
+
+
+# the collector postprocesses the capture of its perf command the same way
+@pytest.mark.parametrize("persocket", [False, True])
+def test_run_postprocess(tmp_path, persocket):
+    event_file = os.path.join(events_dir, "events.txt")
+    run_dir = tmp_path / "run"
+    generate(event_file, run_dir, duration=10, persocket=persocket, not_counted=0)
+    src_path = tmp_path / "app.py"
+    run_postprocess(80, 10, "run", False, False, False, event_file, persocket, src_path)
+    rows = read_metrics(run_dir)
+    assert len(rows) == 10
+    prefixes = ["s0.", "s1."] if persocket else [""]
+    for prefix in prefixes:
+        assert all(float(row[f"{prefix}cycles"]) > 0 for row in rows)
+        assert all(0.3 < float(row[f"{prefix}IPC"]) < 4 for row in rows)
+
+
+def core_command(tmp_path, **options):
+    profiler = Profiler(
+        10,
+        1.0,
+        None,
+        "0-79",
+        output=str(tmp_path),
+        event_file="events.txt",
+        plot=False,
+        tda=False,
+        debug=False,
+        delay=0,
+        **options,
+    )
+    profiler.supervisor = Supervisor(10)
+    profiler._collect_pmu({"core": "cycles,instructions", "cmn": ""})
+    (core,) = profiler.supervisor.collectors
+    return core.cmd
+
+
+def test_core_command(tmp_path):
+    cmd = core_command(tmp_path, persocket=False)
+    assert cmd.startswith("perf stat -I 1000 -x, -C 0-79 -e cycles,instructions")
+    # the counts of each socket, the layout postprocess --persocket reads
+    cmd = core_command(tmp_path, persocket=True)
+    assert cmd.startswith("perf stat -I 1000 -x, --per-socket -C 0-79")
+    cmd = core_command(tmp_path, persocket=True, percore=True)
+    assert cmd.startswith("perf stat -I 1000 -x, -A -C 0-79")
@@ -0,0 +1,66 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import math
+import numpy as np
+from postprocessor.stats import MetricStats, quantiles, relative_accuracy
+
+names = ["wide", "signed", "offset", "empty"]
+
+
+# samples as written to metrics.csv: time, then one column per name
+def samples(rows=5000):
+    rng = np.random.default_rng(7)
+    values = np.column_stack(
+        [
+            np.arange(rows, dtype=np.float64),
+            rng.lognormal(0, 3, rows),
+            rng.normal(0, 50, rows),
+            1e9 + rng.random(rows),
+            np.full(rows, np.nan),
+        ]
+    )
+    values[::10, 1] = np.nan
+    values[::7, 2] = 0.0
+    return values
+
+
+def collect(values, chunk):
+    stats = MetricStats(names)
+    for start in range(0, len(values), chunk):
+        stats.update(values[start : start + chunk])
+    return stats
+
+
+def test_summary():
+    values = samples()
+    stats = collect(values, 4096)
+    for i, name in enumerate(names[:3]):
+        column = values[:, i + 1]
+        column = column[np.isfinite(column)]
+        count, mean, stddev, low, *found, high = stats.summary(i)
+        assert count == len(column)
+        assert math.isclose(mean, column.mean(), rel_tol=1e-12)
+        assert math.isclose(stddev, column.std(ddof=1), rel_tol=1e-9)
+        assert (low, high) == (column.min(), column.max())
+        # quantiles are within the relative accuracy of the sketch
+        for q, value in zip(quantiles, found):
+            exact = np.quantile(column, q, method="lower")
+            assert abs(value - exact) <= relative_accuracy * abs(exact) + 1e-9
+    assert stats.summary(3)[0] == 0 and all(map(math.isnan, stats.summary(3)[1:]))
+
+
+def test_chunks():
+    values = samples()
+    expected = collect(values, len(values))
+    # a resumed run may break the samples anywhere
+    for chunk in (1, 7, 4096):
+        stats = collect(values, chunk)
+        for i in range(len(names)):
+            assert np.array_equal(stats.summary(i), expected.summary(i), equal_nan=True)
+    state = collect(values[:1234], 100).state()
+    resumed = MetricStats(names)
+    resumed.restore(state)
+    resumed.update(values[1234:])
+    assert np.array_equal(resumed.summary(1), expected.summary(1), equal_nan=True)
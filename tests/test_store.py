@@ -0,0 +1,82 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import numpy as np
+import pandas as pd
+from test_posprocess import read_csv, write_capture
+from postprocessor import postprocess
+from postprocessor.store import StoreWriter, read_index, read_run, store_path
+from postprocessor.tda import read_tda_averages
+
+# time, IPC, cycles, cycles (collected in two groups)
+chunks = [
+    np.array([[1.0, 0.5, 10, 11], [2.0, np.nan, 20, np.nan]]),
+    np.array([[3.0, 1.5, 30, 31]]),
+]
+
+
+def write_store(run_dir, chunks, rows=0):
+    writer = StoreWriter(store_path(run_dir), ["IPC"], ["cycles", "cycles"], rows)
+    for chunk in chunks:
+        writer.append(chunk)
+    writer.close()
+
+
+def test_store_columns(tmp_path):
+    write_store(tmp_path, chunks)
+    assert read_index(store_path(tmp_path))["rows"] == 3
+    run = read_run(tmp_path)
+    # repeated names are numbered like pandas reads them from metrics.csv
+    assert list(run.columns) == ["time", "IPC", "cycles", "cycles.1"]
+    assert run["time"].tolist() == [1.0, 2.0, 3.0]
+    assert np.array_equal(run["IPC"], [0.5, np.nan, 1.5], equal_nan=True)
+    # counters are integers, missing where they weren't collected
+    assert run["cycles"].tolist() == [10, 20, 30]
+    assert run["cycles.1"].isna().tolist() == [False, True, False]
+    assert run["cycles.1"][2] == 31
+
+    run = read_run(tmp_path, ["cycles.1"])
+    assert list(run.columns) == ["time", "cycles.1"]
+
+
+def test_store_append(tmp_path):
+    write_store(tmp_path, chunks)
+    # appending to the first 2 rows drops the third
+    write_store(tmp_path, [np.array([[4.0, 2.5, 40, 41]])], rows=2)
+    run = read_run(tmp_path)
+    assert run["time"].tolist() == [1.0, 2.0, 4.0]
+    assert run["cycles"].tolist() == [10, 20, 40]
+
+
+def test_metrics_csv_fallback(tmp_path):
+    (tmp_path / "metrics.csv").write_text(
+        "time,IPC,cycles,cycles\n1.0,0.5,10,11\n2.0,,20,\n3.0,1.5,30,31\n"
+    )
+    csv = read_run(tmp_path)
+    write_store(tmp_path, chunks)
+    store = read_run(tmp_path)
+    assert list(csv.columns) == list(store.columns)
+    for name in csv.columns:
+        assert np.allclose(
+            csv[name].astype(float),
+            pd.to_numeric(store[name]).astype(float),
+            equal_nan=True,
+        )
+
+
+def test_unrounded_metrics(tmp_path):
+    events = tmp_path / "events.txt"
+    events.write_text(
+        "cycles\ninstructions\n;\n"
+        "IPC = [instructions] / [cycles]\n"
+        "frontend_. = 100 * [cycles] / (3 * [instructions])\n"
+    )
+    capture = write_capture(tmp_path / "core_pmu.csv", ["cycles", "instructions"], 5)
+    postprocess.process_files([capture], tmp_path / "metrics.csv", events, 4)
+    # metrics.csv has 4 decimals, the store the evaluated values
+    assert read_csv(tmp_path / "metrics.csv")[1][2] == "16.6667"
+    run = read_run(tmp_path)
+    assert run["frontend_."].tolist() == [100 / 6] * 4
+    averages = read_tda_averages(str(tmp_path), tmp_path / "metrics.average.csv")
+    assert averages["value"].tolist() == [100 / 6]
@@ -0,0 +1,63 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import time
+import pytest
+from collector.supervisor import Supervisor
+
+
+# a sink keeping what a child wrote, line by line
+class Lines:
+    def __init__(self):
+        self.lines = []
+        self.closed = False
+
+    def write(self, line):
+        self.lines.append(line)
+
+    def close(self):
+        self.closed = True
+
+
+def test_supervisor(tmp_path):
+    # stopped with SIGINT at the end, the last line is still read
+    sink = Lines()
+    supervisor = Supervisor(1, progress=False, grace=5)
+    supervisor.add_workload(f"sleep 30; touch {tmp_path / 'finished'}")
+    supervisor.add_perf(
+        "perf",
+        "echo first; trap 'echo last; exit 0' INT; while :; do sleep 0.1; done",
+        sink,
+    )
+    start = time.monotonic()
+    supervisor.run()
+    assert time.monotonic() - start < 5
+    assert sink.lines == [b"first\n", b"last\n"] and sink.closed
+    assert supervisor.reason == "1s collected"
+    assert not supervisor.workload.running()
+    assert not (tmp_path / "finished").exists()
+
+    # a perf process exiting on its own fails the collection right away
+    supervisor = Supervisor(30, progress=False, grace=5)
+    supervisor.add_perf("perf", "sleep 10", Lines())
+    supervisor.add_perf("failing perf", "echo 'no counters' >&2; exit 3")
+    start = time.monotonic()
+    with pytest.raises(RuntimeError, match="failing perf exited with 3.*no counters"):
+        supervisor.run()
+    assert time.monotonic() - start < 5
+
+    # the collection ends with the workload
+    sink = Lines()
+    supervisor = Supervisor(30, progress=False, grace=5)
+    supervisor.add_workload("sleep 0.5")
+    supervisor.add_perf(
+        "perf",
+        "echo first; trap 'echo last; exit 0' INT; while :; do sleep 0.1; done",
+        sink,
+    )
+    start = time.monotonic()
+    supervisor.run()
+    assert time.monotonic() - start < 5
+    assert sink.lines == [b"first\n", b"last\n"] and sink.closed
+    assert supervisor.reason == "workload exited"
@@ -0,0 +1,71 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import csv
+import os
+import re
+from click.testing import CliRunner
+from postprocessor import postprocess
+from postprocessor.synthetic import generate
+
+events_dir = os.path.join(os.path.dirname(__file__), "..", "src", "events")
+
+
+def postprocess_run(
+    run_dir, event_file, duration, persocket=False, percore=False, files=None
+):
+    args = ["--cpus", "80", "--metric", event_file, "--duration", str(duration)]
+    args += ["--persocket"] if persocket else []
+    args += ["--percore"] if percore else []
+    args += ["--output", str(run_dir / "metrics.csv")]
+    args += files or sorted(str(p) for p in run_dir.glob("*_pmu.csv"))
+    return CliRunner().invoke(postprocess.main, args)
+
+
+def read_metrics(run_dir):
+    with open(run_dir / "metrics.csv") as f:
+        return list(csv.DictReader(f))
+
+
+def test_synthetic_postprocess(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    event_file = os.path.join(events_dir, "events_ampereone_ac04.txt")
+    files = generate(event_file, tmp_path, duration=20, hex_fraction=0.5)
+    assert [os.path.basename(f) for f in files] == ["core_pmu.csv", "cmn_pmu.csv"]
+    with open(files[0]) as f:
+        text = f.read()
+    assert text.startswith("# started on")
+    assert "<not counted>" in text
+    assert re.search(r",r[0-9a-f]+,", text)
+
+    result = postprocess_run(tmp_path, event_file, 20)
+    assert result.exit_code == 0, result.output
+    rows = read_metrics(tmp_path)
+    # the short last interval is dropped
+    assert len(rows) == 20
+    # rNNN names are mapped back to the events
+    assert not any(re.fullmatch(r"r[0-9a-f]+", name) for name in rows[0])
+    ipc = [float(r["IPC"]) for r in rows if r["IPC"] not in ("", "0")]
+    assert ipc and all(0.3 < v < 4 for v in ipc)
+    assert (tmp_path / "metrics.average.csv").exists()
+    assert (tmp_path / "metrics.stats.csv").exists()
+
+
+def test_synthetic_persocket(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    event_file = os.path.join(events_dir, "events.txt")
+    generate(event_file, tmp_path, duration=10, persocket=True, not_counted=0)
+    result = postprocess_run(tmp_path, event_file, 10, persocket=True)
+    assert result.exit_code == 0, result.output
+    rows = read_metrics(tmp_path)
+    assert len(rows) == 10
+    assert "s0.IPC" in rows[0] and "s1.IPC" in rows[0]
+
+
+def test_synthetic_seed(tmp_path):
+    event_file = os.path.join(events_dir, "events_tda_ac04.txt")
+    first = generate(event_file, tmp_path / "a", duration=5, seed=3)
+    second = generate(event_file, tmp_path / "b", duration=5, seed=3)
+    with open(first[0]) as a, open(second[0]) as b:
+        assert a.read() == b.read()
@@ -0,0 +1,43 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import csv
+import os
+import numpy as np
+from test_synthetic import events_dir, postprocess_run, read_metrics
+from postprocessor import tda, tdatree
+from postprocessor.store import read_run
+from postprocessor.synthetic import generate
+
+
+def test_tda_intervals(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    event_file = os.path.join(events_dir, "events_tda_ac04.txt")
+    generate(event_file, tmp_path, duration=30)
+    result = postprocess_run(tmp_path, event_file, 30)
+    assert result.exit_code == 0, result.output
+    names = list(read_metrics(tmp_path)[0])
+    tree = tdatree.build_tree(names)
+    assert tree.ids[:2] == ["pipeline", "frontend"]
+    time, values = tdatree.interval_values(tmp_path, tree)
+    assert values.shape == (30, len(tree.ids))
+    assert not tdatree.mismatches(tree, values)
+    # every level shows the whole pipeline
+    for depth in (1, 2, 3):
+        shown = values[:, tdatree.frontier(tree, depth)].sum(axis=1)
+        assert np.allclose(shown, 100)
+    # all intervals at once give what each interval gives on its own
+    raw = read_run(tmp_path, tree.metrics[1:])
+    for row in (0, 17):
+        samples = [100.0] + [float(raw[m][row]) for m in tree.metrics[1:]]
+        assert np.allclose(tdatree.realign(tree, samples), values[row])
+    time, means = tdatree.bucket_means(time, values, 7)
+    assert len(time) == 6 and np.allclose(means[:, 0], 100)
+
+    tda.write_html(str(tmp_path), "metrics.csv", "tda.html", "sunburst")
+    text = (tmp_path / "tda.html").read_text()
+    assert 'id="tda_chart"' in text and 'id="tda_timeline"' in text
+    with open(tmp_path / "tda.csv") as f:
+        rows = list(csv.DictReader(f))
+    assert [r["id"] for r in rows] == tree.ids
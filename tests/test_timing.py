@@ -0,0 +1,71 @@
+# Copyright (c) 2025, Ampere Computing LLC.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+import json
+import os
+import pstats
+import pytest
+from collector import timing
+
+
+# profiling is module state, put it back after each test
+@pytest.fixture(autouse=True)
+def restore(monkeypatch):
+    for name in ("_command", "_output", "_dumps", "_started", "_dumping"):
+        monkeypatch.setattr(timing, name, getattr(timing, name))
+    yield
+    timing._stages.clear()
+    timing._path.clear()
+
+
+def test_disabled(tmp_path):
+    items = [1, 2]
+    assert not timing.enabled()
+    with timing.stage("collect"):
+        pass
+    assert timing.iterate("chunks", items) is items
+    timing.write()
+    assert not timing._stages and not os.listdir(tmp_path)
+
+
+def test_timings(tmp_path):
+    timing.start("app", tmp_path)
+    assert timing.enabled()
+    with timing.stage("postprocess"):
+        assert list(timing.iterate("chunks", range(3))) == [0, 1, 2]
+        for _ in range(2):
+            with timing.stage("plot"):
+                pass
+    timing.write()
+    timing.start("postprocess", tmp_path)
+    with timing.stage("join"):
+        pass
+    timing.write()
+
+    with open(tmp_path / timing.timings_file) as f:
+        timings = json.load(f)
+    # each command of the run keeps its stages
+    assert list(timings) == ["app", "postprocess"]
+    stages = {s["stage"]: s for s in timings["app"]["stages"]}
+    assert list(stages) == ["postprocess", "postprocess/chunks", "postprocess/plot"]
+    # producing each item is a call, and so is finding there are no more
+    assert stages["postprocess/chunks"]["calls"] == 4
+    assert stages["postprocess/plot"]["calls"] == 2
+    assert stages["postprocess"]["wall"] >= stages["postprocess/plot"]["wall"]
+    assert timings["app"]["wall"] >= stages["postprocess"]["wall"]
+    assert [s["stage"] for s in timings["postprocess"]["stages"]] == ["join"]
+
+
+def test_dumps(tmp_path):
+    timing.start("app", tmp_path, ["cprofile"])
+    with timing.stage("postprocess", heavy=True):
+        # a heavy stage inside another is covered by its snapshot
+        with timing.stage("plot", heavy=True):
+            sum(range(1000))
+    with timing.stage("checks"):
+        pass
+    assert sorted(os.listdir(tmp_path / "profile")) == ["app.postprocess.prof"]
+    stats = pstats.Stats(str(tmp_path / "profile" / "app.postprocess.prof"))
+    assert stats.total_calls > 0
+    assert not timing._dumping